@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+
+Binary columnar log of QBPM data. A log is a directory with one file of raw
+float64 values per column and a small JSON description:
+
+    qbpm_log/
+    |___qbpm_log.json     channel names
+    |___time.f8           unix timestamps, ascending
+    |___posx_log.f8
+    |___...
+
+Appending a sample appends 8 bytes to each column file. Readers map the
+column files into memory, so opening a log does not read it. Time ranges are
+found by binary search in the time column, only the pages of the selected
+range are read from disk.
+"""
+
+import itertools
+import json
+import os
+import time
+
+import numpy
+
+from timestamps import to_timestamp
+
+
+META_FILE = 'qbpm_log.json'
+COLUMN_EXTENSION = '.f8'
+DTYPE = numpy.dtype('<f8')
+# column names of the text log -> channel names of the QBPM monitor (Qbpm.record_names())
+CSV_CHANNELS = {'qbpm_avgcurr': 'avgcurr_log',
+                'qbpm_x': 'posx_log',
+                'qbpm_z': 'posz_log',
+                'pitch_position': 'pitch_log',
+                'petra_curr': 'petracurrent_log'}
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, column + COLUMN_EXTENSION)
+
+
+def _read_meta(directory):
+    """
+    Returns the channel names of a log.
+    :param directory: <str> log directory
+    :return: <list> channel names
+    """
+    with open(os.path.join(directory, META_FILE)) as f:
+        return json.load(f)['channels']
+
+
+def _column_length(directory, column):
+    """
+    Number of complete values in a column file.
+    """
+    path = _column_path(directory, column)
+    return os.path.getsize(path) // DTYPE.itemsize if os.path.exists(path) else 0
+
+
+class QbpmLogWriter:
+    """
+    Appends samples to a QBPM log. Samples are buffered and written to the column files every flush_interval
+    seconds, so each tick costs a list append. An existing log with the same channels is continued.
+
+    After a crash the column files may differ in length by the last flush. They are cut to the shortest column
+    when the log is opened again.
+    """
+    def __init__(self, directory, channels, flush_interval=1.):
+        """
+        Opens or creates a log.
+        :param directory: <str> log directory, created if missing
+        :param channels: <list> channel names
+        :param flush_interval: <float> time in s between writes to disk
+        """
+        self.directory = directory
+        self.channels = list(channels)
+        self.flush_interval = flush_interval
+        self.columns = ['time'] + self.channels
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            if _read_meta(directory) != self.channels:
+                raise Exception('Error: Log {} has the channels {}'.format(directory, _read_meta(directory)))
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'version': 1, 'channels': self.channels}, f)
+        # repair columns of an interrupted flush
+        length = min(_column_length(directory, column) for column in self.columns)
+        for column in self.columns:
+            with open(_column_path(directory, column), 'ab') as f:
+                f.truncate(length * DTYPE.itemsize)
+        self._files = {column: open(_column_path(directory, column), 'ab') for column in self.columns}
+        self._buffer = []
+        self._last_flush = time.time()
+        self.length = length
+        self._last_time = -numpy.inf
+        if length:
+            with open(_column_path(directory, 'time'), 'rb') as f:
+                f.seek((length - 1) * DTYPE.itemsize)
+                self._last_time = numpy.frombuffer(f.read(DTYPE.itemsize), DTYPE)[0]
+
+    def append(self, timestamp, values):
+        """
+        Adds one sample. Timestamps must not decrease, readers find time ranges by binary search.
+        :param timestamp: <float> unix time of the sample
+        :param values: <dict or sequence> value of each channel, missing channels are logged as nan
+        :return: None
+        """
+        if not timestamp >= self._last_time:
+            raise Exception('Error: Sample at {} is older than the last sample of {}'.format(timestamp,
+                                                                                          self.directory))
+        self._last_time = timestamp
+        if isinstance(values, dict):
+            values = [values.get(channel, numpy.nan) for channel in self.channels]
+        self._buffer.append([timestamp] + list(values))
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered samples to the column files.
+        :return: None
+        """
+        self._last_flush = time.time()
+        if self._buffer:
+            self._write(numpy.array(self._buffer, dtype=DTYPE))
+            self._buffer = []
+
+    def extend(self, samples):
+        """
+        Writes many samples at once, e.g. when converting old logs. Timestamps must not decrease.
+        :param samples: <numpy.array> one row per sample: time and the value of each channel
+        :return: None
+        """
+        samples = numpy.asarray(samples, dtype=DTYPE).reshape(-1, len(self.columns))
+        if len(samples) == 0:
+            return
+        times = numpy.concatenate([[self._last_time], samples[:, 0]])
+        if not numpy.all(times[1:] >= times[:-1]):
+            raise Exception('Error: Samples are not in time order, not written to {}'.format(self.directory))
+        self.flush()
+        self._write(samples)
+        self._last_time = samples[-1, 0]
+
+    def _write(self, samples):
+        samples = samples.reshape(-1, len(self.columns))
+        for n, column in enumerate(self.columns):
+            self._files[column].write(numpy.ascontiguousarray(samples[:, n]).tobytes())
+            self._files[column].flush()
+        self.length += len(samples)
+
+    def close(self):
+        """
+        Flushes and closes the column files.
+        :return: None
+        """
+        if self._files:
+            self.flush()
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class QbpmLog:
+    """
+    Memory-mapped reader of a QBPM log. Columns are numpy arrays backed by the column files. refresh() maps
+    samples which were appended since the log was opened.
+
+    Example:
+        log = QbpmLog('qbpm_log')
+        data = log.between('2026-10-19 08:00', '2026-10-19 20:00')
+        binned = log.resample(60., start='2026-10-12', how='mean')
+    """
+    def __init__(self, directory):
+        """
+        :param directory: <str> log directory
+        """
+        self.directory = directory
+        self.channels = _read_meta(directory)
+        self.columns = ['time'] + self.channels
+        self._maps = {}
+        self.refresh()
+
+    @staticmethod
+    def read_channels(directory):
+        """
+        Reads the channel names of a log without mapping its columns.
+        :param directory: <str> log directory
+        :return: <list> channel names, None if directory holds no log
+        """
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            return None
+        return _read_meta(directory)
+
+    def refresh(self):
+        """
+        Maps the current length of the column files.
+        :return: <int> number of samples
+        """
+        length = min(_column_length(self.directory, column) for column in self.columns)
+        if length == 0:
+            self._maps = {column: numpy.zeros(0, dtype=DTYPE) for column in self.columns}
+        else:
+            self._maps = {column: numpy.memmap(_column_path(self.directory, column), dtype=DTYPE, mode='r',
+                                               shape=(length,)) for column in self.columns}
+        return length
+
+    def __len__(self):
+        return len(self._maps['time'])
+
+    def __getitem__(self, column):
+        return self._maps[column]
+
+    @property
+    def time(self):
+        return self._maps['time']
+
+    def index(self, timestamp, side='left'):
+        """
+        Position of a point in time in the log, by binary search of the time column.
+        :param timestamp: <float, str or datetime> unix time or 'YYYY-mm-dd[ HH:MM[:SS]]'
+        :param side: <str> 'left' or 'right', see numpy.searchsorted
+        :return: <int> sample index
+        """
+        return int(numpy.searchsorted(self._maps['time'], to_timestamp(timestamp), side))
+
+    def between(self, start=None, stop=None, channels=None):
+        """
+        Returns the samples of a time range as views of the mapped columns. Nothing is copied.
+        :param start: <float, str or datetime> first time, default: start of the log
+        :param stop: <float, str or datetime> end time (excluded), default: end of the log
+        :param channels: <list> channels to return, default: all
+        :return: <dict> column name -> numpy array, including 'time'
+        """
+        first = 0 if start is None else self.index(start)
+        last = len(self) if stop is None else self.index(stop)
+        return {column: self._maps[column][first:last] for column in ['time'] + (channels or self.channels)}
+
+    def last(self, duration, channels=None):
+        """
+        Returns the samples of the last duration seconds of the log.
+        :param duration: <float> time span in s
+        :param channels: <list> channels to return, default: all
+        :return: <dict> column name -> numpy array, including 'time'
+        """
+        if len(self) == 0:
+            return self.between(channels=channels)
+        return self.between(self.time[-1] - duration, channels=channels)
+
+    def resample(self, interval, start=None, stop=None, channels=None, how='mean', block_size=1000000):
+        """
+        Aggregates the samples into time bins. nan values are ignored, empty bins are left out. The range is
+        processed in blocks of about block_size samples, which end at a bin boundary, so memory use does not
+        depend on the length of the range.
+        :param interval: <float> bin width in s
+        :param start: <float, str or datetime> first time, default: start of the log
+        :param stop: <float, str or datetime> end time (excluded), default: end of the log
+        :param channels: <list> channels to aggregate, default: all
+        :param how: <str> 'mean', 'min', 'max', 'std' or 'count'
+        :param block_size: <int> number of samples processed at once
+        :return: <dict> 'time' -> start time of each bin, channel -> aggregated values
+        """
+        if how not in ['mean', 'min', 'max', 'std', 'count']:
+            raise Exception('Error: Unknown aggregation: {}'.format(how))
+        channels = channels or self.channels
+        data = self.between(start, stop, channels)
+        times = data['time']
+        results = {column: [] for column in ['time'] + channels}
+        if len(times) == 0:
+            return {column: numpy.zeros(0) for column in results}
+        origin = numpy.floor(times[0] / interval) * interval
+        first = 0
+        while first < len(times):
+            last = min(first + block_size, len(times))
+            if last < len(times):
+                # extend the block to the end of its last bin
+                bin_end = origin + (numpy.floor((times[last - 1] - origin) / interval) + 1) * interval
+                last = int(numpy.searchsorted(times, bin_end, 'left'))
+            bins = numpy.floor((times[first:last] - origin) / interval)
+            starts = numpy.flatnonzero(numpy.diff(bins, prepend=numpy.nan) != 0)
+            results['time'].append(origin + bins[starts] * interval)
+            for channel in channels:
+                results[channel].append(_aggregate(numpy.asarray(data[channel][first:last]), starts, how))
+            first = last
+        return {column: numpy.concatenate(values) for column, values in results.items()}
+
+    def to_csv(self, filepath, start=None, stop=None, channels=None, block_size=100000):
+        """
+        Writes a time range to a space separated text file like the former log of the QBPM monitor.
+        :param filepath: <str> output file
+        :param start: <float, str or datetime> first time, default: start of the log
+        :param stop: <float, str or datetime> end time (excluded), default: end of the log
+        :param channels: <list> channels to write, default: all
+        :param block_size: <int> number of samples written at once
+        :return: <int> number of samples
+        """
+        data = self.between(start, stop, channels)
+        columns = list(data)
+        with open(filepath, 'w') as f:
+            f.write(' '.join(['timestamp'] + columns[1:]) + '\n')
+            for first in range(0, len(data['time']), block_size):
+                block = numpy.column_stack([data[column][first:first + block_size] for column in columns])
+                numpy.savetxt(f, block, fmt='%s', delimiter=' ')
+        return len(data['time'])
+
+
+def _aggregate(values, starts, how):
+    """
+    Aggregates consecutive groups of values beginning at starts, ignoring nan.
+    """
+    valid = ~numpy.isnan(values)
+    counts = numpy.add.reduceat(valid, starts)
+    if how == 'count':
+        return counts.astype(DTYPE)
+    if how == 'min':
+        return numpy.fmin.reduceat(values, starts)
+    if how == 'max':
+        return numpy.fmax.reduceat(values, starts)
+    zeroed = numpy.where(valid, values, 0.)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        mean = numpy.add.reduceat(zeroed, starts) / counts
+        if how == 'mean':
+            return mean
+        squares = numpy.add.reduceat(zeroed ** 2, starts) / counts
+        return numpy.sqrt(numpy.maximum(squares - mean ** 2, 0.))
+
+
+def convert_csv(csv_path, directory, block_size=100000, channels=None):
+    """
+    Converts a space separated text log of the QBPM monitor (header line 'timestamp name ...') into a binary log.
+    Columns are named as the channels of the monitor, see CSV_CHANNELS. The text file is read in blocks, memory use
+    does not depend on its size.
+    :param csv_path: <str> text log
+    :param directory: <str> log directory, continued if it exists with the same channels
+    :param block_size: <int> number of lines converted at once
+    :param channels: <list> (optional) channels of the binary log, e.g. Qbpm.record_names() to continue the log with
+        the monitor. Channels missing in the text log are nan, columns which are not channels are left out.
+        default: the columns of the text log
+    :return: <int> number of samples
+    """
+    with open(csv_path) as f:
+        header = [CSV_CHANNELS.get(name, name) for name in f.readline().split()[1:]]
+        channels = list(channels or header)
+        # sample column of each text column, time first
+        targets = [0] + [channels.index(name) + 1 if name in channels else -1 for name in header]
+        with QbpmLogWriter(directory, channels) as writer:
+            while True:
+                lines = list(itertools.islice(f, block_size))
+                if not lines:
+                    break
+                block = numpy.loadtxt(lines, ndmin=2)
+                # older monitor versions left out the last column
+                samples = numpy.full((len(block), len(channels) + 1), numpy.nan)
+                for column, target in enumerate(targets[:block.shape[1]]):
+                    if target >= 0:
+                        samples[:, target] = block[:, column]
+                writer.extend(samples)
+            return writer.length
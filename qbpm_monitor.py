@@ -10,11 +10,14 @@ import sys
 from PyQt5 import QtGui, QtCore, QtWidgets
 
 import pyqtgraph as pg
-import tango
 import numpy
 import time
 import datetime
 import os
+import shutil
+
+from tango_proxy_pool import proxy_pool
+from qbpm_log import QbpmLog, QbpmLogWriter
 
 
 class QbpmMonitor(QtGui.QWidget):
@@ -31,11 +34,31 @@ class QbpmMonitor(QtGui.QWidget):
         """
         super(QbpmMonitor, self).__init__()
 
+        self.device_names = {
+            'dcm_bragg': 'hzgpp05vme0:10000/dcm_bragg',
+            'dcm_pitch': 'hzgpp05vme0:10000/dcm_xtal2_pitch',
+            'dcm_energy': 'hzgpp05vme0:10000/dcm_energy',
+            'dmm_x1rot': 'hzgpp05vme0:10000/dmm_x1rot',
+            'dmm_x2rot': 'hzgpp05vme0:10000/dmm_x2rot',
+            'dmm_x1z': 'hzgpp05vme0:10000/dmm_x1z',
+            'dmm_x2z': 'hzgpp05vme0:10000/dmm_x2z',
+            'dmm_x2y': 'hzgpp05vme0:10000/dmm_x2y',
+            'beamstop': 'hzgpp05vme0:10000/HASYLAB/Petra3_P05vil.CDI.SRV/BST',
+            'undulator': 'hzgpp05vme0:10000/p05/undulator/1'
+            }
+        # DCM positions are acquired together with the QBPM values while the DCM is in use
+        mono_channels = {'pitch': (self.device_names['dcm_pitch'], 'Position'),
+                         'energy': (self.device_names['dcm_energy'], 'Position')}
         self.sources = {
-            "QBPM1 OH" : Qbpm('hzgpp05vme0:10000/p05/i404/exp.01', 2),
-            "QBPM2 OH" : Qbpm('hzgpp05vme0:10000/p05/i404/exp.02', 7),
-            "QBPM EH2" : Qbpm('hzgpp05vme2:10000/p05/i404/eh2.01', 30)
+            "QBPM1 OH" : Qbpm('hzgpp05vme0:10000/p05/i404/exp.01', 2, mono_channels),
+            "QBPM2 OH" : Qbpm('hzgpp05vme0:10000/p05/i404/exp.02', 7, mono_channels),
+            "QBPM EH2" : Qbpm('hzgpp05vme2:10000/p05/i404/eh2.01', 30, mono_channels)
             }
+        # the backlog of each source is checkpointed, a restarted monitor continues with it
+        self.checkpoint_directory = 'qbpm_checkpoint'
+        for qbpm in self.sources.values():
+            qbpm.start_checkpoint(os.path.join(self.checkpoint_directory,
+                                               qbpm.address.replace(':', '_').replace('/', '_')))
         default_source = "QBPM2 OH"
         self.set_source(default_source)
         self.title = self.qbpm.address
@@ -53,20 +76,22 @@ class QbpmMonitor(QtGui.QWidget):
         self._timerId_feedback = None
         self.last_corr_angle = 0
         self.feedback_time = datetime.datetime.now()
-        self.dcm_bragg_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dcm_bragg')
-        self.dcm_bragg_angle = self.dcm_bragg_tserver.Position
-        self.dcm_pitch_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dcm_xtal2_pitch')
-        self.dcm_energy_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dcm_energy')
-        self.dmm_x1rot_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dmm_x1rot')
-        self.dmm_bragg_angle = self.dcm_bragg_tserver.Position
-        self.dmm_x2rot_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dmm_x2rot')
-        self.dmm_x1z_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dmm_x1z')
-        self.dmm_x1z_position = self.dmm_x1z_tserver.Position
-        self.dmm_x2z_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dmm_x2z')
-        self.dmm_x2y_tserver = tango.DeviceProxy('hzgpp05vme0:10000/dmm_x2y')   
-        self.beamstop = tango.DeviceProxy('hzgpp05vme0:10000/HASYLAB/Petra3_P05vil.CDI.SRV/BST')
-        self.undulator = tango.DeviceProxy('hzgpp05vme0:10000/p05/undulator/1')
-        self.get_mono()
+        # device proxies are created concurrently in the background and resolved on first use
+        proxy_pool.prefetch(*self.device_names.values())
+        self.dcm_bragg_tserver = proxy_pool.lazy(self.device_names['dcm_bragg'])
+        self.dcm_pitch_tserver = proxy_pool.lazy(self.device_names['dcm_pitch'])
+        self.dcm_energy_tserver = proxy_pool.lazy(self.device_names['dcm_energy'])
+        self.dmm_x1rot_tserver = proxy_pool.lazy(self.device_names['dmm_x1rot'])
+        self.dmm_x2rot_tserver = proxy_pool.lazy(self.device_names['dmm_x2rot'])
+        self.dmm_x1z_tserver = proxy_pool.lazy(self.device_names['dmm_x1z'])
+        self.dmm_x2z_tserver = proxy_pool.lazy(self.device_names['dmm_x2z'])
+        self.dmm_x2y_tserver = proxy_pool.lazy(self.device_names['dmm_x2y'])
+        self.beamstop = proxy_pool.lazy(self.device_names['beamstop'])
+        self.undulator = proxy_pool.lazy(self.device_names['undulator'])
+        # read by _init_devices() after the window is shown
+        self.dcm_bragg_angle = None
+        self.dmm_bragg_angle = None
+        self.dmm_x1z_position = None
 
         self.heartbeat = time.time()
         self.feedback_file = '/tmp/qbpmfeedback.run'
@@ -75,7 +100,12 @@ class QbpmMonitor(QtGui.QWidget):
         self.cycle = 0
         self.feedback_triggered = False
         self.simulate_feedback = simulate_feedback
-        self.dcm_step_backlash = self.dcm_pitch_tserver.read_attribute('StepBacklash').value
+        self.dcm_step_backlash = None
+        # binary log of the acquisition records, read with qbpm_log.QbpmLog
+        self.log_directory = 'qbpm_log'
+        self.log_writer = None
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self._close_log)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self._close_checkpoints)
 
         ################################################################################################################
         # initUI
@@ -90,7 +120,6 @@ class QbpmMonitor(QtGui.QWidget):
         self.filter_label = QtGui.QLabel("lowpass filter")
         self.log_label = QtGui.QLabel("log to file")
         self.pitch_label = QtGui.QLabel("0")
-        self.set_x2pitchlabel()
         # QBOM source Combobox
         self.scbox = QtGui.QComboBox(self)
         self.scbox.addItem("QBPM1 OH")  # Index 0
@@ -243,17 +272,29 @@ class QbpmMonitor(QtGui.QWidget):
         # Display the widget as a new window
         self.setWindowTitle(self.title)
         self.show()
+        # query devices once the event loop is running, so the window shows up immediately
+        QtCore.QTimer.singleShot(0, self._init_devices)
+
+    def _init_devices(self):
+        """
+        Reads initial device values. Called once after the window is shown.
+        :return: None
+        """
+        self.qbpm.restore_logs()
+        self._plot_update()
+        self.dcm_bragg_angle, stale = proxy_pool.read(self.device_names['dcm_bragg'], 'Position')
+        self.dmm_bragg_angle = self.dcm_bragg_angle
+        self.dmm_x1z_position, stale = proxy_pool.read(self.device_names['dmm_x1z'], 'Position')
+        self.dcm_step_backlash, stale = proxy_pool.read(self.device_names['dcm_pitch'], 'StepBacklash')
+        self.set_x2pitchlabel()
 
     def _plot_update(self):
         """
         Updates plot window with current values from Qbpm() class instance.
         :return: None
         """
-        omit_log = ['sens_log']
-        for log_group, log_arrays in self.qbpm.log_names.items():
-            for log_array in log_arrays:
-                if log_array not in omit_log:
-                    self.curves[log_array].setData(self.qbpm.log_time, self.qbpm.log_arrays[log_array],clear=True)
+        for log_array, curve in self.curves.items():
+            curve.setData(self.qbpm.log_time, self.qbpm.log_arrays[log_array], clear=True)
         # self.fill.setCurves(self.curves['posz_sens_low_log'], self.curves['posz_sens_high_log'])
 
 
@@ -275,26 +316,44 @@ class QbpmMonitor(QtGui.QWidget):
         :return: None
         """
         while True:
+            self.qbpm.extra_channels_enabled = self.get_mono() == "dcm"
             self.qbpm.read_qbpm()
             self._plot_update()
-            pitch_position = self.dcm_pitch_tserver.Position
             self.set_x2pitchlabel()
             if self.lbutton.isChecked():
-                fname = 'qbpm_log.csv'
-                if not os.path.isfile(fname):
-                    with open(fname, 'a') as f:
-                        f.write('timestamp qbpm_avgcurr qbpm_x qbpm_z pitch_position petra_curr\n')
-                with open(fname, 'a') as f:
-                    t = self.qbpm.log_time[-1]
-                    a = self.qbpm.log_arrays['avgcurr_log'][-1]
-                    x = self.qbpm.log_arrays['posx_log'][-1]
-                    z = self.qbpm.log_arrays['posz_log'][-1]
-                    pp = pitch_position
-                    p = self.qbpm.log_arrays['petracurrent_log'][-1]
-                    l = '{} {} {} {} {}\n'.format(t, a, x ,z , pp, p)
-                    f.write(l)
+                try:
+                    if self.log_writer is None:
+                        self.log_writer = QbpmLogWriter(self.log_directory, self.qbpm.record_names())
+                    self.log_writer.append(self.qbpm.log_time[-1], self.qbpm.record())
+                except Exception as e:
+                    # e.g. full disk or clock set back, keep polling
+                    print('Error: Logging stopped: {}'.format(e))
+                    self.lbutton.setChecked(False)
+                    try:
+                        self._close_log()
+                    except Exception:
+                        self.log_writer = None
+            elif self.log_writer is not None:
+                self._close_log()
             yield
 
+    def _close_log(self):
+        """
+        Writes pending log samples to disk and closes the log.
+        :return: None
+        """
+        if self.log_writer is not None:
+            self.log_writer.close()
+            self.log_writer = None
+
+    def _close_checkpoints(self):
+        """
+        Writes the pending checkpoint samples of all sources to disk.
+        :return: None
+        """
+        for qbpm in self.sources.values():
+            qbpm.close_checkpoint()
+
     def _start_loop_poll(self):
         """
         Initializes Qt timer method for polling routine and switches Play button icon.
@@ -323,6 +382,8 @@ class QbpmMonitor(QtGui.QWidget):
         :return: None
         """
         self.feedback = not self.feedback
+        if self.dcm_step_backlash is None:
+            self.dcm_step_backlash = self.dcm_pitch_tserver.read_attribute('StepBacklash').value
         if self.feedback:
             self.dcm_pitch_tserver.write_attribute('StepBacklash',0)
             self._start_loop_feedback()
@@ -352,7 +413,10 @@ class QbpmMonitor(QtGui.QWidget):
             if mono == "dmm":
                 corr_factor = 0.2
             bandwidth = 0.003 * float(self.qbpm.sensitivity/100)
-            if not ((target - bandwidth) < current_pos < (target + bandwidth)):
+            # no correction while the monochromator state is unknown or the pitch device is unreachable
+            pitch_device = 'dmm_x2rot' if mono == "dmm" else 'dcm_pitch'
+            available = mono is not None and proxy_pool.is_available(self.device_names[pitch_device])
+            if available and not ((target - bandwidth) < current_pos < (target + bandwidth)):
                 corr_angle = -((current_pos - target) * corr_factor)/self.qbpm.distance
                 if self.cycle == interval:
                     print('Moving pitch: {}'.format(corr_angle))
@@ -508,19 +572,64 @@ class QbpmMonitor(QtGui.QWidget):
         """
         Changes the pitch label according to the used monochromator
         """
-        labelstr_dcm = "DCM\nenergy:\t\t{:.9f}\nexit offset:\t{:.9f}\npitch:\t\t{:.9f}\nfb stepsize:\t{:.9f}\n\nbeamstop:\t\t{:.1f}°\n\nundulator:\t{}\ngap:\t\t{:.9f}\n\n{}"
-        labelstr_dmm = "DMM\nbragg:\t\t{:.9f}\npitch:\t\t{:.9f}\nx1z:\t\t{:.9f}\nx2z:\t\t{:.9f}\nx2y:\t\t{:.9f}\nfb stepsize:\t{:.9f}\n\nbeamstop:\t\t{:.1f}°\n\nundulator:\t{}\ngap:\t\t{:.9f}\n\n{}"
+        labelstr_dcm = "DCM\nenergy:\t\t{}\nexit offset:\t{}\npitch:\t\t{}\nfb stepsize:\t{:.9f}\n\nbeamstop:\t\t{}°\n\nundulator:\t{}\ngap:\t\t{}\n\n{}"
+        labelstr_dmm = "DMM\nbragg:\t\t{}\npitch:\t\t{}\nx1z:\t\t{}\nx2z:\t\t{}\nx2y:\t\t{}\nfb stepsize:\t{:.9f}\n\nbeamstop:\t\t{}°\n\nundulator:\t{}\ngap:\t\t{}\n\n{}"
         mono = self.get_mono()
+        beamstop = self._label_value('beamstop', 'TEMP_OUT', '{:.1f}', index=0)
+        undulator_state = self._label_value('undulator', 'State', '{}')
+        undulator_gap = self._label_value('undulator', 'Gap')
         if mono == "dcm":
-            self.pitch_label.setText(labelstr_dcm.format(self.dcm_energy_tserver.Position, self.dcm_energy_tserver.ExitOffset, self.dcm_pitch_tserver.Position, self.last_corr_angle, self.beamstop.TEMP_OUT[0], self.undulator.State(), self.undulator.Gap, self.feedback_time))
+            self.pitch_label.setText(labelstr_dcm.format(self._record_value('energy_log'),
+                                                         self._label_value('dcm_energy', 'ExitOffset'),
+                                                         self._record_value('pitch_log'),
+                                                         self.last_corr_angle, beamstop, undulator_state,
+                                                         undulator_gap, self.feedback_time))
         if mono == "dmm":
-            self.pitch_label.setText(labelstr_dmm.format(self.dmm_x1rot_tserver.Position, self.dmm_x2rot_tserver.Position, self.dmm_x1z_tserver.Position, self.dmm_x2z_tserver.Position, self.dmm_x2y_tserver.Position, self.last_corr_angle, self.beamstop.TEMP_OUT[0], self.undulator.State(), self.undulator.Gap, self.feedback_time))
+            self.pitch_label.setText(labelstr_dmm.format(self._label_value('dmm_x1rot', 'Position'),
+                                                         self._label_value('dmm_x2rot', 'Position'),
+                                                         self._label_value('dmm_x1z', 'Position'),
+                                                         self._label_value('dmm_x2z', 'Position'),
+                                                         self._label_value('dmm_x2y', 'Position'),
+                                                         self.last_corr_angle, beamstop, undulator_state,
+                                                         undulator_gap, self.feedback_time))
+
+    def _label_value(self, device, attribute, fmt='{:.9f}', index=None):
+        """
+        Reads a device attribute through the proxy pool and formats it for the pitch label. Devices which failed are
+        not contacted; their last known value is shown and marked as stale.
+        :param device: <str> key of self.device_names
+        :param attribute: <str> attribute name
+        :param fmt: <str> format string for the value
+        :param index: <int> (optional) element to show for spectrum attributes
+        :return: <str> formatted value
+        """
+        value, stale = proxy_pool.read(self.device_names[device], attribute)
+        if value is None:
+            return 'n/a'
+        if index is not None:
+            value = value[index]
+        text = fmt.format(value)
+        return text + ' (stale)' if stale else text
+
+    def _record_value(self, log_array, fmt='{:.9f}'):
+        """
+        Formats the last acquired value of a log array for the pitch label, the device is not read again.
+        :param log_array: <str> log array name, see Qbpm.record_names()
+        :param fmt: <str> format string for the value
+        :return: <str> formatted value, 'n/a' if it was not acquired
+        """
+        value = self.qbpm.log_arrays[log_array][-1]
+        return 'n/a' if numpy.isnan(value) else fmt.format(value)
 
     def get_mono(self):
         """
-        Checks which monochromator is active by reading the DMM x1 z position. DMM_X1Z below -5 means DCM is active. 
+        Checks which monochromator is active by reading the DMM x1 z position. DMM_X1Z below -5 means DCM is active.
+        Returns None if the position has never been read successfully.
         """
-        if self.dmm_x1z_tserver.Position < -5:
+        x1z_position, stale = proxy_pool.read(self.device_names['dmm_x1z'], 'Position')
+        if x1z_position is None:
+            return None
+        if x1z_position < -5:
             return "dcm"
         else:
             return "dmm"
@@ -538,29 +647,46 @@ class Qbpm:
         - current time (to plot above values against)
 
     Each update rolls all arrays by one and adds the current value at the end of the array.
+
+    Each update acquires one record of all channels: the QBPM values, the PETRA III ring current and optional extra
+    channels like the monochromator pitch. Extra channels are read only while extra_channels_enabled is set, e.g.
+    while their monochromator is in use, and logged as nan otherwise. Next to the values the source timestamp of each device is logged
+    (log group 'log_stamps'), i.e. the time the device server read the value. log_time holds the time of the update.
     """
-    def __init__(self, address, distance):
+    def __init__(self, address, distance, extra_channels=None):
         """
         Initialize class variables and set all array to sensible initial values.
         :param address: <str> Tango server address of the QBPM.
         :param distance: <float> Distance of the monochromator to the QBPM in metre.
+        :param extra_channels: <dict> further channels of each record, name -> (device name, attribute), logged as
+            <name>_log and <name>_stamp_log
         """
 
         self.address = address  # Tango server address
-        self.tserver = tango.DeviceProxy(address)
+        self.petra_address = 'hzgpp05vme1:10000/PETRA/GLOBALS/keyword'
+        self.extra_channels = dict(extra_channels or {})
+        self.extra_channels_enabled = True  # extra channels are logged as nan while disabled
+        proxy_pool.prefetch(address, self.petra_address,
+                            *[device_name for device_name, attribute in self.extra_channels.values()])
+        self.tserver = proxy_pool.lazy(address)
         self.log_arrays = {}
         self.distance = distance  # distance of the monochromator to the QBPM
-        self.petra = tango.DeviceProxy('hzgpp05vme1:10000/PETRA/GLOBALS/keyword')
+        self.petra = proxy_pool.lazy(self.petra_address)  # shared by all Qbpm instances
         self.frequency = 5  # update freuqncy in Hz
         self.backlog = 120  # backlog length in s
         self.log_length = self.calc_log_length(self.backlog, self.frequency)
         self.log_names = {'log_vals': ['posx_log', 'posz_log', 'avgcurr_log', 'petracurrent_log'],
                           'log_filter': ['posx_filter_log', 'posz_filter_log', 'avgcurr_filter_log'],
                           'log_target': ['posx_target_log', 'posz_target_log', 'avgcurr_target_log'],
-                          'log_sens': ['sens_log', 'posz_sens_low_log', 'posz_sens_high_log']
+                          'log_sens': ['sens_log', 'posz_sens_low_log', 'posz_sens_high_log'],
+                          'log_extra': [name + '_log' for name in self.extra_channels],
+                          'log_stamps': ['qbpm_stamp_log', 'petracurrent_stamp_log'] +
+                                        [name + '_stamp_log' for name in self.extra_channels]
                           }
         self.log_time = numpy.zeros(self.log_length)
-        self.reset_logs()  # initialize log_arrays with appropriate log_length
+        # initialize log_arrays with appropriate log_length. Servers are queried on first use.
+        self._fill_logs({name: numpy.nan for name in self.record_names()})
+        self.logs_initialized = False
         self.box_length = 40  # rolling average over box_length values
         self.posx_target = 0  # target horizontal position during feedback
         self.posz_target = 0  # target vertical position during feedback
@@ -568,6 +694,10 @@ class Qbpm:
         self.feedback_on = False  # sets target logging behaviour
         self.sensitivity = 10
         self.filter = 500
+        self.checkpoint_directory = None  # see start_checkpoint()
+        self.checkpoint_interval = 10.  # time in s between checkpoint writes
+        self.checkpoint_rotation = 10  # checkpoint is cut to the backlog after this many backlog lengths
+        self.checkpoint_writer = None
 
     def read_qbpm(self):
         """
@@ -575,23 +705,17 @@ class Qbpm:
         target positions and moving average.
         :return: None
         """
+        if not self.logs_initialized:
+            self.restore_logs()
         # roll all log arrays
         for key, names in self.log_names.items():
             for name in names:
                 self.log_arrays[name][:] = numpy.roll(self.log_arrays[name], -1)
         self.log_time[:] = numpy.roll(self.log_time, -1)
-        # query qbpm and petra current, append to log array
-        try:
-            bc = self.petra.BeamCurrent
-        except tango.DevFailed:
-            bc = numpy.nan
-        try:
-            pac = self.tserver.read_attribute('PosAndAvgCurr').value
-        except tango.DevFailed:
-            pac = numpy.array([numpy.nan, numpy.nan, numpy.nan])
-        server_query = numpy.append(pac, bc)
-        for n, key in enumerate(self.log_names['log_vals']):
-            self.log_arrays[key][-1] = server_query[n]
+        # acquire all channels, append to log array
+        record = self._acquire()
+        for key in self.record_names():
+            self.log_arrays[key][-1] = record[key]
         # calculate moving average and append to log array
         for n, key in enumerate(self.log_names['log_filter']):
             a = 1*10**-(3*float(self.filter)/1000)
@@ -625,6 +749,7 @@ class Qbpm:
             self.avgcurr_target = self.log_arrays['avgcurr_filter_log'][-1]
         # append unix timestamp to log_time
         self.log_time[-1] = self.timestamp()
+        self._checkpoint_sample()
         # append sens_log value
 
     def change_log_length(self, log_length):
@@ -694,23 +819,206 @@ class Qbpm:
         :return:  None
         """
         # reset log arrays
+        self._fill_logs(self._acquire())
+        self.logs_initialized = True
+
+    def restore_logs(self):
+        """
+        Sets all log arrays to the last backlog of the checkpoint, so plots and filters continue after a restart.
+        Without a checkpoint of the last backlog time the arrays are set to a current value, see reset_logs().
+        :return:  None
+        """
+        if not self._restore_checkpoint():
+            self.reset_logs()
+        self.logs_initialized = True
+
+    def start_checkpoint(self, directory):
+        """
+        Checkpoints all log arrays: each update appends the new values to a QBPM log (see qbpm_log.py) in directory,
+        which is written every checkpoint_interval seconds. The checkpoint is cut to the current backlog now and
+        then, so it does not grow. restore_logs() reads it back.
+        :param directory: <str> checkpoint directory, one per QBPM
+        :return: None
+        """
+        self.close_checkpoint()
+        self.checkpoint_directory = directory
+
+    def close_checkpoint(self):
+        """
+        Writes pending checkpoint samples to disk.
+        :return: None
+        """
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
+
+    def checkpoint_names(self):
+        """
+        Names of all log arrays, in the order of the checkpoint channels.
+        :return: <list> log array names
+        """
+        return [log_array for log_arrays in self.log_names.values() for log_array in log_arrays]
+
+    def _recover_checkpoint(self):
+        """
+        Completes a rotation of the checkpoint which was interrupted between renaming the directories.
+        :return: None
+        """
+        directory = self.checkpoint_directory
+        if not os.path.exists(directory):
+            for suffix in ['.new', '.old']:
+                if os.path.exists(directory + suffix):
+                    os.rename(directory + suffix, directory)
+                    break
+
+    def _restore_checkpoint(self):
+        """
+        Fills the log arrays with the samples of the last backlog time in the checkpoint. The column files are
+        memory mapped, only the last backlog is read from disk. Older array entries keep the first sample.
+        :return: <bool> True if samples were restored
+        """
+        if self.checkpoint_directory is None:
+            return False
         try:
-            bc = self.petra.BeamCurrent
-        except:
-            bc = numpy.nan
+            self._recover_checkpoint()
+            log = QbpmLog(self.checkpoint_directory)
+        except (OSError, ValueError):
+            return False
+        names = self.checkpoint_names()
+        if log.channels != names:
+            return False
+        data = log.between(self.timestamp() - self.backlog)
+        length = min(len(data['time']), self.log_length)
+        if length == 0:
+            return False
+        for name in names:
+            self.log_arrays[name] = numpy.full(self.log_length, data[name][-length])
+            self.log_arrays[name][-length:] = data[name][-length:]
+        self.log_time = numpy.zeros(self.log_length)
+        self.log_time[-length:] = data['time'][-length:]
+        missing = self.log_length - length
+        self.log_time[:missing] = numpy.linspace(self.log_time[missing] - missing / self.frequency,
+                                                 self.log_time[missing], missing, endpoint=False)
+        self.posx_target = self.log_arrays['posx_target_log'][-1]
+        self.posz_target = self.log_arrays['posz_target_log'][-1]
+        self.avgcurr_target = self.log_arrays['avgcurr_target_log'][-1]
+        return True
+
+    def _checkpoint_sample(self):
+        """
+        Appends the last entry of all log arrays to the checkpoint. If the checkpoint cannot be written (e.g. full
+        disk) checkpointing is stopped, the acquisition continues.
+        :return: None
+        """
+        if self.checkpoint_directory is None:
+            return
+        names = self.checkpoint_names()
+        try:
+            if self.checkpoint_writer is None:
+                self._recover_checkpoint()
+                self._discard_checkpoint(names)
+                self.checkpoint_writer = QbpmLogWriter(self.checkpoint_directory, names, self.checkpoint_interval)
+            self.checkpoint_writer.append(self.log_time[-1], [self.log_arrays[name][-1] for name in names])
+            if self.checkpoint_writer.length > self.checkpoint_rotation * self.log_length:
+                self._rotate_checkpoint()
+        except Exception as e:
+            print('Error: Checkpoint {} stopped: {}'.format(self.checkpoint_directory, e))
+            try:
+                self.close_checkpoint()
+            except Exception:
+                self.checkpoint_writer = None
+            self.checkpoint_directory = None
+
+    def _discard_checkpoint(self, names):
+        """
+        Moves a checkpoint of other log arrays (e.g. other extra channels) aside to <checkpoint directory>.discarded,
+        so a new one can be started. The previous discarded checkpoint is deleted.
+        :param names: <list> log array names of the checkpoint
+        :return: None
+        """
+        directory = self.checkpoint_directory
         try:
-            pac = self.tserver.read_attribute('PosAndAvgCurr').value
-        except:
-            pac = numpy.array([numpy.nan, numpy.nan, numpy.nan])
-        server_query = numpy.append(pac, bc)
+            channels = QbpmLog.read_channels(directory)
+        except (ValueError, KeyError):
+            pass  # unreadable description, e.g. interrupted first write
+        else:
+            if channels is None or channels == names:
+                return
+        shutil.rmtree(directory + '.discarded', ignore_errors=True)
+        os.rename(directory, directory + '.discarded')
+
+    def _rotate_checkpoint(self):
+        """
+        Replaces the checkpoint by one holding the current log arrays. The new checkpoint is written next to the
+        old one and swapped by renaming, a crash leaves one of them complete.
+        :return: None
+        """
+        directory = self.checkpoint_directory
+        names = self.checkpoint_names()
+        self.close_checkpoint()
+        for suffix in ['.new', '.old']:
+            shutil.rmtree(directory + suffix, ignore_errors=True)
+        with QbpmLogWriter(directory + '.new', names) as writer:
+            writer.extend(numpy.column_stack([self.log_time] + [self.log_arrays[name] for name in names]))
+        os.rename(directory, directory + '.old')
+        os.rename(directory + '.new', directory)
+        shutil.rmtree(directory + '.old', ignore_errors=True)
+        self.checkpoint_writer = QbpmLogWriter(directory, names, self.checkpoint_interval)
+
+    def record_names(self):
+        """
+        Names of the log arrays which are acquired from the devices: QBPM and PETRA III values, extra channels and
+        source timestamps.
+        :return: <list> log array names
+        """
+        return self.log_names['log_vals'] + self.log_names['log_extra'] + self.log_names['log_stamps']
+
+    def record(self):
+        """
+        Returns the last acquisition record.
+        :return: <dict> log array name -> value
+        """
+        return {name: self.log_arrays[name][-1] for name in self.record_names()}
+
+    def _acquire(self):
+        """
+        Reads QBPM position / average current, PETRA III ring current and the extra channels together with the
+        source timestamp of each device. Failed or stale reads are logged as nan. Failed devices are not contacted
+        again until they reconnected in the background.
+        :return: <dict> log array name -> value
+        """
+        record = {}
+        bc, stamp, stale = proxy_pool.read_with_time(self.petra_address, 'BeamCurrent')
+        record['petracurrent_log'], record['petracurrent_stamp_log'] = (numpy.nan, numpy.nan) if stale else (bc, stamp)
+        pac, stamp, stale = proxy_pool.read_with_time(self.address, 'PosAndAvgCurr')
+        if stale:
+            pac, stamp = numpy.array([numpy.nan, numpy.nan, numpy.nan]), numpy.nan
+        record.update(zip(['posx_log', 'posz_log', 'avgcurr_log'], pac))
+        record['qbpm_stamp_log'] = stamp
+        for name, (device_name, attribute) in self.extra_channels.items():
+            if not self.extra_channels_enabled:
+                record[name + '_log'], record[name + '_stamp_log'] = numpy.nan, numpy.nan
+                continue
+            value, stamp, stale = proxy_pool.read_with_time(device_name, attribute)
+            record[name + '_log'], record[name + '_stamp_log'] = (numpy.nan, numpy.nan) if stale else (value, stamp)
+        return record
+
+    def _fill_logs(self, record):
+        """
+        Sets all log arrays to the values of an acquisition record and resets the time array. Filter and target
+        arrays start at the QBPM values.
+        :param record: <dict> log array name -> value, see _acquire()
+        :return: None
+        """
         for log_group, log_arrays in self.log_names.items():
-            omit_group = ['log_sens']
-            if log_group not in omit_group:
-                for n, log_array in enumerate(log_arrays):
-                    self.log_arrays[log_array] = numpy.full(self.log_length, server_query[n])
-        # reset sensitivity log
-        for log_array in self.log_names['log_sens']:
-            self.log_arrays[log_array] = numpy.full(self.log_length, numpy.nan)
+            if log_group in ['log_filter', 'log_target']:
+                values = [record[log_array] for log_array in self.log_names['log_vals']]
+            elif log_group == 'log_sens':
+                values = [numpy.nan] * len(log_arrays)
+            else:
+                values = [record[log_array] for log_array in log_arrays]
+            for log_array, value in zip(log_arrays, values):
+                self.log_arrays[log_array] = numpy.full(self.log_length, value)
         # reset time array
         length = self.log_time.size
         t0 = self.timestamp() - self.backlog
@@ -5,10 +5,22 @@ Created on Wed Aug  8 10:33:53 2018
 
 @author: fwilde
 """
-import tango
-import h5py
+import functools
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from datetime import datetime
 
+import numpy
+import h5py
+
+from tango_proxy_pool import proxy_pool
+from timestamps import to_timestamp
+
 
 class TangoMotorDb():
     """
@@ -18,6 +30,15 @@ class TangoMotorDb():
     server.
     One set of motor parameters can be cached internally, modfied and later be
     written to either the server and/or the database.
+    For changes of many motors at once, motors can be loaded into a working
+    set. It keeps track of which values differ from the server and the
+    database, so only changed attributes are written when it is flushed.
+    diff() compares the motors of two sources (database, database files,
+    points in the database history or the tango servers) at once.
+    export_database() and import_database() stream the database to and from
+    JSON Lines, csv or parquet files for external tools and version control.
+    search_motors() finds motors by name prefix, tango host, zmx slot or
+    device name.
 
     The database is a hdf5 file which is ordered in the following way:
         motorgroup
@@ -29,9 +50,35 @@ class TangoMotorDb():
         motorgroup ...
 
     Each motor should labeled wth a unique name in a unique group.
+
+    New database files use a compact layout instead: one table with a row per
+    motor (dataset 'motors') and a string table (dataset 'strings'). Files in
+    the layout above can still be read and written. migrate_database() copies
+    a database into the compact layout. In this layout every write is also
+    appended to a history table, which can be queried with query_history()
+    and changes_between().
+
+    By default the database file is opened for every operation. For repeated
+    lookups a session can be opened (open_session() or 'with TM.session():')
+    which keeps the file open and holds an index of all motors and their
+    'loc' entries in memory. The index is rebuilt if the file was modified by
+    another process.
+
+    Database files in the compact layout support one writer and any number of
+    readers at the same time (HDF5 SWMR). The writer process calls
+    start_writer() (or 'with TM.writer():'); it keeps the file open and
+    commits all writes of the process from a request queue, in batches.
+    Readers in other processes simply query the database, reads always
+    open the file in SWMR mode. Sessions open the file for writing and can
+    not be used while a writer is running.
+
+    query_server(), write_cache_to_server() and check_consistency() have
+    asyncio variants (query_server_async() etc.) which use the tango asyncio
+    green mode and run the HDF5 work in an executor. Each TangoMotorDb holds
+    one motor cache, use one instance per motor for concurrent coroutines.
     """
 
-    def __init__(self, tango_host='hzgpp05vme0:10000'):
+    def __init__(self, tango_host='hzgpp05vme0:10000', motor_db_filepath=None):
         """
         Initialize class. Defines path to database, attribute dictionary and
         tango server.
@@ -39,9 +86,13 @@ class TangoMotorDb():
         param: tango_host <string>
             defines tango host. Port must be supplied
             (e.g. 'hzgpp05vme0:10000')
+        param: motor_db_filepath <string> (optional)
+            path to the database file
+            default: $P05_MOTOR_DB or /home/p05user/fwilde/p05tools/p05_motor_db.h5
         """
         self._tango_host = tango_host
-        self._motor_db_filepath = '/home/p05user/fwilde/p05tools/p05_motor_db.h5'
+        self._motor_db_filepath = motor_db_filepath or \
+            os.environ.get('P05_MOTOR_DB', '/home/p05user/fwilde/p05tools/p05_motor_db.h5')
         self._motor_cache = {'zmx': {'AxisName': None,
                                      'PreferentialDirection': None,
                                      'RunCurrent': None,
@@ -51,7 +102,7 @@ class TangoMotorDb():
                                      'BaseRate': None,
                                      'Conversion': None,
                                      'SettleTime': None,
-TM                                     'SlewRate': None,
+                                     'SlewRate': None,
                                      'StepBacklash': None,
                                      'UnitLimitMax': None,
                                      'UnitLimitMin': None},
@@ -68,32 +119,468 @@ TM                                     'SlewRate': None,
              'hzgpp05vme2:10000':{'zmx': '/p05/ZMX/eh2.',
                                   'oms': '/p05/motor/eh2.'}
             }
+        self._session_file = None
+        self._session_mtime = None
+        self._session_layout = None
+        self._db_index = None
+        self._working_set = {}
+        self._writer_thread = None
+        self._writer_file = None
+        self._writer_layout = None
+        self._writer_lock = threading.Lock()
+        self._write_queue = None
+        # (absolute, relative) tolerance of attributes in diff() and
+        # check_consistency(), other attributes have to match exactly
+        self.diff_tolerances = {'RunCurrent': (1e-3, 0.),
+                                'StopCurrent': (1e-3, 0.),
+                                'Conversion': (0., 1e-6),
+                                'SettleTime': (1e-4, 0.),
+                                'UnitLimitMax': (1e-4, 0.),
+                                'UnitLimitMin': (1e-4, 0.)}
+
+    def _attributes(self):
+        """
+        Returns the attribute names of each motor subgroup.
+        """
+        return {m_subg: list(self._motor_cache[m_subg]) for m_subg in self._motor_subgroups}
+
+    def _get_layout(self, h5db_file):
+        """
+        Returns the storage layout of an open database file. Empty files which
+        are opened for writing get the compact table layout.
+        """
+        if _decode(h5db_file.attrs.get('layout')) == _TableLayout.name:
+            return _TableLayout(h5db_file, self._attributes())
+        if h5db_file.mode != 'r' and len(h5db_file.keys()) == 0:
+            return _TableLayout.create(h5db_file, self._attributes())
+        return _GroupLayout(h5db_file, self._attributes())
+
+    def open_session(self):
+        """
+        Opens the database file and keeps it open until close_session() is
+        called. Database lookups within a session are served from an in-memory
+        index of motorgroup -> motorname -> loc entries.
+        """
+        if self._writer_thread is not None:
+            raise Exception('Error: Stop the writer before opening a session.')
+        if self._session_file is None:
+            self._open_session_file()
+            self._db_index = None
+
+    def _open_session_file(self):
+        """
+        Opens the session file read-only in SWMR mode, so other processes
+        can open the database meanwhile. Writes within a session reopen the
+        file for writing, see _open_database().
+        """
+        self._session_file = h5py.File(self._motor_db_filepath, 'r', swmr=True)
+        self._session_mtime = os.stat(self._motor_db_filepath).st_mtime_ns
+        self._session_layout = self._get_layout(self._session_file)
+
+    def close_session(self):
+        """
+        Closes the database file opened by open_session().
+        """
+        if self._session_file is not None:
+            self._session_file.close()
+        self._session_file = None
+        self._session_mtime = None
+        self._session_layout = None
+        self._db_index = None
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager for open_session() / close_session().
+        """
+        self.open_session()
+        try:
+            yield self
+        finally:
+            self.close_session()
+
+    def _refresh_session(self):
+        """
+        Reopens the session file and drops the index if the database file was
+        modified by someone else.
+        """
+        mtime = os.stat(self._motor_db_filepath).st_mtime_ns
+        if mtime != self._session_mtime:
+            self._session_file.close()
+            self._open_session_file()
+            self._db_index = None
+
+    def start_writer(self):
+        """
+        Makes this process the single writer of the database. The file is
+        kept open in SWMR mode, so other processes can read it meanwhile. All
+        database writes are queued and committed by a writer thread, pending
+        writes are committed together with one flush. Requires the table
+        layout, see migrate_database().
+        """
+        if self._writer_thread is not None:
+            return
+        if self._session_file is not None:
+            raise Exception('Error: Close the session before starting the writer.')
+        h5db_file = h5py.File(self._motor_db_filepath, 'a', libver='latest')
+        try:
+            layout = self._get_layout(h5db_file)
+            if layout.name != _TableLayout.name:
+                raise Exception('Error: Concurrent access requires the table layout. Use migrate_database().')
+            # no datasets can be created in SWMR mode
+            history = layout._get_history(create=True)
+            if 'index' not in h5db_file:
+                layout._write_index()
+            if 'index/strings' not in h5db_file:
+                layout._write_string_index()
+            if layout._history_index_valid(len(history)):
+                layout._compact_history_index()
+            else:
+                layout._write_history_index()
+            h5db_file.swmr_mode = True
+        except Exception:
+            h5db_file.close()
+            raise
+        self._writer_file = h5db_file
+        self._writer_layout = layout
+        self._write_queue = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._write_loop, args=(self._write_queue,),
+                                               name='tango_motor_db_writer', daemon=True)
+        self._writer_thread.start()
+
+    def stop_writer(self):
+        """
+        Commits all pending writes and closes the database file opened by
+        start_writer().
+        """
+        if self._writer_thread is None:
+            return
+        self._write_queue.put(None)
+        self._writer_thread.join()
+        self._writer_file.close()
+        self._writer_thread = None
+        self._writer_file = None
+        self._writer_layout = None
+        self._write_queue = None
+
+    @contextmanager
+    def writer(self):
+        """
+        Context manager for start_writer() / stop_writer().
+        """
+        self.start_writer()
+        try:
+            yield self
+        finally:
+            self.stop_writer()
+
+    def _write_loop(self, write_queue):
+        """
+        Writer thread. Takes all pending write requests from the queue,
+        applies them and flushes the file once per batch.
+        """
+        running = True
+        while running:
+            batch = [write_queue.get()]
+            while True:
+                try:
+                    batch.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+            results = []
+            with self._writer_lock:
+                for request in batch:
+                    if request is None:
+                        continue
+                    operation, future = request
+                    try:
+                        results.append((future, operation(self._writer_layout), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+                self._writer_file.flush()
+            # callers are released once the batch is visible to readers
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _commit(self, operation):
+        """
+        Applies a write operation, a function taking the storage layout, to
+        the database. Goes through the write queue if a writer is running.
+        Returns the result of the operation.
+        """
+        if self._writer_thread is None:
+            with self._open_database('a') as db:
+                return operation(db)
+        future = Future()
+        self._write_queue.put((operation, future))
+        return future.result()
+
+    @contextmanager
+    def _open_database(self, mode='r'):
+        """
+        Yields the storage layout of the open writer or session file or opens
+        the database file for a single operation. Files are read in SWMR mode,
+        new files are created in the latest file format, which supports it.
+
+        param: mode <str>
+            h5py file mode. Within a session, the session file is reopened
+            for writing
+        """
+        if self._writer_thread is not None:
+            with self._writer_lock:
+                yield self._writer_layout
+            return
+        if self._session_file is None:
+            if mode == 'r':
+                h5db_file = h5py.File(self._motor_db_filepath, 'r', swmr=True)
+            elif os.path.exists(self._motor_db_filepath):
+                h5db_file = h5py.File(self._motor_db_filepath, mode)
+            else:
+                h5db_file = h5py.File(self._motor_db_filepath, mode, libver='latest')
+            with h5db_file:
+                yield self._get_layout(h5db_file)
+            return
+        self._refresh_session()
+        if mode == 'r':
+            yield self._session_layout
+            return
+        # the session file is read-only, it is reopened for the write
+        self._session_file.close()
+        try:
+            with h5py.File(self._motor_db_filepath, mode) as h5db_file:
+                yield self._get_layout(h5db_file)
+        finally:
+            # keep own modifications from invalidating the index
+            self._open_session_file()
+
+    def _get_index(self):
+        """
+        Returns the in-memory index of the session. Builds it on first use.
+        """
+        if self._db_index is None:
+            self._db_index = self._session_layout.read_locs()
+        return self._db_index
+
+    def _get_loc(self, db, motorgroup, motorname):
+        """
+        Returns the 'loc' entries of a motor. Served from the index within a
+        session.
+        """
+        if self._session_file is not None:
+            self._refresh_session()
+            return self._get_index()[motorgroup][motorname]
+        return db.read_motor(motorgroup, motorname, ['loc'])['loc']
+
+    def _device_names(self, zmx_slot, tango_host=None):
+        """
+        Returns the ZMX and OMS device names of a zmx motor slot.
+
+        param: zmx_slot <int>
+            number of the zmx slot. use numbers >16 for second crate
+            on hzgpp05vme0:10000 (DMM)
+        param: tango_host <str> (optional)
+            default: current tango host
+        """
+        tango_host = tango_host or self._tango_host
+        prefixes = dict(self._server_prefixes[tango_host])
+        # set correct server prefix for vme0 second crate
+        if (tango_host == 'hzgpp05vme0:10000' and zmx_slot in range(17, 33)):
+            prefixes['zmx'] = '/p05/ZMX/multi.'
+            prefixes['oms'] = '/p05/motor/multi.'
+        return (tango_host + prefixes['zmx'] + '{:02d}'.format(zmx_slot),
+                tango_host + prefixes['oms'] + '{:02d}'.format(zmx_slot))
 
-    def _fetch_tango_proxies(self, zmx_slot):
+    def _fetch_tango_proxies(self, zmx_slot, tango_host=None):
         """
-        Creates tango device proxies based on zmx motor slot.
+        Returns tango device proxies based on zmx motor slot. Proxies are
+        shared by all TangoMotorDb instances through the proxy pool.
 
         param: zmx_slot <int>
             number of the zmx slot. use numbers >16 for second crate
             on hzgpp05vme0:10000 (DMM)
+        param: tango_host <str> (optional)
+            default: current tango host
         """
+        zmx_device_name, oms_device_name = self._device_names(zmx_slot, tango_host)
+        # Get Tango device proxy from the process wide pool
+        proxy_pool.prefetch(zmx_device_name, oms_device_name)
+        zmx_device = proxy_pool.get(zmx_device_name)
+        oms_device = proxy_pool.get(oms_device_name)
+        return {'zmx':{'device_name': zmx_device_name, 'device': zmx_device},
+                'oms':{'device_name': oms_device_name, 'device': oms_device}}
 
-        # set correct server prefix for vme0 second crate
-        if (self._tango_host == 'hzgpp05vme0:10000' and zmx_slot in range(17, 33)):
-            self._server_prefixes['hzgpp05vme0:10000']['zmx'] = '/p05/ZMX/multi.'
-            self._server_prefixes['hzgpp05vme0:10000']['oms'] = '/p05/motor/multi.'
-        # Get Tango device proxy
-        zmx_device_name = (self._tango_host
-                           + self._server_prefixes[self._tango_host]['zmx']
-                           + '{:02d}'.format(zmx_slot))
-        zmx_device = tango.DeviceProxy(zmx_device_name)
-        oms_device_name = (self._tango_host
-                           + self._server_prefixes[self._tango_host]['oms']
-                           + '{:02d}'.format(zmx_slot))
-        oms_device = tango.DeviceProxy(oms_device_name)
+    async def _fetch_tango_proxies_async(self, zmx_slot, tango_host=None):
+        """
+        Asyncio variant of _fetch_tango_proxies().
+        """
+        import asyncio
+        zmx_device_name, oms_device_name = self._device_names(zmx_slot, tango_host)
+        zmx_device, oms_device = await asyncio.gather(proxy_pool.get_async(zmx_device_name),
+                                                      proxy_pool.get_async(oms_device_name))
         return {'zmx':{'device_name': zmx_device_name, 'device': zmx_device},
                 'oms':{'device_name': oms_device_name, 'device': oms_device}}
 
+    def _read_server_attributes(self, tango_proxies, timeout=0):
+        """
+        Reads all zmx and oms attributes of a motor. Each device is read with
+        a single read_attributes request. The requests to both devices are
+        sent before waiting for the replies, hence both are read at once.
+        Float values are rounded to 4 digits. Proxies of devices which fail
+        are evicted from the proxy pool.
+
+        param: tango_proxies <dict>
+            device proxies as returned by _fetch_tango_proxies()
+        param: timeout <int> (optional)
+            time in ms to wait for each reply. 0 waits until the reply arrives.
+            default: 0
+        """
+        import tango
+        requests = {}
+        try:
+            for servertype, serverentry in tango_proxies.items():
+                attrs = sorted(self._motor_cache[servertype])
+                requests[servertype] = (attrs, serverentry['device'].read_attributes_asynch(attrs))
+            replies = {servertype: tango_proxies[servertype]['device'].read_attributes_reply(request_id, timeout)
+                       for servertype, (attrs, request_id) in requests.items()}
+        except tango.DevFailed:
+            for serverentry in tango_proxies.values():
+                proxy_pool.evict(serverentry['device_name'])
+            raise
+        return {servertype: self._reply_values(tango_proxies[servertype]['device_name'], attrs, replies[servertype])
+                for servertype, (attrs, request_id) in requests.items()}
+
+    async def _read_server_attributes_async(self, tango_proxies):
+        """
+        Asyncio variant of _read_server_attributes(). Both devices are read
+        concurrently.
+        """
+        import asyncio
+        import tango
+        attrs = {servertype: sorted(self._motor_cache[servertype]) for servertype in tango_proxies}
+        try:
+            replies = await asyncio.gather(*[tango_proxies[servertype]['device'].read_attributes(attrs[servertype])
+                                             for servertype in attrs])
+        except tango.DevFailed:
+            for serverentry in tango_proxies.values():
+                proxy_pool.evict(serverentry['device_name'])
+            raise
+        return {servertype: self._reply_values(tango_proxies[servertype]['device_name'], attrs[servertype], reply)
+                for servertype, reply in zip(attrs, replies)}
+
+    @staticmethod
+    def _reply_values(device_name, attrs, replies):
+        """
+        Returns {attribute: value} of the replies of a read_attributes
+        request. Float values are rounded to 4 digits.
+        """
+        values = {}
+        for attr, reply in zip(attrs, replies):
+            if reply.has_failed:
+                raise Exception('Error: Reading {} from {} failed.'.format(attr, device_name))
+            value = reply.value
+            values[attr] = round(value, 4) if isinstance(value, float) else value
+        return values
+
+    def _write_server_attributes(self, tango_proxies, values):
+        """
+        Writes zmx and oms attributes with one write_attributes call per
+        device. ZMX attributes are stored to EPROM if any was written.
+
+        param: tango_proxies <dict>
+            device proxies as returned by _fetch_tango_proxies()
+        param: values <dict>
+            {servertype: {attribute: value}} of the attributes to write
+        """
+        for servertype in ['zmx', 'oms']:
+            if not values.get(servertype):
+                continue
+            device = tango_proxies[servertype]['device']
+            device.write_attributes(sorted(values[servertype].items()))
+            if servertype == 'zmx':
+                device.WriteEPROM()
+
+    async def _write_server_attributes_async(self, tango_proxies, values):
+        """
+        Asyncio variant of _write_server_attributes(). Both devices are
+        written concurrently.
+        """
+        import asyncio
+        async def write(servertype):
+            device = tango_proxies[servertype]['device']
+            await device.write_attributes(sorted(values[servertype].items()))
+            if servertype == 'zmx':
+                await device.WriteEPROM()
+
+        await asyncio.gather(*[write(servertype) for servertype in ['zmx', 'oms'] if values.get(servertype)])
+
+    @staticmethod
+    def _changed_attributes(motor, reference, subgroups):
+        """
+        Returns {subgroup: {attribute: value}} of the motor values which
+        differ from the reference values. Everything is changed if the
+        reference is unknown (None).
+        """
+        changes = {}
+        for m_subg in subgroups:
+            if reference is None:
+                changes[m_subg] = dict(motor[m_subg])
+            else:
+                changes[m_subg] = {attr: value for attr, value in motor[m_subg].items()
+                                   if value != reference[m_subg][attr]}
+        return changes
+
+    def _loc_proxies(self, loc, timeout=None):
+        """
+        Returns tango device proxies of a motor based on its 'loc' entries.
+
+        param: loc <dict>
+            'loc' entries of the motor
+        param: timeout <float> (optional)
+            time in s to wait for both proxies
+            default: wait until they are created
+        """
+        device_names = {servertype: loc[servertype + '_device_name'] for servertype in ['zmx', 'oms']}
+        proxy_pool.prefetch(*device_names.values())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tango_proxies = {}
+        for servertype, device_name in device_names.items():
+            try:
+                device = proxy_pool.get(device_name, None if deadline is None else
+                                        max(deadline - time.monotonic(), 0.))
+            except FutureTimeoutError:
+                raise Exception('Error: No proxy of {} within {} s'.format(device_name, timeout))
+            tango_proxies[servertype] = {'device_name': device_name, 'device': device}
+        return tango_proxies
+
+    async def _loc_proxies_async(self, loc, timeout=None):
+        """
+        Asyncio variant of _loc_proxies().
+        """
+        import asyncio
+        servertypes = ['zmx', 'oms']
+        try:
+            devices = await asyncio.wait_for(asyncio.gather(
+                *[proxy_pool.get_async(loc[servertype + '_device_name']) for servertype in servertypes]), timeout)
+        except asyncio.TimeoutError:
+            raise Exception('Error: No proxies of {} within {} s'.format(
+                ', '.join(loc[servertype + '_device_name'] for servertype in servertypes), timeout))
+        return {servertype: {'device_name': loc[servertype + '_device_name'], 'device': device}
+                for servertype, device in zip(servertypes, devices)}
+
+    @staticmethod
+    async def _run_blocking(function, *args, **kwargs):
+        """
+        Runs blocking (HDF5) work in the default executor of the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
     def switch_tango_host(self, tango_host=None, verbose=True):
         """
         Sets new tango host. Checks if the tango host is know to the class.
@@ -139,15 +626,10 @@ TM                                     'SlewRate': None,
             default: True
         """
         tango_proxies = self._fetch_tango_proxies(zmx_slot)
-        for servertype, serverentry in tango_proxies.items():
-            # fetch_zmx and oms attributes
-            for attr in sorted(self._motor_cache[servertype]):
-                self._motor_cache[servertype][attr] = \
-                    serverentry['device'].read_attribute(attr).value
-                if isinstance(self._motor_cache[servertype][attr],
-                              float):
-                    self._motor_cache[servertype][attr] = \
-                        round(self._motor_cache[servertype][attr], 4)
+        # fetch_zmx and oms attributes
+        server_values = self._read_server_attributes(tango_proxies)
+        for servertype in server_values:
+            self._motor_cache[servertype].update(server_values[servertype])
         # create 'loc' entries
         self._motor_cache['loc']['zmx_slot'] = zmx_slot
         self._motor_cache['loc']['zmx_device_name'] = tango_proxies['zmx']['device_name']
@@ -158,6 +640,29 @@ TM                                     'SlewRate': None,
         if verbose:
             self.cache_info()
 
+    async def query_server_async(self, zmx_slot, verbose=True):
+        """
+        Asyncio variant of query_server().
+
+        param: zmx_slot <int>
+            number of the zmx slot. use numbers >16 for second crate
+            on hzgpp05vme0:10000 (DMM)
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        tango_proxies = await self._fetch_tango_proxies_async(zmx_slot)
+        server_values = await self._read_server_attributes_async(tango_proxies)
+        for servertype in server_values:
+            self._motor_cache[servertype].update(server_values[servertype])
+        self._motor_cache['loc']['zmx_slot'] = zmx_slot
+        self._motor_cache['loc']['zmx_device_name'] = tango_proxies['zmx']['device_name']
+        self._motor_cache['loc']['oms_device_name'] = tango_proxies['oms']['device_name']
+        self._database_entry = {'motorgroup': None, 'motorname': None}
+
+        if verbose:
+            self.cache_info()
+
     def modify_cache(self, attribute, value, verbose=True):
         """
         Modifies cached motor values.
@@ -185,6 +690,8 @@ TM                                     'SlewRate': None,
     def write_cache_to_server(self, zmx_slot, update=True, verbose=True):
         """
         Write motor attributes from internal cache to ZMX/OMS tango servers.
+        Only attributes which differ from the server are written. The ZMX
+        EPROM is only written if a ZMX attribute changed.
 
         param: zmx_slot <int>
             number of the zmx slot. use numbers >16 for second crate
@@ -197,15 +704,18 @@ TM                                     'SlewRate': None,
             default: True
         """
         tango_proxies = self._fetch_tango_proxies(zmx_slot)
-        for servertype, serverentry in tango_proxies.items():
-        # dump zmx and oms attributes
-            for attr in sorted(self._motor_cache[servertype].keys()):
-                value = self._motor_cache[servertype][attr]
-                serverentry['device'].write_attribute(attr, value)
-            if servertype == 'zmx':
-                serverentry['device'].WriteEPROM()
-                if verbose:
-                    print('Write ZMX attrobutes to EPROM successful.')
+        # dump zmx and oms attributes which differ from the server
+        server_values = self._read_server_attributes(tango_proxies)
+        changes = self._changed_attributes(self._motor_cache, server_values, ['zmx', 'oms'])
+        self._write_server_attributes(tango_proxies, changes)
+        if verbose:
+            for servertype in ['zmx', 'oms']:
+                for attr, value in changes[servertype].items():
+                    print('Written: {} {} -> {}'.format(attr, server_values[servertype][attr], value))
+            if changes['zmx']:
+                print('Write ZMX attrobutes to EPROM successful.')
+            else:
+                print('No ZMX attributes changed. EPROM not written.')
 
         if update:
             if verbose:
@@ -215,6 +725,42 @@ TM                                     'SlewRate': None,
             self._motor_cache['loc']['oms_device_name'] = tango_proxies['oms']['device_name']
             self.write_cache_to_database(overwrite_all=False, verbose=verbose)
 
+    async def write_cache_to_server_async(self, zmx_slot, update=True, verbose=True):
+        """
+        Asyncio variant of write_cache_to_server(). The database is updated
+        in an executor.
+
+        param: zmx_slot <int>
+            number of the zmx slot. use numbers >16 for second crate
+            on hzgpp05vme0:10000 (DMM)
+        param: update_db <boolean> (optional)
+            whether to update the database and cache automatically or not
+            default: True
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        tango_proxies = await self._fetch_tango_proxies_async(zmx_slot)
+        server_values = await self._read_server_attributes_async(tango_proxies)
+        changes = self._changed_attributes(self._motor_cache, server_values, ['zmx', 'oms'])
+        await self._write_server_attributes_async(tango_proxies, changes)
+        if verbose:
+            for servertype in ['zmx', 'oms']:
+                for attr, value in changes[servertype].items():
+                    print('Written: {} {} -> {}'.format(attr, server_values[servertype][attr], value))
+            if changes['zmx']:
+                print('Write ZMX attrobutes to EPROM successful.')
+            else:
+                print('No ZMX attributes changed. EPROM not written.')
+
+        if update:
+            if verbose:
+                print('Updating cache and database.')
+            self._motor_cache['loc']['zmx_slot'] = zmx_slot
+            self._motor_cache['loc']['zmx_device_name'] = tango_proxies['zmx']['device_name']
+            self._motor_cache['loc']['oms_device_name'] = tango_proxies['oms']['device_name']
+            await self._run_blocking(self.write_cache_to_database, overwrite_all=False, verbose=verbose)
+
     def cache_info(self):
         """
         Pretty prints internally cached values of a motor.
@@ -243,46 +789,28 @@ TM                                     'SlewRate': None,
         """
         if (self._database_entry['motorgroup'] and self._database_entry['motorname']) is None:
             raise Exception('Error motorname and motorgroup must be supplied.')
-        p1 = self._database_entry['motorgroup']  # database directory path 1st level
-        p2 = p1 + '/' + self._database_entry['motorname']  # database directory path 2nd level
-        with h5py.File(self._motor_db_filepath, 'a') as h5db_file:
-            # write attributes to database, iterate over subgroups
-            for m_subg in self._motor_subgroups:
-                p3 = p2 + '/' + m_subg  # database directory path 3rd level
-                # writing in existing h5 entries will fail with a ValueError.
-                # Hence for new entries:
-                try:
-                    zmx_group = h5db_file.create_group(p3)
-                    for attr, value in self._motor_cache[m_subg].items():
-                        zmx_group.create_dataset(attr, data=value)
-
-                    for path in [p1, p2, p3]:  # update timestamps in database
-                        h5db_file[path].attrs.create('last edit', str(datetime.now()), dtype="S19")
-
-                # or, if the entry exists:
-                except ValueError:
-                    if overwrite_all:
-                        if verbose:
-                            print('Group already exists, Overwriting: {}'.format(p3))
-                        for attr, value in self._motor_cache[m_subg].items():
-                            del h5db_file[p3 + '/'+attr]
-                            h5db_file[p3].create_dataset(attr, data=value)
-                        for path in [p1, p2, p3]:  # update timestamps in database
-                            h5db_file[path].attrs.create('last edit', str(datetime.now()), dtype="S19")
-                    else:
-                        if m_subg != 'loc':
-                            if verbose:
-                                print('Group already exists. No ovwrite_attrs flag  set. Skipping  {}.'.format(m_subg))
-                            continue
-                        else:
-                            if verbose:
-                                print('Group already exists, Overwriting: {}'.format(p3))
-                            for attr, value in self._motor_cache['loc'].items():
-                                del h5db_file[p2 + '/loc/'+attr]
-                                h5db_file[p2 + '/loc'].create_dataset(attr, data=value)
-                            for path in [p1, p2, p3]:  # update timestamps in database
-                                h5db_file[path].attrs.create('last edit', str(datetime.now()), dtype="S19")
-            h5db_file.close()
+        motorgroup = self._database_entry['motorgroup']
+        motorname = self._database_entry['motorname']
+        motor = {m_subg: dict(self._motor_cache[m_subg]) for m_subg in self._motor_subgroups}
+
+        def write(db):
+            subgroups = self._motor_subgroups
+            # for existing entries only 'loc' is written unless overwrite_all is set
+            exists = db.exists(motorgroup, motorname)
+            if exists and not overwrite_all:
+                subgroups = ['loc']
+            db.write_motors([(motorgroup, motorname, motor, subgroups)])
+            return exists, subgroups
+
+        exists, subgroups = self._commit(write)
+        if exists and verbose:
+            if not overwrite_all:
+                print('Motor already exists. No overwrite_all flag set. Skipping zmx, oms.')
+            print('Motor already exists, Overwriting: {} ({})'.format(
+                motorgroup + '/' + motorname, ', '.join(subgroups)))
+        if self._db_index is not None:
+            self._db_index.setdefault(self._database_entry['motorgroup'], {})[self._database_entry['motorname']] = \
+                dict(self._motor_cache['loc'])
 
     def delete_motor_from_database(self, motorgroup, motorname):
         """
@@ -294,8 +822,288 @@ TM                                     'SlewRate': None,
         param: motorname <str>
             Exact name of the motor ro delete from database
         """
-        with h5py.File(self._motor_db_filepath, 'a') as h5db_file:
-            del h5db_file[motorgroup][motorname]
+        self._commit(lambda db: db.delete_motor(motorgroup, motorname))
+        if self._db_index is not None:
+            del self._db_index[motorgroup][motorname]
+
+    def query_history(self, motorgroup, motorname, timestamp=None, cache=False, verbose=True):
+        """
+        Returns the motor attributes stored in the database at a given time.
+        Requires the table layout (see migrate_database()).
+
+        param: motorgroup <str>
+            Name for the group to which the motor belongs to
+        param: motorname <str>
+            Name of the motor
+        param: timestamp <datetime, str or float> (optional)
+            point in time, e.g. '2021-07-29 16:00'
+            default: now
+        param: cache <boolean> (optional)
+            Whether or not to save the attributes to internal cache
+            default: False
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <dict>
+            {subgroup: {attribute: value}} or None if the motor did not exist
+        """
+        timestamp = to_timestamp(timestamp)
+        with self._open_database('r') as db:
+            revision = db.history_at(motorgroup, motorname, timestamp)
+        if revision is None:
+            if verbose:
+                print('{} {} not in database at {}.'.format(motorgroup, motorname,
+                                                           datetime.fromtimestamp(timestamp)))
+            return None
+        motor, revision_time = revision
+        if cache:
+            for m_subg in self._motor_subgroups:
+                self._motor_cache[m_subg].update(motor[m_subg])
+            self._database_entry = {'motorgroup': motorgroup, 'motorname': motorname}
+        if verbose:
+            print('=' * 79)
+            print('{} {} attributes at {}'.format(motorgroup, motorname, datetime.fromtimestamp(timestamp)))
+            print('revision of {}\n'.format(_format_timestamp(revision_time)))
+            for m_subg in self._motor_subgroups:
+                for attr, value in motor[m_subg].items():
+                    print('{:<9}: {:<23}: {}'.format(m_subg, attr, value))
+            if cache:
+                print('\nMotor parameters copied to local cache.')
+            print('=' * 79)
+        return motor
+
+    def changes_between(self, start, stop=None, motorgroup=None, motorname=None, verbose=True):
+        """
+        Lists all changes of motor attributes in the database between two
+        times. Requires the table layout (see migrate_database()).
+
+        param: start <datetime, str or float>
+            begin of the time range, e.g. '2021-07-01'
+        param: stop <datetime, str or float> (optional)
+            end of the time range
+            default: now
+        param: motorgroup <str> (optional)
+            only list changes of motors in this group
+        param: motorname <str> (optional)
+            only list changes of motors with this name
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <list>
+            [timestamp, motorgroup, motorname, attribute, old value,
+            new value] of each change, timestamp is None if unknown. New
+            motors have old value None, deleted motors are listed with
+            attribute 'deleted'.
+        """
+        with self._open_database('r') as db:
+            revisions = db.history_between(to_timestamp(start), to_timestamp(stop), motorgroup, motorname)
+        changes = []
+        for revision, previous in revisions:
+            key = [revision['timestamp'], revision['motorgroup'], revision['motorname']]
+            if revision['deleted']:
+                changes.append(key + ['deleted', None, None])
+                continue
+            for m_subg in self._motor_subgroups:
+                for attr, value in revision['motor'][m_subg].items():
+                    if previous is None or previous['deleted']:
+                        changes.append(key + [attr, None, value])
+                    elif previous['motor'][m_subg][attr] != value:
+                        changes.append(key + [attr, previous['motor'][m_subg][attr], value])
+        if verbose:
+            print('=' * 79)
+            print('{:<20}|{:<30}|{:<13}|{:<13}'.format('Time', 'Axis name', 'Old value', 'New value'))
+            print('-' * 20 + '+' + '-' * 30 + '+' + '-' * 13 + '+' + '-' * 13)
+            for change in changes:
+                ax_name = '({}/{}/{})'.format(change[1], change[2], change[3])
+                print('{:<20}|{:<30}|{:<13}|{:<13}'.format(_format_timestamp(change[0]), ax_name,
+                                                           str(change[4]), str(change[5])))
+            print('=' * 79)
+        return changes
+
+    def migrate_database(self, target_filepath, verbose=True):
+        """
+        Copies all motors of the database into a new file with the compact
+        table layout. The database file itself is not changed. Replace it by
+        the new file or point _motor_db_filepath to it afterwards.
+
+        param: target_filepath <str>
+            path of the new database file. Must not exist.
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        with self._open_database('r') as source:
+            entries = source.entries()
+            motors = [(motorgroup, motorname, source.read_motor(motorgroup, motorname), self._motor_subgroups)
+                      for motorgroup, motorname in entries]
+            timestamps = [source.last_edit(motorgroup, motorname) for motorgroup, motorname in entries]
+        with h5py.File(target_filepath, 'w-', libver='latest') as h5db_file:
+            layout = _TableLayout.create(h5db_file, self._attributes())
+            layout.write_motors(motors, timestamps)
+            layout._compact_history_index()
+        if verbose:
+            print('Migrated {} motors to {}'.format(len(motors), target_filepath))
+
+    def _columns(self):
+        """
+        Returns the columns of flat motor records: motorgroup, motorname, the
+        attributes of all subgroups and last_edit.
+        """
+        return ['motorgroup', 'motorname'] + [attr for m_subg in self._motor_subgroups
+                                              for attr in self._motor_cache[m_subg]] + ['last_edit']
+
+    def iter_database(self, *args, inclusive=False, chunk_size=1024):
+        """
+        Yields the motors of the database one by one as flat records
+        {column: value}, see export_database(). The table layout is read
+        chunk_size rows at a time, so memory use does not grow with the size
+        of the database. The database file stays open until the generator is
+        exhausted or closed.
+
+        param: search terms <str> (optional)
+            as in _retrieve_database_entries(). default: all motors
+        param: inclusive <boolean> (optional)
+            default: False
+        param: chunk_size <int> (optional)
+            default: 1024
+        """
+        match = [arg for arg in args if arg is not None]
+        with self._open_database('r') as db:
+            for record in db.iter_records(chunk_size):
+                if _matches([record['motorgroup'], record['motorname']], match, inclusive):
+                    yield record
+
+    def export_database(self, filepath, *args, inclusive=False, file_format=None, timestamps=True,
+                        chunk_size=1024, verbose=True):
+        """
+        Streams the motors of the database, or the motors matching the search
+        terms, to a file with one record per motor. The records hold
+        motorgroup, motorname, all zmx, oms and loc attributes and the time of
+        the last edit. Formats are
+            'jsonl'     JSON Lines, one object per line
+            'csv'       comma separated values with a header line
+            'parquet'   columnar file, needs pyarrow
+        Files can be edited and read back with import_database().
+
+        param: filepath <str>
+            output file, '-' writes JSON Lines to stdout
+        param: search terms <str> (optional)
+            as in _retrieve_database_entries(). default: all motors
+        param: inclusive <boolean> (optional)
+            default: False
+        param: file_format <str> (optional)
+            default: from the file extension
+        param: timestamps <boolean> (optional)
+            Export the time of the last edit. Leave it out for files kept
+            in version control.
+            default: True
+        param: chunk_size <int> (optional)
+            number of motors read and written at once
+            default: 1024
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <int>
+            number of exported motors
+        """
+        from tango_motor_db_export import write_records
+
+        def records():
+            for record in self.iter_database(*args, inclusive=inclusive, chunk_size=chunk_size):
+                if timestamps and record['last_edit'] is not None:
+                    record['last_edit'] = _format_timestamp(record['last_edit'])
+                yield record
+
+        columns = self._columns() if timestamps else self._columns()[:-1]
+        count = write_records(records(), filepath, columns, file_format, chunk_size)
+        if verbose and filepath != '-':
+            print('Exported {} motors to {}'.format(count, filepath))
+        return count
+
+    def import_database(self, filepath, file_format=None, chunk_size=1024, verbose=True):
+        """
+        Writes the motors of a file, as created by export_database(), to the
+        database. Existing motors are updated, new motors are added. Columns
+        which are left out are not changed, e.g. a file with motorgroup,
+        motorname and the loc attributes only updates the loc entries. New
+        motors need all attributes. last_edit is ignored, the import is
+        recorded with the current time.
+
+        The file is read twice, record by record: all records are checked
+        before anything is written, then the motors are written in one
+        database transaction, chunk_size motors at a time.
+
+        param: filepath <str>
+            jsonl, csv or parquet file
+        param: file_format <str> (optional)
+            default: from the file extension
+        param: chunk_size <int> (optional)
+            default: 1024
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <dict>
+            'motors': number of imported motors, 'added': number of new motors
+        """
+        from tango_motor_db_export import read_records
+        if filepath == '-':
+            raise Exception('Error: Import needs a file, it is read twice.')
+        keys = set()
+        added = 0
+        with self._open_database('r') as db:
+            for n, record in enumerate(read_records(filepath, file_format, chunk_size)):
+                motorgroup, motorname, motor, subgroups = self._import_motor(record, n)
+                if (motorgroup, motorname) in keys:
+                    raise Exception('Error: Record {}: {}/{} is listed twice.'.format(n + 1, motorgroup, motorname))
+                keys.add((motorgroup, motorname))
+                if not db.exists(motorgroup, motorname):
+                    if subgroups != self._motor_subgroups:
+                        raise Exception('Error: Record {}: New motor {}/{} needs all attributes.'.format(
+                            n + 1, motorgroup, motorname))
+                    added += 1
+
+        def write(db):
+            motors = []
+            for n, record in enumerate(read_records(filepath, file_format, chunk_size)):
+                motors.append(self._import_motor(record, n))
+                if len(motors) == chunk_size:
+                    db.write_motors(motors)
+                    motors = []
+            if motors:
+                db.write_motors(motors)
+
+        self._commit(write)
+        self._db_index = None
+        if verbose:
+            print('Imported {} motors ({} new) from {}'.format(len(keys), added, filepath))
+        return {'motors': len(keys), 'added': added}
+
+    def _import_motor(self, record, n):
+        """
+        Converts the n-th flat record of an import file to a
+        (motorgroup, motorname, motor, subgroups) tuple. Subgroups of which
+        all attributes are given are written.
+        """
+        for column in ['motorgroup', 'motorname']:
+            if not isinstance(record.get(column), str) or not record[column]:
+                raise Exception('Error: Record {}: {} is missing.'.format(n + 1, column))
+        motor = {}
+        for m_subg in self._motor_subgroups:
+            values = {attr: record.get(attr) for attr in self._motor_cache[m_subg]}
+            if any(value is None for value in values.values()):
+                continue
+            for attr, value in values.items():
+                if attr in _TableLayout.string_columns:
+                    valid = isinstance(value, str)
+                else:
+                    valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if not valid:
+                    raise Exception('Error: Record {}: Invalid {}: {!r}'.format(n + 1, attr, value))
+            motor[m_subg] = values
+        if not motor:
+            raise Exception('Error: Record {}: No complete subgroup for {}/{}.'.format(
+                n + 1, record['motorgroup'], record['motorname']))
+        return record['motorgroup'], record['motorname'], motor, list(motor)
 
     def _retrieve_database_entries(self, *args, inclusive=False):
         """
@@ -311,19 +1119,64 @@ TM                                     'SlewRate': None,
         """
         args = [arg for arg in args if arg is not None]
         match = None if len(args) == 0 else args
-        with h5py.File(self._motor_db_filepath, 'r') as h5db_file:
-            db_entries = []
-            for db_motorgroup in h5db_file.keys():
-                for db_motorname in h5db_file[db_motorgroup].keys():
-                    db_entries.append([db_motorgroup, db_motorname])
-            h5db_file.close()
-        if match:
-            if inclusive:
-                db_entries = [item for item in db_entries if item[0] in match or item[1] in match]
+        with self._open_database('r') as db:
+            if self._session_file is not None:
+                db_entries = [[db_motorgroup, db_motorname]
+                              for db_motorgroup, db_motornames in self._get_index().items()
+                              for db_motorname in db_motornames]
+            else:
+                return db.find_entries(match, inclusive)
+        return [item for item in db_entries if _matches(item, match, inclusive)]
+
+    def search_motors(self, motorgroup=None, motorname=None, tango_host=None, zmx_slot=None, device=None,
+                      verbose=True):
+        """
+        Finds motors by their names or location, e.g. the motor on zmx slot 19
+        of hzgpp05vme0 or all motors with a device name containing 'eh2'.
+        All given criteria have to match. Databases in the table layout are
+        searched in their index, without reading the motors. The group layout
+        has no index, each search reads all 'loc' entries unless a session is
+        open, whose in-memory index is searched. Use migrate_database() for
+        fast searches without session.
+
+        param: motorgroup <str> (optional)
+            beginning of the motorgroup
+        param: motorname <str> (optional)
+            beginning of the motorname
+        param: tango_host <str> (optional)
+            tango host of the devices, with or without port
+        param: zmx_slot <int> (optional)
+            zmx slot
+        param: device <str> (optional)
+            beginning of the zmx or oms device name without tango host, or of
+            any part of it following a '/', e.g. 'p05/motor/eh2', 'motor/eh2'
+            or 'eh2'. Not case sensitive.
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <list>
+            [motorgroup, motorname, loc] of the matching motors
+        """
+        with self._open_database('r') as db:
+            if self._session_file is not None and db.name == _GroupLayout.name:
+                motors = {(group, name): loc for group, locs in self._get_index().items()
+                          for name, loc in locs.items()
+                          if _search_matches((group, name), loc, motorgroup, motorname, tango_host, zmx_slot,
+                                             device)}
             else:
-                for match_item in match:
-                    db_entries = [item for item in db_entries if match_item in item]
-        return db_entries
+                motors = db.search(motorgroup, motorname, tango_host, zmx_slot, device)
+        # slots of the group layout are numpy integers
+        found = [[key[0], key[1], dict(motors[key], zmx_slot=int(motors[key]['zmx_slot']))]
+                 for key in sorted(motors)]
+        if verbose:
+            print('=' * 79)
+            print('{:<12}{:<16}{:>5}  {}'.format('Motorgroup', 'Motorname', 'Slot', 'ZMX / OMS device'))
+            print('-' * 79)
+            for motorgroup, motorname, loc in found:
+                print('{:<12}{:<16}{:>5}  {}'.format(motorgroup, motorname, loc['zmx_slot'], loc['zmx_device_name']))
+                print('{:<33}  {}'.format('', loc['oms_device_name']))
+            print('=' * 79)
+        return found
 
     def query_database(self, *args, **kwargs):
         """
@@ -369,20 +1222,17 @@ TM                                     'SlewRate': None,
         if verbose:
             print('=' * 79)
             print('{} {} attributes\n'.format(db_entries[0], db_entries[1]))
-        p1 = db_entries[0]  # database directory path 1st level
-        p2 = p1 + '/' + db_entries[1]  # database directory path 2nd level
-        with h5py.File(self._motor_db_filepath, 'r') as h5db_file:
+        with self._open_database('r') as db:
+            motor = db.read_motor(db_entries[0], db_entries[1])
             for m_subg in self._motor_subgroups:
-                p3 = p2 + '/' + m_subg  # database directory path 3rd level
                 for attr in self._motor_cache[m_subg].keys():
-                    value = h5db_file[p3 + '/'+attr].value
+                    value = motor[m_subg][attr]
                     if verbose:
                         print('{:<9}: {:<23}: {}'.format(m_subg, attr, value))
                     if cache:
-                        self._motor_cache[m_subg][attr] = h5db_file[p3 + '/'+attr].value
+                        self._motor_cache[m_subg][attr] = value
                         self._database_entry['motorgroup'] = db_entries[0]
                         self._database_entry['motorname'] = db_entries[1]
-            h5db_file.close()
         if verbose:
             if cache:
                 print('\nMotor parameters copied to local cache.')
@@ -391,7 +1241,10 @@ TM                                     'SlewRate': None,
     def check_consistency(self, *args, **kwargs):
         """
         Checks if database entry match with corresponding tango server entry.
-        Work only on current tango_host.
+        Motors are grouped by their tango host. All hosts are checked
+        concurrently, with a limited number of motors per host at a time.
+        Motors whose servers can not be read within the timeout are reported
+        as failed.
 
         param: motorgroup <str> (optional)
             Name for the group to which the motor belongs to
@@ -399,63 +1252,1887 @@ TM                                     'SlewRate': None,
         param: motorname <str> (optional)
             Name of the motor
             default: None
+        param: tango_hosts <list> (optional)
+            tango hosts to check. Use 'all' for all known hosts.
+            default: current tango host
+        param: max_workers <int> (optional)
+            number of motors checked concurrently per tango host
+            default: 4
+        param: timeout <float> (optional)
+            tango timeout in s for each device
+            default: 3
+        param: tolerances <dict> (optional)
+            {attribute: (absolute, relative)} tolerances, overrides
+            diff_tolerances
         param: verbose <boolean>
             Print information to console.
             default: True
+        return: <dict>
+            'ok': [motorgroup, motorname] of motors without differences
+            'delta': [motorgroup, motorname, attribute, database value,
+                tango value] of each difference
+            'failed': [motorgroup, motorname, error] of motors which could
+                not be checked
         """
         verbose = True if kwargs.get('verbose') is None else kwargs.get('verbose')
+        max_workers = kwargs.get('max_workers') or 4
+        timeout = kwargs.get('timeout') or 3.
+        host_motors = self._consistency_motors(args, kwargs)
+        # one thread pool per host, all hosts run concurrently
+        executors = [ThreadPoolExecutor(max_workers=max_workers) for tango_host in host_motors]
+        futures = []
+        for executor, motors in zip(executors, host_motors.values()):
+            for db_motorgroup, db_motorname, motor in motors:
+                futures.append((db_motorgroup, db_motorname, motor,
+                                executor.submit(self._read_motor_servers, motor['loc'], timeout)))
+        db_motors = {}
+        server_motors = {}
+        failed = []
+        try:
+            for db_motorgroup, db_motorname, motor, future in futures:
+                try:
+                    server_motors[(db_motorgroup, db_motorname)] = future.result()
+                except Exception as e:
+                    failed.append([db_motorgroup, db_motorname, _error_message(e)])
+                    continue
+                db_motors[(db_motorgroup, db_motorname)] = motor
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=False)
+        return self._consistency_report(db_motors, server_motors, failed, kwargs.get('tolerances'), verbose)
+
+    async def check_consistency_async(self, *args, **kwargs):
+        """
+        Asyncio variant of check_consistency(). Takes the same arguments,
+        max_workers limits the number of motors read concurrently per tango
+        host. The database is read in an executor.
+        """
+        import asyncio
+        verbose = True if kwargs.get('verbose') is None else kwargs.get('verbose')
+        max_workers = kwargs.get('max_workers') or 4
+        timeout = kwargs.get('timeout') or 3.
+        host_motors = await self._run_blocking(self._consistency_motors, args, kwargs)
+
+        async def read(semaphore, loc):
+            async with semaphore:
+                tango_proxies = await self._loc_proxies_async(loc, timeout)
+                return await asyncio.wait_for(self._read_server_attributes_async(tango_proxies), timeout)
+
+        jobs = []
+        for motors in host_motors.values():
+            semaphore = asyncio.Semaphore(max_workers)
+            for db_motorgroup, db_motorname, motor in motors:
+                jobs.append((db_motorgroup, db_motorname, motor, read(semaphore, motor['loc'])))
+        results = await asyncio.gather(*[job[3] for job in jobs], return_exceptions=True)
+        db_motors = {}
+        server_motors = {}
+        failed = []
+        for (db_motorgroup, db_motorname, motor, job), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                failed.append([db_motorgroup, db_motorname, _error_message(result)])
+                continue
+            server_motors[(db_motorgroup, db_motorname)] = result
+            db_motors[(db_motorgroup, db_motorname)] = motor
+        return self._consistency_report(db_motors, server_motors, failed, kwargs.get('tolerances'), verbose)
+
+    def _consistency_motors(self, args, kwargs):
+        """
+        Returns the database values of the motors to check in
+        check_consistency() as {tango_host: [(motorgroup, motorname, motor)]}.
+        """
+        tango_hosts = kwargs.get('tango_hosts') or [self._tango_host]
+        if tango_hosts == 'all':
+            tango_hosts = list(self._server_prefixes)
         motorargs = [kwargs.get('motorgroup'), kwargs.get('motorname')]
         motorargs = [item for item in motorargs if item is not None]
         search = motorargs + list(args)
         db_entries = self._retrieve_database_entries(*search, inclusive=True)
-        delta = []
-        no_delta = []
-        with h5py.File(self._motor_db_filepath, 'r') as h5db_file:
+        # collect database values, grouped by tango host
+        host_motors = {tango_host: [] for tango_host in tango_hosts}
+        with self._open_database('r') as db:
             for (db_motorgroup, db_motorname) in db_entries:
-                p1 = db_motorgroup  # database directory path 1st level
-                p2 = p1 + '/' + db_motorname  # database directory path 2nd level
-                zmx_server_name = h5db_file[p2 + '/loc/zmx_device_name'].value
-                oms_server_name = h5db_file[p2 + '/loc/oms_device_name'].value
-                zmx_server = tango.DeviceProxy(zmx_server_name)
-                oms_server = tango.DeviceProxy(oms_server_name)
-                if self._tango_host not in h5db_file[p2 + '/loc/zmx_device_name'].value:
+                loc = self._get_loc(db, db_motorgroup, db_motorname)
+                tango_host = loc['zmx_device_name'].split('/')[0]
+                if tango_host not in host_motors:
                     continue
-                p3 = p2 + '/zmx'  # database directory path 3rd level
-                diff = False
-                for attr in self._motor_cache['zmx'].keys():
-                    db_value = h5db_file[p3 + '/' + attr].value
-                    tg_value = zmx_server.read_attribute(attr).value
-                    if isinstance(tg_value, float):
-                        tg_value = round(tg_value, 4)
-                    if db_value != tg_value:
-                        delta.append([db_motorgroup, db_motorname, attr, db_value, tg_value])
-                        diff = True
-                p3 = p2 + '/oms'  # database directory path 3rd level
-                for attr in self._motor_cache['oms'].keys():
-                    db_value = h5db_file[p3 + '/' + attr].value
-                    tg_value = oms_server.read_attribute(attr).value
-                    if isinstance(tg_value, float):
-                        tg_value = round(tg_value, 4)
-                    if db_value != tg_value:
-                        delta.append([db_motorgroup, db_motorname, attr, db_value, tg_value])
-                        diff = True
-                if not diff:
-                    no_delta.append([db_motorgroup, db_motorname])
-            if verbose:
-                print('=' * 79)
-                for motor in no_delta:
-                    print('[OK] {:<10} {:<20} No differences found.'.format(motor[0], motor[1]))
-                if len(delta) != 0:
-                    print('-' * 79 + '\n')
-                    print('Differences found in:')
-                    print('{:<30}|{:<20}|{:<20}'.format('Axis name', 'Database value', 'Tango value'))
-                    print('-' * 30 + '+' + '-' * 20 + '+' + '-' * 20)
-                    for diff in delta:
-                        ax_name = '({}/{}/{})'.format(diff[0], diff[1], diff[2])
-                        print('{:<30}|{:<20}|{:<20}'.format(ax_name, diff[3], diff[4]))
-                print('=' * 79)
-            h5db_file.close()
+                motor = db.read_motor(db_motorgroup, db_motorname, ['zmx', 'oms'])
+                motor['loc'] = loc
+                host_motors[tango_host].append((db_motorgroup, db_motorname, motor))
+        return host_motors
+
+    def _consistency_report(self, db_motors, server_motors, failed, tolerances, verbose):
+        """
+        Compares database and server values of check_consistency() and
+        returns the report.
+        """
+        report = {'ok': [], 'delta': [], 'failed': failed}
+        result = self._compare_motors(db_motors, server_motors, tolerances, ['zmx', 'oms'])
+        report['delta'] = [[diff[0], diff[1], diff[3], diff[4], diff[5]] for diff in result.rows()]
+        changed = set(tuple(motor) for motor in result.motors())
+        report['ok'] = [[motorgroup, motorname] for motorgroup, motorname in result.keys
+                        if (motorgroup, motorname) not in changed]
+        if verbose:
+            print('=' * 79)
+            for motor in report['ok']:
+                print('[OK] {:<10} {:<20} No differences found.'.format(motor[0], motor[1]))
+            for motor in report['failed']:
+                print('[FAILED] {:<10} {:<20} {}'.format(motor[0], motor[1], motor[2]))
+            if len(report['delta']) != 0:
+                print('-' * 79 + '\n')
+                print('Differences found in:')
+                print('{:<30}|{:<20}|{:<20}'.format('Axis name', 'Database value', 'Tango value'))
+                print('-' * 30 + '+' + '-' * 20 + '+' + '-' * 20)
+                for diff in report['delta']:
+                    ax_name = '({}/{}/{})'.format(diff[0], diff[1], diff[2])
+                    print('{:<30}|{:<20}|{:<20}'.format(ax_name, diff[3], diff[4]))
+            print('=' * 79)
+        return report
+
+    def _read_motor_servers(self, loc, timeout):
+        """
+        Reads the zmx and oms attributes of a motor from the devices given by
+        its 'loc' entries.
+
+        param: loc <dict>
+            'loc' entries of the motor
+        param: timeout <float>
+            tango timeout in s for each device
+        """
+        tango_proxies = self._loc_proxies(loc, timeout)
+        return self._read_server_attributes(tango_proxies, int(timeout * 1000))
+
+    def restore_servers(self, *args, **kwargs):
+        """
+        Writes the database values of several motors to their ZMX/OMS servers
+        concurrently, e.g. after a crate replacement. Motors are selected as in
+        check_consistency(). For each motor only attributes which differ from
+        the server are written, with one write_attributes request per device.
+        The ZMX EPROM is written if a ZMX attribute changed. Afterwards the
+        servers are read back and compared with the database.
+        Motors which share a device with another selected motor are skipped,
+        since their values would overwrite each other.
+
+        param: motorgroup <str> (optional)
+            Name for the group to which the motor belongs to
+            default: None
+        param: motorname <str> (optional)
+            Name of the motor
+            default: None
+        param: tango_hosts <list> (optional)
+            tango hosts to restore. Use 'all' for all known hosts.
+            default: current tango host
+        param: max_workers <int> (optional)
+            number of motors restored concurrently per tango host
+            default: 4
+        param: timeout <float> (optional)
+            tango timeout in s for each device
+            default: 3
+        param: tolerances <dict> (optional)
+            {attribute: (absolute, relative)} tolerances of the read back
+            check, overrides diff_tolerances
+        param: dry_run <boolean> (optional)
+            Only report which attributes would be written, 'restored' lists
+            the motors which would be written.
+            default: False
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <dict>
+            'restored': [motorgroup, motorname, {servertype: {attribute:
+                value}}] of motors which were written and verified
+            'unchanged': [motorgroup, motorname] of motors which already
+                matched the database
+            'mismatch': [motorgroup, motorname, attribute, database value,
+                tango value] of each value which differs after writing
+            'failed': [motorgroup, motorname, error] of motors which could
+                not be restored
+        """
+        verbose = True if kwargs.get('verbose') is None else kwargs.get('verbose')
+        max_workers = kwargs.get('max_workers') or 4
+        timeout = kwargs.get('timeout') or 3.
+        dry_run = kwargs.get('dry_run', False)
+        host_motors = self._consistency_motors(args, kwargs)
+        report = {'restored': [], 'unchanged': [], 'mismatch': [], 'failed': []}
+        # motors sharing a device can not be restored together
+        device_users = {}
+        for motors in host_motors.values():
+            for db_motorgroup, db_motorname, motor in motors:
+                for servertype in ['zmx', 'oms']:
+                    device_users.setdefault(motor['loc'][servertype + '_device_name'].lower(), []).append(
+                        (db_motorgroup, db_motorname))
+        # one thread pool per host, all hosts run concurrently
+        executors = [ThreadPoolExecutor(max_workers=max_workers) for tango_host in host_motors]
+        futures = []
+        for executor, motors in zip(executors, host_motors.values()):
+            for db_motorgroup, db_motorname, motor in motors:
+                shared = [user for servertype in ['zmx', 'oms']
+                          for user in device_users[motor['loc'][servertype + '_device_name'].lower()]
+                          if user != (db_motorgroup, db_motorname)]
+                if shared:
+                    report['failed'].append([db_motorgroup, db_motorname, 'Error: Device shared with {}'.format(
+                        ', '.join('/'.join(user) for user in shared))])
+                    continue
+                futures.append((db_motorgroup, db_motorname, motor,
+                                executor.submit(self._restore_motor, motor, timeout, dry_run)))
+        db_motors = {}
+        readback_motors = {}
+        written = {}
+        try:
+            for db_motorgroup, db_motorname, motor, future in futures:
+                try:
+                    changes, readback = future.result()
+                except Exception as e:
+                    report['failed'].append([db_motorgroup, db_motorname, _error_message(e)])
+                    continue
+                if not (changes['zmx'] or changes['oms']):
+                    report['unchanged'].append([db_motorgroup, db_motorname])
+                    continue
+                written[(db_motorgroup, db_motorname)] = changes
+                db_motors[(db_motorgroup, db_motorname)] = motor
+                readback_motors[(db_motorgroup, db_motorname)] = readback
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=False)
+        # verify all read back values at once
+        result = self._compare_motors(db_motors, readback_motors, kwargs.get('tolerances'), ['zmx', 'oms'])
+        report['mismatch'] = [[diff[0], diff[1], diff[3], diff[4], diff[5]] for diff in result.rows()]
+        mismatched = set(tuple(motor) for motor in result.motors())
+        report['restored'] = [[motorgroup, motorname, changes] for (motorgroup, motorname), changes in written.items()
+                              if (motorgroup, motorname) not in mismatched]
+        if verbose:
+            print('=' * 79)
+            if dry_run:
+                print('Dry run, nothing written.\n')
+            for motorgroup, motorname, changes in report['restored']:
+                attrs = ', '.join(attr for servertype in ['zmx', 'oms'] for attr in changes[servertype])
+                print('[{}] {:<10} {:<20} {}'.format('DRY RUN' if dry_run else 'OK', motorgroup, motorname, attrs))
+            for motor in report['unchanged']:
+                print('[OK] {:<10} {:<20} No differences found.'.format(motor[0], motor[1]))
+            for motor in report['failed']:
+                print('[FAILED] {:<10} {:<20} {}'.format(motor[0], motor[1], motor[2]))
+            if len(report['mismatch']) != 0:
+                print('-' * 79 + '\n')
+                print('Values differ after restore:')
+                print('{:<30}|{:<20}|{:<20}'.format('Axis name', 'Database value', 'Tango value'))
+                print('-' * 30 + '+' + '-' * 20 + '+' + '-' * 20)
+                for diff in report['mismatch']:
+                    ax_name = '({}/{}/{})'.format(diff[0], diff[1], diff[2])
+                    print('{:<30}|{:<20}|{:<20}'.format(ax_name, diff[3], diff[4]))
+            print('=' * 79)
+        return report
+
+    def _restore_motor(self, motor, timeout, dry_run=False):
+        """
+        Writes the attributes of a motor which differ from its servers and
+        reads the servers back. Returns (changes, read back values). In a dry
+        run, the values are not written and the current server values are
+        returned as read back values.
+        """
+        tango_proxies = self._loc_proxies(motor['loc'], timeout)
+        server_values = self._read_server_attributes(tango_proxies, int(timeout * 1000))
+        changes = self._changed_attributes(motor, server_values, ['zmx', 'oms'])
+        if dry_run or not (changes['zmx'] or changes['oms']):
+            # nothing to verify
+            return changes, {servertype: dict(motor[servertype]) for servertype in ['zmx', 'oms']}
+        with _device_timeout(tango_proxies, timeout):
+            self._write_server_attributes(tango_proxies, changes)
+        return changes, self._read_server_attributes(tango_proxies, int(timeout * 1000))
+
+    def diff(self, source_a='database', source_b='server', motorgroup=None, motorname=None,
+             tolerances=None, max_workers=16, timeout=3., verbose=True):
+        """
+        Compares the motor parameters of two sources. A source is one of
+            'database'  the current database
+            'server'    the tango servers of the motors in the database
+            <str>       path of another database file
+            <datetime, str or float>
+                        a point in time of the database history, e.g.
+                        '2021-07-29 16:00' (table layout only)
+        Both sources are loaded into arrays with one row per motor and one
+        column per attribute, which are compared at once. Numbers are equal
+        within the tolerances given by diff_tolerances.
+
+        param: source_a <str, datetime or float> (optional)
+            default: 'database'
+        param: source_b <str, datetime or float> (optional)
+            default: 'server'
+        param: motorgroup <str> (optional)
+            only compare motors in this group
+        param: motorname <str> (optional)
+            only compare motors with this name
+        param: tolerances <dict> (optional)
+            {attribute: (absolute, relative)} tolerances, overrides
+            diff_tolerances
+        param: max_workers <int> (optional)
+            number of motors read concurrently from the servers
+            default: 16
+        param: timeout <float> (optional)
+            tango timeout in s for each device
+            default: 3
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <MotorDiff>
+            differences, can be filtered with MotorDiff.filter()
+        """
+        motors_a, failed_a = self._diff_source(source_a, motorgroup, motorname, max_workers, timeout)
+        motors_b, failed_b = self._diff_source(source_b, motorgroup, motorname, max_workers, timeout)
+        # motors which could not be read are not reported as missing
+        for entry in failed_a + failed_b:
+            motors_a.pop((entry[0], entry[1]), None)
+            motors_b.pop((entry[0], entry[1]), None)
+        result = self._compare_motors(motors_a, motors_b, tolerances)
+        result.labels = [source if isinstance(source, str) else _format_timestamp(to_timestamp(source))
+                         for source in [source_a, source_b]]
+        result.failed = failed_a + failed_b
+        if verbose:
+            result.info()
+        return result
+
+    def _diff_source(self, source, motorgroup, motorname, max_workers, timeout):
+        """
+        Loads the motors of a diff() source. Returns
+        ({(motorgroup, motorname): motor}, [[motorgroup, motorname, error]]).
+        """
+        def selected(motors):
+            return {key: motor for key, motor in motors.items()
+                    if motorgroup in [None, key[0]] and motorname in [None, key[1]]}
+
+        if source == 'database':
+            with self._open_database('r') as db:
+                return selected(db.read_motors()), []
+        if source == 'server':
+            with self._open_database('r') as db:
+                locs = db.read_locs()
+            locs = selected({(group, name): loc for group in locs for name, loc in locs[group].items()})
+            motors = {}
+            failed = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {key: executor.submit(self._read_motor_servers, loc, timeout)
+                           for key, loc in locs.items()}
+                for key, future in futures.items():
+                    try:
+                        motors[key] = future.result()
+                    except Exception as e:
+                        failed.append([key[0], key[1], _error_message(e)])
+                        continue
+                    motors[key]['loc'] = locs[key]
+            return motors, failed
+        if isinstance(source, str) and os.path.isfile(source):
+            with h5py.File(source, 'r', swmr=True) as h5db_file:
+                return selected(self._get_layout(h5db_file).read_motors()), []
+        timestamp = to_timestamp(source)
+        with self._open_database('r') as db:
+            return selected(db.history_motors(timestamp)), []
+
+    def _compare_motors(self, motors_a, motors_b, tolerances=None, subgroups=None):
+        """
+        Compares two sets of motors {(motorgroup, motorname): motor} in one
+        vectorized pass. Returns a MotorDiff.
+        """
+        keys = sorted(set(motors_a) & set(motors_b))
+        attributes = [(m_subg, attr) for m_subg in (subgroups or self._motor_subgroups)
+                      for attr in self._motor_cache[m_subg]]
+        shape = (len(keys), len(attributes))
+        values_a = numpy.array([[motors_a[key][m_subg][attr] for m_subg, attr in attributes]
+                                for key in keys], dtype=object).reshape(shape)
+        values_b = numpy.array([[motors_b[key][m_subg][attr] for m_subg, attr in attributes]
+                                for key in keys], dtype=object).reshape(shape)
+        tolerance = dict(self.diff_tolerances)
+        tolerance.update(tolerances or {})
+        numeric = [n for n, (m_subg, attr) in enumerate(attributes) if attr not in _TableLayout.string_columns]
+        strings = [n for n, (m_subg, attr) in enumerate(attributes) if attr in _TableLayout.string_columns]
+        atol = numpy.array([tolerance.get(attributes[n][1], (0., 0.))[0] for n in numeric])
+        rtol = numpy.array([tolerance.get(attributes[n][1], (0., 0.))[1] for n in numeric])
+        mismatch = numpy.zeros(shape, dtype=bool)
+        mismatch[:, numeric] = ~numpy.isclose(values_a[:, numeric].astype(float), values_b[:, numeric].astype(float),
+                                              rtol=rtol, atol=atol, equal_nan=True)
+        mismatch[:, strings] = values_a[:, strings] != values_b[:, strings]
+        return MotorDiff(keys, attributes, values_a, values_b, mismatch,
+                         only_a=sorted(set(motors_a) - set(motors_b)),
+                         only_b=sorted(set(motors_b) - set(motors_a)))
+
+    def snapshot_servers(self, tango_hosts=None, zmx_slots=None, max_workers=16, verbose=True):
+        """
+        Reads the parameters of all motors on one or more tango hosts
+        concurrently and writes them to the database in one go. Slots are
+        mapped to motorgroup and motorname by the 'loc' entries in the
+        database. Slots without database entry or which can not be read are
+        skipped and reported.
+
+        param: tango_hosts <list> (optional)
+            tango hosts to scan. default: all known hosts
+        param: zmx_slots <list> (optional)
+            zmx slots to scan on each host.
+            default: 1-32 on hzgpp05vme0:10000, 1-16 otherwise
+        param: max_workers <int> (optional)
+            number of motors read concurrently
+            default: 16
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <dict>
+            'written': [motorgroup, motorname, device name] of stored motors
+            'unmapped': device names without database entry
+            'failed': [device name, error] of slots which could not be read
+        """
+        tango_hosts = tango_hosts or list(self._server_prefixes)
+        for tango_host in tango_hosts:
+            if tango_host not in self._server_prefixes:
+                raise Exception('Error: Host {} not known.'.format(tango_host))
+        # map zmx device names to database entries
+        with self._open_database('r') as db:
+            locs = self._get_index() if self._session_file is not None else db.read_locs()
+        names = {loc['zmx_device_name'].lower(): (motorgroup, motorname)
+                 for motorgroup, motornames in locs.items() for motorname, loc in motornames.items()}
+        jobs = []
+        for tango_host in tango_hosts:
+            if zmx_slots is not None:
+                slots = zmx_slots
+            else:
+                slots = range(1, 33) if tango_host == 'hzgpp05vme0:10000' else range(1, 17)
+            jobs += [(tango_host, zmx_slot) for zmx_slot in slots]
+
+        def read_slot(job):
+            tango_host, zmx_slot = job
+            tango_proxies = self._fetch_tango_proxies(zmx_slot, tango_host)
+            server_values = self._read_server_attributes(tango_proxies)
+            server_values['loc'] = {'zmx_slot': zmx_slot,
+                                    'zmx_device_name': tango_proxies['zmx']['device_name'],
+                                    'oms_device_name': tango_proxies['oms']['device_name']}
+            return server_values
+
+        report = {'written': [], 'unmapped': [], 'failed': []}
+        motors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for job in jobs:
+                zmx_device_name = self._device_names(job[1], job[0])[0]
+                if zmx_device_name.lower() in names:
+                    futures.append((zmx_device_name, executor.submit(read_slot, job)))
+                else:
+                    report['unmapped'].append(zmx_device_name)
+            for zmx_device_name, future in futures:
+                try:
+                    motor = future.result()
+                except Exception as e:
+                    report['failed'].append([zmx_device_name, _error_message(e)])
+                    continue
+                motorgroup, motorname = names[zmx_device_name.lower()]
+                motors.append((motorgroup, motorname, motor, self._motor_subgroups))
+                report['written'].append([motorgroup, motorname, zmx_device_name])
+        # commit all motors at once
+        if motors:
+            self._commit(lambda db: db.write_motors(motors))
+            if self._db_index is not None:
+                for motorgroup, motorname, motor, subgroups in motors:
+                    self._db_index[motorgroup][motorname] = dict(motor['loc'])
+        if verbose:
+            print('=' * 79)
+            for motorgroup, motorname, zmx_device_name in report['written']:
+                print('[OK]     {:<10} {:<20} {}'.format(motorgroup, motorname, zmx_device_name))
+            for zmx_device_name, error in report['failed']:
+                print('[FAILED] {} {}'.format(zmx_device_name, error))
+            print('\n{} motors written, {} failed, {} slots without database entry.'.format(
+                len(report['written']), len(report['failed']), len(report['unmapped'])))
+            print('=' * 79)
+        return report
+
+    def load_working_set(self, *args, **kwargs):
+        """
+        Loads motors from the database into the working set. Motors already
+        in the working set are replaced.
+
+        param: search terms <str> (optional)
+            motorgroup or motorname of the motors to load. If omitted, all
+            motors are loaded.
+        param: from_server <boolean> (optional)
+            Also read the current server values, which are used to find the
+            attributes to write on flush. Otherwise they are read on flush.
+            default: False
+        param: max_workers <int> (optional)
+            number of motors read from the servers concurrently
+            default: 16
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        verbose = True if kwargs.get('verbose') is None else kwargs.get('verbose')
+        db_entries = self._retrieve_database_entries(*args, inclusive=True)
+        with self._open_database('r') as db:
+            for motorgroup, motorname in db_entries:
+                motor = db.read_motor(motorgroup, motorname)
+                self._working_set[(motorgroup, motorname)] = \
+                    {'motor': motor,
+                     'database': {m_subg: dict(motor[m_subg]) for m_subg in motor},
+                     'server': None}
+        if kwargs.get('from_server'):
+            entries = [self._working_set[(motorgroup, motorname)] for motorgroup, motorname in db_entries]
+            with ThreadPoolExecutor(max_workers=kwargs.get('max_workers') or 16) as executor:
+                results = executor.map(lambda entry: self._read_server_attributes(
+                    self._loc_proxies(entry['motor']['loc'])), entries)
+                for entry, server_values in zip(entries, results):
+                    entry['server'] = server_values
+        if verbose:
+            print('Loaded {} motors into the working set.'.format(len(db_entries)))
+
+    def modify_working_set(self, motorgroup, motorname, attribute, value, verbose=True):
+        """
+        Modifies a motor value in the working set.
+
+        param: motorgroup <str>
+            Name for the group to which the motor belongs to
+        param: motorname <str>
+            Name of the motor
+        param: attribute <str>
+            attribute to modify
+        param: value <all>
+            new value for attribute
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        if (motorgroup, motorname) not in self._working_set:
+            raise Exception('{} {} not in working set.'.format(motorgroup, motorname))
+        motor = self._working_set[(motorgroup, motorname)]['motor']
+        for m_subg in self._motor_subgroups:
+            if attribute in motor[m_subg]:
+                motor[m_subg][attribute] = value
+                if verbose:
+                    print('Inserted: {} {} {} {}'.format(motorgroup, motorname, attribute, value))
+                return
+        raise Exception('{} not in cache (typo?)'.format(attribute))
+
+    def dirty_attributes(self, motorgroup, motorname, target='server'):
+        """
+        Returns the attributes of a working set motor which differ from the
+        server or the database as {subgroup: {attribute: value}}.
+
+        param: motorgroup <str>
+            Name for the group to which the motor belongs to
+        param: motorname <str>
+            Name of the motor
+        param: target <str>
+            'server' or 'database'
+            default: 'server'
+        """
+        entry = self._working_set[(motorgroup, motorname)]
+        subgroups = ['zmx', 'oms'] if target == 'server' else self._motor_subgroups
+        return self._changed_attributes(entry['motor'], entry[target], subgroups)
+
+    def flush_working_set(self, to_server=True, to_database=True, max_workers=16, verbose=True):
+        """
+        Writes changed attributes of all working set motors to the servers
+        and/or the database. Servers are written concurrently, the ZMX EPROM
+        only if a ZMX attribute changed. All database changes are committed
+        at once.
+
+        param: to_server <boolean>
+            write changes to the ZMX/OMS tango servers
+            default: True
+        param: to_database <boolean>
+            write changes to the database
+            default: True
+        param: max_workers <int> (optional)
+            number of motors written concurrently
+            default: 16
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        return: <dict>
+            'server': {(motorgroup, motorname): written attributes}
+            'database': {(motorgroup, motorname): written attributes}
+            'failed': [motorgroup, motorname, error] of failed server writes
+        """
+        report = {'server': {}, 'database': {}, 'failed': []}
+
+        def flush_server(entry):
+            tango_proxies = self._loc_proxies(entry['motor']['loc'])
+            if entry['server'] is None:
+                entry['server'] = self._read_server_attributes(tango_proxies)
+            changes = self._changed_attributes(entry['motor'], entry['server'], ['zmx', 'oms'])
+            self._write_server_attributes(tango_proxies, changes)
+            for servertype in changes:
+                entry['server'][servertype].update(changes[servertype])
+            return changes
+
+        if to_server:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {key: executor.submit(flush_server, entry) for key, entry in self._working_set.items()}
+                for (motorgroup, motorname), future in futures.items():
+                    try:
+                        changes = future.result()
+                    except Exception as e:
+                        report['failed'].append([motorgroup, motorname, _error_message(e)])
+                        continue
+                    if changes['zmx'] or changes['oms']:
+                        report['server'][(motorgroup, motorname)] = changes
+        if to_database:
+            motors = []
+            for (motorgroup, motorname), entry in self._working_set.items():
+                changes = self._changed_attributes(entry['motor'], entry['database'], self._motor_subgroups)
+                subgroups = [m_subg for m_subg in self._motor_subgroups if changes[m_subg]]
+                if subgroups:
+                    motors.append((motorgroup, motorname, entry['motor'], subgroups))
+                    report['database'][(motorgroup, motorname)] = changes
+            if motors:
+                self._commit(lambda db: db.write_motors(motors))
+            for motorgroup, motorname, motor, subgroups in motors:
+                entry = self._working_set[(motorgroup, motorname)]
+                entry['database'] = {m_subg: dict(motor[m_subg]) for m_subg in motor}
+                if self._db_index is not None:
+                    self._db_index.setdefault(motorgroup, {})[motorname] = dict(motor['loc'])
+        if verbose:
+            print('=' * 79)
+            for target in ['server', 'database']:
+                for (motorgroup, motorname), changes in report[target].items():
+                    for m_subg in changes:
+                        for attr, value in changes[m_subg].items():
+                            print('[{}] {:<10} {:<20} {:<23}: {}'.format(
+                                target, motorgroup, motorname, attr, value))
+            for motor in report['failed']:
+                print('[FAILED] {:<10} {:<20} {}'.format(motor[0], motor[1], motor[2]))
+            print('\n{} motors written to servers, {} to database, {} failed.'.format(
+                len(report['server']), len(report['database']), len(report['failed'])))
+            print('=' * 79)
+        return report
+
+    def clear_working_set(self):
+        """
+        Removes all motors from the working set. Unflushed changes are lost.
+        """
+        self._working_set = {}
+
+    def working_set_info(self):
+        """
+        Pretty prints the working set. Attributes which differ from the server
+        are marked with 's', attributes which differ from the database with
+        'd'. Unknown server values are marked with '?'.
+        """
+        print('=' * 79)
+        print('Working set\n')
+        for (motorgroup, motorname), entry in self._working_set.items():
+            print('{} {}'.format(motorgroup, motorname))
+            server_changes = self.dirty_attributes(motorgroup, motorname, 'server')
+            database_changes = self.dirty_attributes(motorgroup, motorname, 'database')
+            for m_subg in self._motor_subgroups:
+                for attr, value in entry['motor'][m_subg].items():
+                    flags = ''
+                    if m_subg != 'loc':
+                        flags += '?' if entry['server'] is None else ('s' if attr in server_changes[m_subg] else ' ')
+                    flags += 'd' if attr in database_changes[m_subg] else ' '
+                    print('  {:<2} {:<9}: {:<23}: {}'.format(flags, m_subg, attr, value))
+        print('=' * 79)
+
+
+def main(argv=None):
+    """
+    Command line interface, see tango_motor_db_cli.
+    """
+    from tango_motor_db_cli import main
+    return main(argv)
+
+
+def _error_message(error):
+    """
+    Returns a one line description of an exception.
+    """
+    # errors of tango devices can only occur once PyTango is imported
+    tango = sys.modules.get('tango')
+    if tango is not None and isinstance(error, tango.DevFailed) and error.args:
+        return error.args[0].desc.strip()
+    return str(error) or type(error).__name__
+
+
+@contextmanager
+def _device_timeout(tango_proxies, timeout):
+    """
+    Sets the tango timeout of the devices for the duration of a request.
+    The proxies are shared within the process, the previous timeout is set
+    again afterwards.
+    """
+    previous = {servertype: serverentry['device'].get_timeout_millis()
+                for servertype, serverentry in tango_proxies.items()}
+    try:
+        for serverentry in tango_proxies.values():
+            serverentry['device'].set_timeout_millis(int(timeout * 1000))
+        yield
+    finally:
+        for servertype, serverentry in tango_proxies.items():
+            serverentry['device'].set_timeout_millis(previous[servertype])
+
+
+def _matches(entry, match, inclusive=False):
+    """
+    Returns True if a [motorgroup, motorname] entry matches the search terms
+    of _retrieve_database_entries(). No search terms match everything.
+    """
+    if not match:
+        return True
+    if inclusive:
+        return entry[0] in match or entry[1] in match
+    return all(match_item in entry for match_item in match)
+
+
+def _split_device_name(device_name):
+    """
+    Splits a full device name into the lower case tango host and device
+    path, e.g. 'hzgpp05vme0:10000/p05/ZMX/mono.01' into
+    ('hzgpp05vme0:10000', 'p05/zmx/mono.01'). The host is '' if not given.
+    """
+    tango_host, _, path = device_name.lower().partition('/')
+    if ':' not in tango_host:
+        return '', device_name.lower()
+    return tango_host, path
+
+
+def _path_suffixes(path):
+    """
+    Returns the device path from each of its components on, e.g.
+    ['p05/zmx/mono.01', 'zmx/mono.01', 'mono.01'].
+    """
+    components = path.split('/')
+    return ['/'.join(components[n:]) for n in range(len(components))]
+
+
+def _search_matches(key, loc, motorgroup=None, motorname=None, tango_host=None, zmx_slot=None, device=None):
+    """
+    Checks a motor against the criteria of TangoMotorDb.search_motors().
+    """
+    if motorgroup is not None and not key[0].startswith(motorgroup):
+        return False
+    if motorname is not None and not key[1].startswith(motorname):
+        return False
+    if zmx_slot is not None and int(loc['zmx_slot']) != int(zmx_slot):
+        return False
+    names = [_split_device_name(_decode(loc[column])) for column in ['zmx_device_name', 'oms_device_name']]
+    if tango_host is not None:
+        tango_host = tango_host.lower()
+        if not any(host == tango_host or (':' not in tango_host and host.startswith(tango_host + ':'))
+                   for host, path in names):
+            return False
+    if device is not None:
+        if not any(suffix.startswith(device.lower()) for host, path in names for suffix in _path_suffixes(path)):
+            return False
+    return True
+
+
+def _decode(value):
+    """
+    h5py >= 3 returns variable length strings as bytes.
+    """
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _nan_to_none(timestamp):
+    timestamp = float(timestamp)
+    return None if numpy.isnan(timestamp) else timestamp
+
+
+def _format_timestamp(timestamp):
+    if timestamp is None:
+        return 'unknown'
+    return str(datetime.fromtimestamp(timestamp))[:19]
+
+
+class MotorDiff():
+    """
+    Result of TangoMotorDb.diff(). The values of motors found in both sources
+    are held in aligned arrays with one row per motor and one column per
+    attribute. mismatch marks the differing values.
+
+    keys        [(motorgroup, motorname)] of the rows
+    attributes  [(subgroup, attribute)] of the columns
+    values_a    values of the first source
+    values_b    values of the second source
+    mismatch    <bool> array, True where the values differ
+    only_a      [(motorgroup, motorname)] of motors only in the first source
+    only_b      [(motorgroup, motorname)] of motors only in the second source
+    failed      [motorgroup, motorname, error] of motors which could not be
+                read
+    """
+
+    def __init__(self, keys, attributes, values_a, values_b, mismatch, only_a=None, only_b=None,
+                 failed=None, labels=None):
+        self.keys = keys
+        self.attributes = attributes
+        self.values_a = values_a
+        self.values_b = values_b
+        self.mismatch = mismatch
+        self.only_a = only_a or []
+        self.only_b = only_b or []
+        self.failed = failed or []
+        self.labels = labels or ['a', 'b']
+
+    record_columns = ['motorgroup', 'motorname', 'subgroup', 'attribute', 'value_a', 'value_b']
+
+    def __len__(self):
+        return int(self.mismatch.sum())
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def rows(self):
+        """
+        Returns [motorgroup, motorname, subgroup, attribute, value a,
+        value b] of each difference.
+        """
+        rows, columns = numpy.nonzero(self.mismatch)
+        return [list(self.keys[row]) + list(self.attributes[column])
+                + [self.values_a[row, column], self.values_b[row, column]]
+                for row, column in zip(rows.tolist(), columns.tolist())]
+
+    def records(self):
+        """
+        Yields each difference as a flat record {column: value} with the
+        columns of record_columns.
+        """
+        for diff in self.rows():
+            yield dict(zip(self.record_columns, diff))
+
+    def export(self, filepath, file_format=None):
+        """
+        Writes the differences to a jsonl, csv or parquet file, see
+        TangoMotorDb.export_database(). Returns the number of differences.
+        """
+        from tango_motor_db_export import write_records
+        return write_records(self.records(), filepath, self.record_columns, file_format)
+
+    def motors(self):
+        """
+        Returns [motorgroup, motorname] of all motors with differences.
+        """
+        return [list(self.keys[row]) for row in numpy.nonzero(self.mismatch.any(axis=1))[0]]
+
+    def filter(self, motorgroup=None, motorname=None, subgroup=None, attribute=None):
+        """
+        Returns a MotorDiff limited to the given motors and attributes. Each
+        argument is a name or a list of names.
+        """
+        def select(items, position, names):
+            if names is None:
+                return numpy.ones(len(items), dtype=bool)
+            names = [names] if isinstance(names, str) else names
+            return numpy.array([item[position] in names for item in items], dtype=bool).reshape(len(items))
+
+        rows = select(self.keys, 0, motorgroup) & select(self.keys, 1, motorname)
+        columns = select(self.attributes, 0, subgroup) & select(self.attributes, 1, attribute)
+
+        def motors(keys):
+            return [key for key, keep in zip(keys, select(keys, 0, motorgroup) & select(keys, 1, motorname))
+                    if keep]
+
+        return MotorDiff([key for key, keep in zip(self.keys, rows) if keep],
+                         [attr for attr, keep in zip(self.attributes, columns) if keep],
+                         self.values_a[rows][:, columns], self.values_b[rows][:, columns],
+                         self.mismatch[rows][:, columns], motors(self.only_a), motors(self.only_b),
+                         motors(self.failed), self.labels)
+
+    def info(self):
+        """
+        Pretty prints the differences.
+        """
+        print('=' * 79)
+        print('Compared {} motors: {} differences in {} motors.'.format(len(self.keys), len(self),
+                                                                        len(self.motors())))
+        for motor in self.only_a:
+            print('[MISSING] {:<10} {:<20} only in {}'.format(motor[0], motor[1], self.labels[0]))
+        for motor in self.only_b:
+            print('[MISSING] {:<10} {:<20} only in {}'.format(motor[0], motor[1], self.labels[1]))
+        for motor in self.failed:
+            print('[FAILED] {:<10} {:<20} {}'.format(motor[0], motor[1], motor[2]))
+        if len(self) != 0:
+            print('-' * 79 + '\n')
+            print('{:<30}|{:<20}|{:<20}'.format('Axis name', self.labels[0][:20], self.labels[1][:20]))
+            print('-' * 30 + '+' + '-' * 20 + '+' + '-' * 20)
+            for diff in self.rows():
+                ax_name = '({}/{}/{})'.format(diff[0], diff[1], diff[3])
+                print('{:<30}|{:<20}|{:<20}'.format(ax_name, str(diff[4]), str(diff[5])))
+        print('=' * 79)
+
+
+class _GroupLayout():
+    """
+    Original database layout with one scalar dataset per motor parameter:
+    motorgroup/motorname/{zmx,oms,loc}/attribute. Each group carries a
+    'last edit' timestamp attribute.
+    """
+    name = 'group'
+
+    def __init__(self, h5db_file, attributes):
+        """
+        param: h5db_file <h5py.File>
+            open database file
+        param: attributes <dict>
+            attribute names of each motor subgroup
+        """
+        self._file = h5db_file
+        self._attributes = attributes
+
+    def entries(self):
+        return [[motorgroup, motorname]
+                for motorgroup in self._file.keys() for motorname in self._file[motorgroup].keys()]
+
+    def exists(self, motorgroup, motorname):
+        return motorgroup + '/' + motorname in self._file
+
+    def read_motor(self, motorgroup, motorname, subgroups=None):
+        """
+        Returns the motor parameters as {subgroup: {attribute: value}}.
+        """
+        p2 = motorgroup + '/' + motorname
+        return {m_subg: {attr: _decode(self._file[p2 + '/' + m_subg + '/' + attr][()])
+                         for attr in self._attributes[m_subg]}
+                for m_subg in (subgroups or self._attributes)}
+
+    def read_motors(self):
+        """
+        Returns all motors as {(motorgroup, motorname): motor}.
+        """
+        return {(motorgroup, motorname): self.read_motor(motorgroup, motorname)
+                for motorgroup, motorname in self.entries()}
+
+    def read_locs(self):
+        """
+        Returns the 'loc' entries of all motors as {motorgroup: {motorname: loc}}.
+        """
+        locs = {}
+        for motorgroup, motorname in self.entries():
+            locs.setdefault(motorgroup, {})[motorname] = self.read_motor(motorgroup, motorname, ['loc'])['loc']
+        return locs
+
+    def iter_records(self, chunk_size=1024):
+        """
+        Yields all motors as flat {column: value} records, one motor at a time.
+        """
+        for motorgroup, motorname in self.entries():
+            record = {'motorgroup': motorgroup, 'motorname': motorname}
+            for values in self.read_motor(motorgroup, motorname).values():
+                record.update(values)
+            record['last_edit'] = self.last_edit(motorgroup, motorname)
+            yield record
+
+    def last_edit(self, motorgroup, motorname):
+        """
+        Returns the time of the last edit as unix timestamp or None.
+        """
+        timestamp = _decode(self._file[motorgroup + '/' + motorname].attrs.get('last edit'))
+        if timestamp is None:
+            return None
+        return datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').timestamp()
+
+    def write_motors(self, motors, timestamps=None):
+        """
+        Writes motor subgroups. Existing datasets are replaced.
+
+        param: motors <list>
+            (motorgroup, motorname, motor, subgroups) tuples. motor is a
+            {subgroup: {attribute: value}} dictionary, only the listed
+            subgroups are written.
+        param: timestamps <list> (optional)
+            unix timestamps of the edits. default: now
+        """
+        for n, (motorgroup, motorname, motor, subgroups) in enumerate(motors):
+            timestamp = datetime.now() if timestamps is None else datetime.fromtimestamp(timestamps[n])
+            p1 = motorgroup  # database directory path 1st level
+            p2 = p1 + '/' + motorname  # database directory path 2nd level
+            for m_subg in subgroups:
+                p3 = p2 + '/' + m_subg  # database directory path 3rd level
+                group = self._file.require_group(p3)
+                for attr in self._attributes[m_subg]:
+                    if attr in group:
+                        del group[attr]
+                    group.create_dataset(attr, data=motor[m_subg][attr])
+                for path in [p1, p2, p3]:  # update timestamps in database
+                    self._file[path].attrs.create('last edit', str(timestamp)[:19], dtype="S19")
+
+    def delete_motor(self, motorgroup, motorname):
+        del self._file[motorgroup][motorname]
+
+    def find_entries(self, match, inclusive=False):
+        return [entry for entry in self.entries() if _matches(entry, match, inclusive)]
+
+    def search(self, motorgroup=None, motorname=None, tango_host=None, zmx_slot=None, device=None):
+        """
+        Returns {(motorgroup, motorname): loc} of the motors matching all
+        given criteria. This layout has no index, all 'loc' entries are read.
+        """
+        return {(group, name): loc for group, motors in self.read_locs().items() for name, loc in motors.items()
+                if _search_matches((group, name), loc, motorgroup, motorname, tango_host, zmx_slot, device)}
+
+    def history_at(self, motorgroup, motorname, timestamp):
+        raise Exception('Error: No history in this database layout. Use migrate_database().')
+
+    def history_between(self, start, stop, motorgroup=None, motorname=None):
+        raise Exception('Error: No history in this database layout. Use migrate_database().')
+
+    def history_motors(self, timestamp):
+        raise Exception('Error: No history in this database layout. Use migrate_database().')
+
+
+class _TableLayout():
+    """
+    Compact database layout. All motors are rows of the compound dataset
+    'motors', strings are stored once in the dataset 'strings' and referenced
+    by their index. A motor is read or updated with a single row operation.
+    Writes find rows and strings in the index, new strings are appended and
+    only their keys are inserted into the index 'strings'.
+
+    Every write also appends the new rows to the dataset 'history', deleted
+    motors get a row with the 'deleted' flag set. History rows are never
+    modified. The group 'history_index' holds the edit time of each history
+    row and runs of revision rows sorted by motor and time. New revisions
+    form an unsorted tail, which is sorted into a new run once it holds
+    history_run_size rows. A run is merged with the previous runs when it
+    reaches their size, start_writer() and migrate_database() merge all
+    runs. A write appends to the index and does not rewrite it. A point in
+    time query of a motor is a binary search in each run and reads a
+    single history row.
+
+    The group 'index' holds sorted (key, row) tables of motorgroup,
+    motorname, tango host, zmx slot and device name. When a write changes
+    any of these columns, the keys of the changed rows are removed and
+    inserted again. Lookups by these keys are binary
+    searches in the index and read only the matching rows, the motor table
+    and the string table are not loaded. The index 'strings' finds the
+    string table entry of a name. String keys are truncated to
+    index_key_size bytes, matches are checked against the full strings.
+    """
+    name = 'table'
+    string_columns = ['motorgroup', 'motorname', 'AxisName', 'zmx_device_name', 'oms_device_name']
+    column_types = {'PreferentialDirection': 'i8',
+                    'RunCurrent': 'f8',
+                    'StopCurrent': 'f8',
+                    'StepWidth': 'i8',
+                    'Acceleration': 'i8',
+                    'BaseRate': 'i8',
+                    'Conversion': 'f8',
+                    'SettleTime': 'f8',
+                    'SlewRate': 'i8',
+                    'StepBacklash': 'i8',
+                    'UnitLimitMax': 'f8',
+                    'UnitLimitMin': 'f8',
+                    'zmx_slot': 'i8'}
+    index_names = ['motorgroup', 'motorname', 'tango_host', 'zmx_slot', 'device']
+    index_columns = ['motorgroup', 'motorname', 'zmx_slot', 'zmx_device_name', 'oms_device_name']
+    index_key_size = 64
+    history_run_size = 1024
+
+    def __init__(self, h5db_file, attributes):
+        """
+        param: h5db_file <h5py.File>
+            open database file
+        param: attributes <dict>
+            attribute names of each motor subgroup
+        """
+        self._file = h5db_file
+        self._attributes = attributes
+        self._rows = None
+        self._strings = None
+        self._string_ids = None
+        self._new_strings = []
+        self._new_string_ids = {}
+        self._history_index = None
+        self._search_index = None
+        self._string_index = None
+        self._string_cache = {}
+
+    @classmethod
+    def create(cls, h5db_file, attributes):
+        """
+        Creates the tables in an empty database file.
+        """
+        columns = ['motorgroup', 'motorname'] + [attr for m_subg in attributes for attr in attributes[m_subg]]
+        dtype = [(column, 'i4' if column in cls.string_columns else cls.column_types[column])
+                 for column in columns] + [('last_edit', 'f8')]
+        h5db_file.attrs['layout'] = cls.name
+        h5db_file.create_dataset('motors', shape=(0,), maxshape=(None,), chunks=(256,), dtype=dtype)
+        h5db_file.create_dataset('strings', shape=(0,), maxshape=(None,), chunks=(1024,),
+                                 dtype=h5py.string_dtype())
+        layout = cls(h5db_file, attributes)
+        layout._get_history(create=True)
+        layout._write_index()
+        layout._write_string_index()
+        layout._write_history_index()
+        return layout
+
+    def _load(self):
+        """
+        Reads the string table and the row numbers of all motors.
+        """
+        if self._rows is None:
+            self._strings = [_decode(string) for string in self._file['strings'][:]]
+            self._string_ids = {string: n for n, string in enumerate(self._strings)}
+            table = self._file['motors']
+            keys = zip(table['motorgroup'], table['motorname']) if len(table) else []
+            self._rows = {(self._strings[motorgroup], self._strings[motorname]): row
+                          for row, (motorgroup, motorname) in enumerate(keys)}
+
+    def _string_id(self, string):
+        """
+        Returns the index of a string in the string table. Known strings are
+        found in the string index, new strings are appended by
+        _flush_strings().
+        """
+        string_id = self._new_string_ids.get(string)
+        if string_id is None:
+            string_id = self._find_string(string)
+        if string_id is None:
+            string_id = len(self._file['strings']) + len(self._new_strings)
+            self._new_strings.append(string)
+            self._new_string_ids[string] = string_id
+            self._string_cache[string_id] = string
+            if self._strings is not None:
+                self._strings.append(string)
+                self._string_ids[string] = string_id
+        return string_id
+
+    def _flush_strings(self):
+        """
+        Appends the new strings to the string table and inserts their keys
+        into the string index.
+        """
+        if self._new_strings:
+            strings = self._file['strings']
+            start = len(strings)
+            strings.resize((start + len(self._new_strings),))
+            strings[start:] = self._new_strings
+            if 'index/strings' in self._file:
+                keys = numpy.array([(string.encode()[:self.index_key_size], start + n)
+                                    for n, string in enumerate(self._new_strings)],
+                                   dtype=self._get_string_index().dtype)
+                self._string_index, first = self._merge_keys(self._get_string_index(), keys)
+                self._store_index('index/strings', self._string_index, first)
+            self._new_strings = []
+            self._new_string_ids = {}
+        if 'index/strings' not in self._file:
+            # file written without string index
+            self._write_string_index()
+
+    @staticmethod
+    def _merge_keys(index, keys):
+        """
+        Inserts entries into a sorted (key, value) index. Returns the new
+        index and the position of the first inserted entry.
+        """
+        keys = numpy.sort(keys)
+        positions = numpy.searchsorted(index['key'], keys['key'], 'right')
+        return numpy.insert(index, positions, keys), int(positions[0]) if len(keys) else len(index)
+
+    def _store_index(self, path, index, first=0):
+        """
+        Stores a sorted index in the dataset path. Entries before first are
+        unchanged and not written.
+        """
+        dataset = self._file[path]
+        if len(dataset) != len(index):
+            dataset.resize((len(index),))
+        if first < len(index):
+            dataset[first:] = index[first:]
+
+    def _write_string_index(self):
+        """
+        Stores the string table as sorted (key, string id) array in
+        'index/strings'. The dataset is created if the file has none yet,
+        not possible in SWMR mode.
+        """
+        self._load()
+        keys = [(string.encode()[:self.index_key_size], n) for n, string in enumerate(self._strings)]
+        self._string_index = numpy.sort(numpy.array(
+            keys, dtype=[('key', 'S{}'.format(self.index_key_size)), ('id', 'i4')]))
+        if 'index/strings' not in self._file:
+            self._file.create_dataset('index/strings', shape=(0,), maxshape=(None,), chunks=(1024,),
+                                      dtype=self._string_index.dtype)
+        dataset = self._file['index/strings']
+        dataset.resize((len(self._string_index),))
+        dataset[:] = self._string_index
+
+    def _find_string(self, string):
+        """
+        Returns the string table index of a string or None. Uses the loaded
+        string table or otherwise the string index.
+        """
+        if self._string_ids is not None:
+            return self._string_ids.get(string)
+        if 'index/strings' not in self._file:
+            self._load()
+            return self._string_ids.get(string)
+        string_index = self._get_string_index()
+        key = string.encode()[:self.index_key_size]
+        start = numpy.searchsorted(string_index['key'], key, 'left')
+        stop = numpy.searchsorted(string_index['key'], key, 'right')
+        for string_id in string_index['id'][start:stop].tolist():
+            if self._string(string_id) == string:
+                return string_id
+        return None
+
+    def _get_string_index(self):
+        """
+        Returns the string index as sorted (key, string id) array.
+        """
+        if self._string_index is None:
+            self._string_index = self._file['index/strings'][:]
+        return self._string_index
+
+    def _record_to_motor(self, record, subgroups=None):
+        """
+        Converts a table row to {subgroup: {attribute: value}}.
+        """
+        motor = {}
+        for m_subg in (subgroups or self._attributes):
+            motor[m_subg] = {}
+            for attr in self._attributes[m_subg]:
+                value = record[attr].item()
+                motor[m_subg][attr] = self._string(value) if attr in self.string_columns else value
+        return motor
+
+    def _string(self, string_id):
+        """
+        Returns a string of the string table. Reads only this string if the
+        table is not loaded.
+        """
+        if self._strings is not None:
+            return self._strings[string_id]
+        if string_id not in self._string_cache:
+            self._string_cache[string_id] = _decode(self._file['strings'][string_id])
+        return self._string_cache[string_id]
+
+    def _fetch_strings(self, records):
+        """
+        Reads the strings referenced by table rows in one operation, unless
+        the string table is loaded.
+        """
+        if self._strings is not None:
+            return
+        string_ids = set()
+        for column in self.string_columns:
+            if column in records.dtype.names:
+                string_ids.update(records[column].tolist())
+        missing = sorted(string_ids - set(self._string_cache))
+        if missing:
+            self._string_cache.update(zip(missing, [_decode(string) for string in self._file['strings'][missing]]))
+
+    def _fill_record(self, record, motor, subgroups):
+        for m_subg in subgroups:
+            for attr in self._attributes[m_subg]:
+                value = motor[m_subg][attr]
+                record[attr] = self._string_id(_decode(value)) if attr in self.string_columns else value
+
+    def entries(self):
+        self._load()
+        return [[motorgroup, motorname] for motorgroup, motorname in self._rows]
+
+    def exists(self, motorgroup, motorname):
+        return self._find_row(motorgroup, motorname) is not None
+
+    def read_motor(self, motorgroup, motorname, subgroups=None):
+        """
+        Returns the motor parameters as {subgroup: {attribute: value}}.
+        """
+        row = self._find_row(motorgroup, motorname)
+        if row is None:
+            raise KeyError((motorgroup, motorname))
+        return self._record_to_motor(self._file['motors'][row], subgroups)
+
+    def read_motors(self):
+        """
+        Returns all motors as {(motorgroup, motorname): motor}. The table is
+        read at once.
+        """
+        self._load()
+        return {(self._strings[record['motorgroup']], self._strings[record['motorname']]):
+                self._record_to_motor(record) for record in self._file['motors'][:]}
+
+    def read_locs(self):
+        """
+        Returns the 'loc' entries of all motors as {motorgroup: {motorname: loc}}.
+        """
+        self._load()
+        locs = {}
+        for record in self._file['motors'][:]:
+            motorgroup = self._strings[record['motorgroup']]
+            motorname = self._strings[record['motorname']]
+            locs.setdefault(motorgroup, {})[motorname] = self._record_to_motor(record, ['loc'])['loc']
+        return locs
+
+    def iter_records(self, chunk_size=1024):
+        """
+        Yields all motors as flat {column: value} records. The table is read
+        chunk_size rows at a time.
+        """
+        self._load()
+        table = self._file['motors']
+        for start in range(0, len(table), chunk_size):
+            for record in table[start:start + chunk_size]:
+                flat = {'motorgroup': self._strings[record['motorgroup']],
+                        'motorname': self._strings[record['motorname']]}
+                for values in self._record_to_motor(record).values():
+                    flat.update(values)
+                flat['last_edit'] = _nan_to_none(record['last_edit'])
+                yield flat
+
+    def last_edit(self, motorgroup, motorname):
+        """
+        Returns the time of the last edit as unix timestamp.
+        """
+        row = self._find_row(motorgroup, motorname)
+        if row is None:
+            raise KeyError((motorgroup, motorname))
+        return float(self._file['motors'][row]['last_edit'])
+
+    def write_motors(self, motors, timestamps=None):
+        """
+        Writes motor subgroups. Existing rows are updated in place, new motors
+        are appended in one operation.
+
+        param: motors <list>
+            (motorgroup, motorname, motor, subgroups) tuples. motor is a
+            {subgroup: {attribute: value}} dictionary, only the listed
+            subgroups are written. New motors must supply all subgroups.
+        param: timestamps <list> (optional)
+            unix timestamps of the edits. default: now
+        """
+        table = self._file['motors']
+        start = len(table)
+        new_records = []
+        added = {}
+        revisions = []
+        # rows whose index keys changed -> record
+        reindexed = {}
+        for n, (motorgroup, motorname, motor, subgroups) in enumerate(motors):
+            timestamp = datetime.now().timestamp() if timestamps is None else timestamps[n]
+            row = added.get((motorgroup, motorname))
+            if row is None:
+                row = self._find_row(motorgroup, motorname)
+            if row is None:
+                record = numpy.zeros(1, dtype=table.dtype)
+                record['motorgroup'] = self._string_id(motorgroup)
+                record['motorname'] = self._string_id(motorname)
+                self._fill_record(record, motor, self._attributes)
+                record['last_edit'] = timestamp
+                added[(motorgroup, motorname)] = start + len(new_records)
+                if self._rows is not None:
+                    self._rows[(motorgroup, motorname)] = start + len(new_records)
+                new_records.append(record)
+            elif row >= start:
+                # motor was added earlier in this batch
+                record = new_records[row - start]
+                self._fill_record(record, motor, subgroups)
+                record['last_edit'] = timestamp
+            else:
+                record = table[row:row + 1]
+                keys = record[self.index_columns].copy()
+                self._fill_record(record, motor, subgroups)
+                record['last_edit'] = timestamp
+                table[row:row + 1] = record
+                if keys[0] != record[self.index_columns][0]:
+                    reindexed[row] = record
+            revisions.append(record.copy())
+        self._flush_strings()
+        if new_records:
+            table.resize((start + len(new_records),))
+            table[start:] = numpy.concatenate(new_records)
+        if revisions:
+            self._append_history(numpy.concatenate(revisions))
+        reindexed.update((start + n, record) for n, record in enumerate(new_records))
+        if reindexed:
+            rows = sorted(reindexed)
+            self._update_index(rows, numpy.concatenate([reindexed[row] for row in rows]))
+
+    def delete_motor(self, motorgroup, motorname):
+        """
+        Removes a row. The last row takes its place to keep the table compact.
+        """
+        table = self._file['motors']
+        row = self._find_row(motorgroup, motorname)
+        if row is None:
+            raise KeyError((motorgroup, motorname))
+        revision = table[row:row + 1]
+        revision['last_edit'] = datetime.now().timestamp()
+        self._append_history(revision, deleted=True)
+        last = len(table) - 1
+        if row != last:
+            record = table[last:last + 1]
+            table[row:row + 1] = record
+            if self._rows is not None:
+                self._rows[(self._string(record['motorgroup'][0].item()),
+                            self._string(record['motorname'][0].item()))] = row
+        if self._rows is not None:
+            del self._rows[(motorgroup, motorname)]
+        table.resize((last,))
+        self._update_index([row], moved=(last, row) if row != last else None)
+
+    def _build_index(self):
+        """
+        Returns {index name: (key, row) array sorted by key} of all motors.
+        """
+        self._load()
+        table = self._file['motors']
+        columns = table.fields(self.index_columns)[:] if len(table) else numpy.zeros(0, table.dtype)
+        return self._index_keys(columns, range(len(columns)))
+
+    def _index_keys(self, records, rows):
+        """
+        Returns {index name: (key, row) array sorted by key} of table records
+        stored in the given rows.
+        """
+        self._fetch_strings(records)
+        keys = {name: [] for name in self.index_names}
+        for row, record in zip(rows, records):
+            for name in ['motorgroup', 'motorname']:
+                keys[name].append((self._string(record[name].item()).encode(), row))
+            keys['zmx_slot'].append((int(record['zmx_slot']), row))
+            devices = set()
+            for column in ['zmx_device_name', 'oms_device_name']:
+                tango_host, path = _split_device_name(self._string(record[column].item()))
+                if tango_host:
+                    keys['tango_host'].append((tango_host.encode(), row))
+                devices.update(_path_suffixes(path))
+            keys['device'] += [(device.encode(), row) for device in devices]
+        index = {}
+        for name in self.index_names:
+            key_type = 'i8' if name == 'zmx_slot' else 'S{}'.format(self.index_key_size)
+            index[name] = numpy.unique(numpy.array(keys[name], dtype=[('key', key_type), ('row', 'i4')]))
+        return index
+
+    def _update_index(self, rows, records=None, moved=None):
+        """
+        Removes the index entries of table rows and inserts the keys of their
+        new records. Only the part of each index behind the first change is
+        rewritten. Files without stored index are indexed completely.
+
+        param: rows <list>
+            changed table rows
+        param: records <numpy.ndarray> (optional)
+            new records of the rows. default: rows were deleted
+        param: moved <tuple> (optional)
+            (old row, new row) of a row which was moved
+        """
+        if not all('index/' + name in self._file for name in self.index_names):
+            self._write_index()
+            return
+        keys = self._index_keys(records, rows) if records is not None else {}
+        for name in self.index_names:
+            index = self._get_index(name)
+            removed = numpy.isin(index['row'], rows)
+            changed = removed | (index['row'] == moved[0]) if moved is not None else removed
+            first = int(numpy.argmax(changed)) if changed.any() else len(index)
+            index = index[~removed]
+            if moved is not None:
+                index['row'][index['row'] == moved[0]] = moved[1]
+            if name in keys:
+                index, inserted = self._merge_keys(index, keys[name])
+                first = min(first, inserted)
+            self._store_index('index/' + name, index, first)
+            self._search_index[name] = index
+
+    def _write_index(self):
+        """
+        Rebuilds the search index and stores it in the file. The datasets are
+        created if the file has no index yet, not possible in SWMR mode.
+        """
+        self._search_index = self._build_index()
+        for name, index in self._search_index.items():
+            path = 'index/' + name
+            if path not in self._file:
+                self._file.create_dataset(path, shape=(0,), maxshape=(None,), chunks=(1024,), dtype=index.dtype)
+            dataset = self._file[path]
+            dataset.resize((len(index),))
+            dataset[:] = index
+
+    def _get_index(self, name):
+        """
+        Returns an index as sorted (key, row) array. Files without stored
+        index are indexed in memory.
+        """
+        if self._search_index is None:
+            self._search_index = {}
+        if name not in self._search_index:
+            if 'index/' + name in self._file:
+                self._search_index[name] = self._file['index/' + name][:]
+            else:
+                self._search_index = self._build_index()
+        return self._search_index[name]
+
+    def _index_rows(self, name, value, prefix=False):
+        """
+        Returns the rows whose key equals or, if prefix is set, starts with
+        value. Long keys are truncated, so the rows are candidates which
+        have to be checked.
+        """
+        index = self._get_index(name)
+        if name == 'zmx_slot':
+            key = int(value)
+            prefix = False
+        else:
+            key = value.encode()[:self.index_key_size]
+            prefix = prefix and len(key) < self.index_key_size
+        start = numpy.searchsorted(index['key'], key, 'left')
+        # 0xff does not occur in utf-8, it sorts after every continuation
+        stop = numpy.searchsorted(index['key'], key + b'\xff', 'left') if prefix \
+            else numpy.searchsorted(index['key'], key, 'right')
+        return numpy.unique(index['row'][start:stop])
+
+    def _read_rows(self, rows):
+        """
+        Returns {(motorgroup, motorname): record} of table rows. Only these
+        rows and their names are read.
+        """
+        if len(rows) == 0:
+            return {}
+        records = self._file['motors'][numpy.sort(rows).tolist()]
+        self._fetch_strings(records)
+        return {(self._string(record['motorgroup'].item()), self._string(record['motorname'].item())): record
+                for record in records}
+
+    def _find_row(self, motorgroup, motorname):
+        """
+        Returns the table row of a motor or None. Uses the loaded row numbers
+        or otherwise the index.
+        """
+        if self._rows is not None:
+            return self._rows.get((motorgroup, motorname))
+        rows = numpy.intersect1d(self._index_rows('motorgroup', motorgroup),
+                                 self._index_rows('motorname', motorname))
+        for row in rows.tolist():
+            record = self._file['motors'][row]
+            if (self._string(record['motorgroup'].item()), self._string(record['motorname'].item())) == \
+                    (motorgroup, motorname):
+                return row
+        return None
+
+    def find_entries(self, match, inclusive=False):
+        """
+        Returns the [motorgroup, motorname] entries matching the search terms
+        of _retrieve_database_entries(). Rows are looked up in the index.
+        """
+        if not match:
+            return self.entries()
+        terms = match if inclusive else match[:1]
+        rows = [self._index_rows(name, term) for term in terms for name in ['motorgroup', 'motorname']]
+        entries = [list(key) for key in self._read_rows(numpy.unique(numpy.concatenate(rows)))]
+        return [entry for entry in entries if _matches(entry, match, inclusive)]
+
+    def search(self, motorgroup=None, motorname=None, tango_host=None, zmx_slot=None, device=None):
+        """
+        Returns {(motorgroup, motorname): loc} of the motors matching all
+        given criteria, see TangoMotorDb.search_motors(). Each criterion is
+        a binary search in the index.
+        """
+        criteria = {'motorgroup': motorgroup, 'motorname': motorname, 'tango_host': tango_host,
+                    'zmx_slot': zmx_slot, 'device': device}
+        rows = None
+        for name, value in criteria.items():
+            if value is None:
+                continue
+            if name == 'tango_host':
+                # a host without port matches any port
+                exact = ':' in value
+                found = self._index_rows(name, value.lower() if exact else value.lower() + ':', prefix=not exact)
+            else:
+                found = self._index_rows(name, value.lower() if name == 'device' else value,
+                                         prefix=name != 'zmx_slot')
+            rows = found if rows is None else numpy.intersect1d(rows, found)
+        if rows is None:
+            rows = numpy.arange(len(self._file['motors']))
+        motors = {key: self._record_to_motor(record, ['loc'])['loc']
+                  for key, record in self._read_rows(rows).items()}
+        return {key: loc for key, loc in motors.items() if _search_matches(key, loc, **criteria)}
+
+    def _get_history(self, create=False):
+        """
+        Returns the history dataset. It is created on first write for files
+        which were created without history.
+        """
+        if 'history' not in self._file:
+            if not create:
+                return None
+            dtype = numpy.dtype(self._file['motors'].dtype.descr + [('deleted', 'u1')])
+            self._file.create_dataset('history', shape=(0,), maxshape=(None,), chunks=(1024,), dtype=dtype)
+        return self._file['history']
+
+    def _append_history(self, records, deleted=False):
+        """
+        Appends motor rows as new revisions to the history and their edit
+        times to the history index.
+        """
+        history = self._get_history(create=True)
+        revisions = numpy.zeros(len(records), dtype=history.dtype)
+        for column in records.dtype.names:
+            revisions[column] = records[column]
+        revisions['deleted'] = deleted
+        start = len(history)
+        valid = self._history_index_valid(start)
+        history.resize((start + len(revisions),))
+        history[start:] = revisions
+        self._history_index = None
+        if not valid:
+            self._write_history_index()
+            return
+        self._append_dataset('history_index/times', self._history_times(revisions))
+        if len(history) - len(self._file['history_index/motor_keys']) >= self.history_run_size:
+            self._add_history_run()
+
+    def _append_dataset(self, path, values):
+        dataset = self._file[path]
+        start = len(dataset)
+        if len(values):
+            dataset.resize((start + len(values),))
+            dataset[start:] = values
+
+    @staticmethod
+    def _history_keys(revisions):
+        """
+        Motor keys of history rows: motorgroup and motorname string ids.
+        """
+        return (revisions['motorgroup'].astype('i8') << 32) | revisions['motorname'].astype('i8')
+
+    @staticmethod
+    def _history_times(revisions):
+        """
+        Edit times of history rows. Revisions without known edit time (e.g.
+        migrated) are the oldest.
+        """
+        return numpy.nan_to_num(revisions['last_edit'], nan=0.)
+
+    def _history_revisions(self, start=0):
+        """
+        Returns (motor keys, times, rows) of the history rows from start on,
+        sorted by motor, time and row.
+        """
+        history = self._get_history()
+        if history is None or len(history) <= start:
+            return numpy.zeros(0, dtype='i8'), numpy.zeros(0), numpy.zeros(0, dtype='i8')
+        revisions = history.fields(['motorgroup', 'motorname', 'last_edit'])[start:]
+        keys, times = self._history_keys(revisions), self._history_times(revisions)
+        rows = numpy.arange(start, start + len(revisions))
+        order = numpy.lexsort((rows, times, keys))
+        return keys[order], times[order], rows[order]
+
+    def _build_history_index(self):
+        """
+        Builds the history index from the key columns of the history, all
+        revisions are in one run.
+        """
+        keys, times, rows = self._history_revisions()
+        row_times = numpy.zeros(len(rows))
+        row_times[rows] = times
+        return {'motor_keys': keys, 'motor_times': times, 'motor_rows': rows,
+                'runs': numpy.zeros(1 if len(rows) else 0, dtype='i8'), 'times': row_times}
+
+    def _write_history_index(self):
+        """
+        Rebuilds the history index and stores it. The datasets are created,
+        not possible in SWMR mode.
+        """
+        if 'history_index' in self._file:
+            del self._file['history_index']
+        for name, values in self._build_history_index().items():
+            self._file.create_dataset('history_index/' + name, data=values, maxshape=(None,), chunks=(4096,))
+        self._history_index = None
+
+    def _add_history_run(self):
+        """
+        Sorts the unsorted tail of the history into a new run of the history
+        index. The last runs are merged while the previous run is not longer
+        than them, so there are about log2(history length) runs.
+        """
+        start = len(self._file['history_index/motor_keys'])
+        for name, values in zip(['motor_keys', 'motor_times', 'motor_rows'], self._history_revisions(start)):
+            self._append_dataset('history_index/' + name, values)
+        self._append_dataset('history_index/runs', numpy.array([start]))
+        runs = self._file['history_index/runs'][:].tolist() + [len(self._file['history_index/motor_keys'])]
+        first = len(runs) - 2
+        while first > 0 and runs[first] - runs[first - 1] <= runs[-1] - runs[first]:
+            first -= 1
+        self._merge_history_runs(first)
+
+    def _merge_history_runs(self, first=0):
+        """
+        Merges the runs of the history index from run first on into one run.
+        """
+        runs = self._file['history_index/runs']
+        if len(runs) - first < 2:
+            return
+        start = int(runs[first])
+        names = ['motor_keys', 'motor_times', 'motor_rows']
+        keys, times, rows = [self._file['history_index/' + name][start:] for name in names]
+        order = numpy.lexsort((rows, times, keys))
+        for name, values in zip(names, [keys, times, rows]):
+            self._file['history_index/' + name][start:] = values[order]
+        runs.resize((first + 1,))
+        self._history_index = None
+
+    def _compact_history_index(self):
+        """
+        Sorts the unsorted tail into the history index and merges all runs.
+        """
+        history = self._get_history()
+        if history is not None and len(history) > len(self._file['history_index/motor_keys']):
+            self._add_history_run()
+        self._merge_history_runs()
+
+    def _history_index_valid(self, length):
+        """
+        Whether the stored history index covers the first length history
+        rows. Files written without history index are indexed in memory.
+        """
+        return 'history_index/runs' in self._file and self._file['history_index/times'].shape[0] == length
+
+    def _history_part(self, name, start=None, stop=None):
+        """
+        Returns a slice of a history index array. Whole arrays are kept in
+        memory, slices are read from the file.
+        """
+        if self._history_index is None:
+            history = self._get_history()
+            self._history_index = {} if self._history_index_valid(0 if history is None else len(history)) \
+                else self._build_history_index()
+        if name in self._history_index:
+            return self._history_index[name][start:stop]
+        if start is None and stop is None:
+            self._history_index[name] = self._file['history_index/' + name][:]
+            return self._history_index[name]
+        if start == stop:
+            return numpy.zeros(0, dtype=self._file['history_index/' + name].dtype)
+        return self._file['history_index/' + name][start:stop]
+
+    def _history_tail(self):
+        """
+        Returns (motor keys, times, rows) of the revisions which are not in
+        a run yet, sorted by motor, time and row.
+        """
+        start = len(self._history_part('motor_keys'))
+        if 'tail' not in self._history_index:
+            self._history_index['tail'] = self._history_revisions(start)
+        return self._history_index['tail']
+
+    def _history_entries(self):
+        """
+        Returns (motor keys, times, rows) of all revisions sorted by motor,
+        time and row.
+        """
+        entries = [self._history_part(name) for name in ['motor_keys', 'motor_times', 'motor_rows']]
+        tail = self._history_tail()
+        if len(self._history_part('runs')) < 2 and len(tail[2]) == 0:
+            return entries
+        keys, times, rows = [numpy.concatenate(parts) for parts in zip(entries, tail)]
+        order = numpy.lexsort((rows, times, keys))
+        return keys[order], times[order], rows[order]
+
+    def _history_key(self, motorgroup, motorname):
+        group_id = self._find_string(motorgroup)
+        name_id = self._find_string(motorname)
+        if group_id is None or name_id is None:
+            return None
+        return (group_id << 32) | name_id
+
+    def history_at(self, motorgroup, motorname, timestamp):
+        """
+        Returns (motor, revision timestamp or None if unknown) of the last
+        revision of a motor at the given time or None if the motor did not
+        exist.
+        """
+        key = self._history_key(motorgroup, motorname)
+        if key is None:
+            return None
+        motor_keys = self._history_part('motor_keys')
+        runs = self._history_part('runs').tolist() + [len(motor_keys)]
+        # (time, row) of the last revision in each run and in the tail
+        found = []
+        for run_start, run_stop in zip(runs[:-1], runs[1:]):
+            first = run_start + int(numpy.searchsorted(motor_keys[run_start:run_stop], key, 'left'))
+            last = run_start + int(numpy.searchsorted(motor_keys[run_start:run_stop], key, 'right'))
+            times = self._history_part('motor_times', first, last)
+            position = int(numpy.searchsorted(times, timestamp, 'right')) - 1
+            if position >= 0:
+                row = self._history_part('motor_rows', first + position, first + position + 1)[0]
+                found.append((float(times[position]), int(row)))
+        tail_keys, tail_times, tail_rows = self._history_tail()
+        selected = numpy.nonzero((tail_keys == key) & (tail_times <= timestamp))[0]
+        if len(selected):
+            found.append((float(tail_times[selected[-1]]), int(tail_rows[selected[-1]])))
+        if not found:
+            return None
+        row = max(found)[1]
+        records = self._file['history'][row:row + 1]
+        self._fetch_strings(records)
+        record = records[0]
+        if record['deleted']:
+            return None
+        return self._record_to_motor(record), _nan_to_none(record['last_edit'])
+
+    def history_between(self, start, stop, motorgroup=None, motorname=None):
+        """
+        Returns all revisions between two times, ordered by time, as
+        (revision, previous revision of the same motor or None) tuples of
+        {'motorgroup', 'motorname', 'timestamp', 'deleted', 'motor'}
+        dictionaries.
+        """
+        times = self._history_part('times')
+        if numpy.all(times[1:] >= times[:-1]):
+            # edits were written in time order
+            rows = numpy.arange(numpy.searchsorted(times, start, 'left'), numpy.searchsorted(times, stop, 'right'))
+        else:
+            rows = numpy.nonzero((times >= start) & (times <= stop))[0]
+            rows = rows[numpy.argsort(times[rows], kind='stable')]
+        if len(rows) == 0:
+            return []
+        motor_keys, motor_times, motor_rows = self._history_entries()
+        positions = numpy.empty(len(times), dtype='i8')
+        positions[motor_rows] = numpy.arange(len(motor_rows))
+        positions = positions[rows]
+        keys = motor_keys[positions]
+        if motorgroup is not None:
+            group_id = self._find_string(motorgroup)
+            selected = (keys >> 32) == (-1 if group_id is None else group_id)
+            rows, positions, keys = rows[selected], positions[selected], keys[selected]
+        if motorname is not None:
+            name_id = self._find_string(motorname)
+            selected = (keys & 0xffffffff) == (-1 if name_id is None else name_id)
+            rows, positions, keys = rows[selected], positions[selected], keys[selected]
+        if len(rows) == 0:
+            return []
+        # previous revision of the same motor
+        has_previous = (positions > 0) & (motor_keys[positions - 1] == keys)
+        previous_rows = numpy.where(has_previous, motor_rows[positions - 1], -1)
+        needed = numpy.unique(numpy.concatenate([rows, previous_rows[has_previous]]))
+        history = self._file['history'][needed.tolist()]
+        self._fetch_strings(history)
+        records = dict(zip(needed.tolist(), history))
+
+        def revision(row):
+            record = records[row]
+            return {'motorgroup': self._string(record['motorgroup'].item()),
+                    'motorname': self._string(record['motorname'].item()),
+                    'timestamp': _nan_to_none(record['last_edit']),
+                    'deleted': bool(record['deleted']),
+                    'motor': self._record_to_motor(record)}
+
+        return [(revision(row), revision(previous) if previous >= 0 else None)
+                for row, previous in zip(rows.tolist(), previous_rows.tolist())]
+
+    def history_motors(self, timestamp):
+        """
+        Returns all motors which existed at the given time as
+        {(motorgroup, motorname): motor}.
+        """
+        self._load()
+        motor_keys, motor_times, motor_rows = self._history_entries()
+        positions = numpy.nonzero(motor_times <= timestamp)[0]
+        keys = motor_keys[positions]
+        # last revision of each motor
+        positions = positions[numpy.append(keys[1:] != keys[:-1], True)] if len(keys) else positions
+        rows = numpy.sort(motor_rows[positions])
+        motors = {}
+        for record in (self._file['history'][rows] if len(rows) else []):
+            if not record['deleted']:
+                motors[(self._strings[record['motorgroup']], self._strings[record['motorname']])] = \
+                    self._record_to_motor(record)
+        return motors
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(main())
     TM = TangoMotorDb()
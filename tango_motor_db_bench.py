@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy
+
+from tango_motor_db import TangoMotorDb, _GroupLayout, _TableLayout
+from tango_motor_db_sim import SimulatedBackend, ZMX_DEFAULTS, OMS_DEFAULTS
+
+
+TANGO_HOSTS = ['hzgpp05vme0:10000', 'hzgpp05vme1:10000', 'hzgpp05vme2:10000']
+
+
+def synthetic_motors(n_motors, group_size=50, seed=0):
+    """
+    Returns n_motors random motors as (motorgroup, motorname, motor,
+    subgroups) tuples, as taken by the write_motors() of the database
+    layouts. Motors are spread over the known tango hosts.
+
+    param: n_motors <int>
+        number of motors
+    param: group_size <int> (optional)
+        number of motors per motorgroup
+        default: 50
+    param: seed <int> (optional)
+        seed of the random values
+        default: 0
+    """
+    rng = random.Random(seed)
+    motors = []
+    for n in range(n_motors):
+        tango_host = TANGO_HOSTS[n % len(TANGO_HOSTS)]
+        zmx = dict(ZMX_DEFAULTS, AxisName='axis{:05d}'.format(n),
+                   RunCurrent=round(rng.uniform(0.2, 2.), 2), StopCurrent=round(rng.uniform(0., 0.5), 2))
+        oms = dict(OMS_DEFAULTS, Conversion=round(rng.uniform(-1e6, 1e6), 1), SlewRate=rng.randrange(1000, 50000),
+                   UnitLimitMax=round(rng.uniform(0., 100.), 3), UnitLimitMin=round(rng.uniform(-100., 0.), 3))
+        loc = {'zmx_slot': n % 32 + 1,
+               'zmx_device_name': '{}/p05/ZMX/sim.{:05d}'.format(tango_host, n),
+               'oms_device_name': '{}/p05/motor/sim.{:05d}'.format(tango_host, n)}
+        motors.append(('group{:03d}'.format(n // group_size), 'motor{:05d}'.format(n),
+                       {'zmx': zmx, 'oms': oms, 'loc': loc}, ['zmx', 'oms', 'loc']))
+    return motors
+
+
+def create_database(filepath, motors, layout='table'):
+    """
+    Writes motors into a new database file.
+
+    param: filepath <str>
+        path of the new database file. Must not exist.
+    param: motors <list>
+        motors as returned by synthetic_motors()
+    param: layout <str> (optional)
+        'table' or 'group'
+        default: 'table'
+    """
+    attributes = TangoMotorDb()._attributes()
+    if layout == _TableLayout.name:
+        with h5py.File(filepath, 'w-', libver='latest') as h5db_file:
+            _TableLayout.create(h5db_file, attributes).write_motors(motors)
+    elif layout == _GroupLayout.name:
+        with h5py.File(filepath, 'w-') as h5db_file:
+            _GroupLayout(h5db_file, attributes).write_motors(motors)
+    else:
+        raise Exception('Error: Unknown layout: {}'.format(layout))
+
+
+def percentiles(latencies):
+    """
+    Returns the 50th, 90th and 99th percentile of latencies in ms.
+    """
+    return dict(zip(['p50', 'p90', 'p99'], numpy.percentile(numpy.array(latencies) * 1000., [50, 90, 99])))
+
+
+class MotorDbBenchmark():
+    """
+    Measures how the database and tango access paths of TangoMotorDb scale
+    with the number of motors, the database layout and the tango latency.
+
+    For each layout and size a synthetic database is created and the
+    following operations are timed:
+        create                      writing all motors in one batch
+        retrieve_entries            _retrieve_database_entries() of a group
+        query_database              random motors
+        query_database (session)    random motors within a session
+        write_cache_to_database     random motors, overwrite_all
+        check_consistency           several groups against simulated servers
+
+    check_consistency is run once for each simulated tango latency.
+
+    Each result is a dictionary with the layout, the number of motors, the
+    operation, the simulated tango latency in ms (check_consistency only),
+    the number of calls, operations per second, latency percentiles in ms
+    and the file size after the operation.
+    """
+
+    def __init__(self, sizes=(100, 1000, 10000), layouts=('group', 'table'), repeats=200,
+                 latencies=(0., 0.002, 0.02), check_motors=200, directory=None, seed=0):
+        """
+        param: sizes <list> (optional)
+            numbers of motors of the synthetic databases
+            default: 100, 1000, 10000
+        param: layouts <list> (optional)
+            database layouts to compare
+            default: 'group', 'table'
+        param: repeats <int> (optional)
+            number of calls of each database operation
+            default: 200
+        param: latencies <list> (optional)
+            request times in s of the simulated devices
+            default: 0, 0.002, 0.02
+        param: check_motors <int> (optional)
+            number of motors checked by check_consistency
+            default: 200
+        param: directory <str> (optional)
+            directory for the database files
+            default: temporary directory
+        param: seed <int> (optional)
+            seed of the random motors and calls
+            default: 0
+        """
+        self.sizes = sizes
+        self.layouts = layouts
+        self.repeats = repeats
+        self.latencies = latencies
+        self.check_motors = check_motors
+        self.directory = directory
+        self.seed = seed
+        self.results = []
+
+    def run(self, verbose=True):
+        """
+        Runs all benchmarks. Returns the results.
+
+        param: verbose <boolean>
+            Print results to console as they come in.
+            default: True
+        """
+        self.results = []
+        if verbose:
+            self._print_header()
+        if self.directory is None:
+            with tempfile.TemporaryDirectory() as directory:
+                self._run(directory, verbose)
+        else:
+            self._run(self.directory, verbose)
+        return self.results
+
+    def _run(self, directory, verbose):
+        for n_motors in self.sizes:
+            motors = synthetic_motors(n_motors, seed=self.seed)
+            for layout in self.layouts:
+                filepath = os.path.join(directory, 'bench_{}_{}.h5'.format(layout, n_motors))
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                for result in self._bench(filepath, layout, motors):
+                    self.results.append(result)
+                    if verbose:
+                        self._print_result(result)
+
+    def _bench(self, filepath, layout, motors):
+        """
+        Yields the results of all operations on one database.
+        """
+        n_motors = len(motors)
+        rng = random.Random(self.seed)
+
+        def result(operation, latencies, calls=None, tango_latency=None):
+            calls = len(latencies) if calls is None else calls
+            return dict({'layout': layout, 'motors': n_motors, 'operation': operation,
+                         'tango_latency': None if tango_latency is None else tango_latency * 1000.,
+                         'calls': calls, 'ops': calls / sum(latencies) if sum(latencies) else float('inf'),
+                         'size': os.path.getsize(filepath)}, **percentiles(latencies))
+
+        start = time.perf_counter()
+        create_database(filepath, motors, layout)
+        yield result('create', [time.perf_counter() - start], calls=n_motors)
+
+        motor_db = TangoMotorDb()
+        motor_db._motor_db_filepath = filepath
+        samples = [rng.choice(motors) for n in range(self.repeats)]
+        groups = sorted(set(motor[0] for motor in motors))
+
+        yield result('retrieve_entries', self._timed(
+            [lambda: motor_db._retrieve_database_entries(rng.choice(groups)) for n in range(self.repeats)]))
+        yield result('query_database', self._timed(
+            [lambda motor=motor: motor_db.query_database(motor[0], motor[1], verbose=False)
+             for motor in samples]))
+        with motor_db.session():
+            yield result('query_database (session)', self._timed(
+                [lambda motor=motor: motor_db.query_database(motor[0], motor[1], verbose=False)
+                 for motor in samples]))
+
+        def write(motor):
+            motor_db.query_database(motor[0], motor[1], verbose=False)
+            motor_db.modify_cache('RunCurrent', round(rng.uniform(0.2, 2.), 2), verbose=False)
+            motor_db.write_cache_to_database(overwrite_all=True, verbose=False)
+
+        yield result('write_cache_to_database', self._timed(
+            [lambda motor=motor: write(motor) for motor in samples]))
+
+        # whole groups until check_motors are reached
+        group_sizes = numpy.cumsum([len([motor for motor in motors if motor[0] == group]) for group in groups])
+        check_groups = groups[:int(numpy.searchsorted(group_sizes, self.check_motors)) + 1]
+        checked = int(group_sizes[len(check_groups) - 1])
+        for tango_latency in self.latencies:
+            backend = SimulatedBackend(latency=tango_latency)
+            for motorgroup, motorname, motor, subgroups in motors:
+                backend.add_motor(motor['loc']['zmx_device_name'], motor['loc']['oms_device_name'],
+                                  motor['zmx'], motor['oms'])
+            with backend.installed():
+                latencies = self._timed([lambda: motor_db.check_consistency(*check_groups, tango_hosts='all',
+                                                                            verbose=False)] * 3)
+            yield result('check_consistency', latencies, calls=checked * len(latencies),
+                         tango_latency=tango_latency)
+
+    @staticmethod
+    def _timed(calls):
+        """
+        Calls each function and returns the latencies in s.
+        """
+        latencies = []
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    @staticmethod
+    def _print_header():
+        print('=' * 109)
+        print('{:<7}{:>7}  {:<27}{:>10}{:>7}{:>11}{:>9}{:>9}{:>9}{:>12}'.format(
+            'Layout', 'Motors', 'Operation', 'Tango ms', 'Calls', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'Size kB'))
+        print('-' * 109)
+
+    @staticmethod
+    def _print_result(result):
+        tango_latency = '' if result['tango_latency'] is None else '{:.1f}'.format(result['tango_latency'])
+        print('{:<7}{:>7}  {:<27}{:>10}{:>7}{:>11.1f}{:>9.3f}{:>9.3f}{:>9.3f}{:>12.1f}'.format(
+            result['layout'], result['motors'], result['operation'], tango_latency, result['calls'], result['ops'],
+            result['p50'], result['p90'], result['p99'], result['size'] / 1024.))
+
+    def write_csv(self, filepath):
+        """
+        Writes the results to a csv file.
+        """
+        columns = ['layout', 'motors', 'operation', 'tango_latency', 'calls', 'ops', 'p50', 'p90', 'p99', 'size']
+        with open(filepath, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, columns)
+            writer.writeheader()
+            writer.writerows(self.results)
+
+
+def main(argv=None):
+    """
+    Command line interface.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark of the P05 motor database.')
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='numbers of motors, comma separated. default: 100,1000,10000')
+    parser.add_argument('--layouts', default='group,table',
+                        help='database layouts, comma separated. default: group,table')
+    parser.add_argument('--repeats', type=int, default=200, help='calls of each database operation')
+    parser.add_argument('--latencies', default='0,0.002,0.02',
+                        help='simulated tango latencies in s, comma separated. default: 0,0.002,0.02')
+    parser.add_argument('--check-motors', type=int, default=200, help='motors checked by check_consistency')
+    parser.add_argument('--dir', help='directory for the database files. default: temporary directory')
+    parser.add_argument('--csv', help='write results to this csv file')
+    args = parser.parse_args(argv)
+    benchmark = MotorDbBenchmark([int(size) for size in args.sizes.split(',')], args.layouts.split(','),
+                                 args.repeats, [float(latency) for latency in args.latencies.split(',')],
+                                 args.check_motors, args.dir)
+    benchmark.run()
+    if args.csv:
+        benchmark.write_csv(args.csv)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+
+Command line interface of the P05 motor database, e.g.
+
+    tango_motor_db_cli.py list slit_eh2
+    tango_motor_db_cli.py list --host hzgpp05vme0 --slot 19
+    tango_motor_db_cli.py show dmm cp --at '2021-07-29 16:00'
+    tango_motor_db_cli.py diff database '2021-07-29'
+    tango_motor_db_cli.py check dmm --host hzgpp05vme0:10000
+    tango_motor_db_cli.py restore dmm cp --dry-run
+
+Only argparse is loaded at start. The database modules (numpy, h5py) are
+imported by the commands, PyTango only by commands which contact the tango
+servers. This keeps --help fast, but does not make the database commands
+fast: list and show take about 0.4 s, of which about 0.1 s is the start of
+the interpreter and 0.2 s the import of numpy and h5py, the lookup itself
+takes 10-30 ms for 500 motors. The database file is given by --db or the
+environment variable P05_MOTOR_DB.
+
+Exit codes: 0 success, 1 differences, failures or errors, 2 usage errors.
+"""
+import argparse
+import json
+import sys
+
+
+def _parse_slots(slots):
+    """
+    Converts a slot list like '1-16,18' to a list of ints.
+    """
+    zmx_slots = []
+    for item in slots.split(','):
+        first, _, last = item.partition('-')
+        zmx_slots += list(range(int(first), int(last or first) + 1))
+    return zmx_slots
+
+
+def _motor_db(args):
+    from tango_motor_db import TangoMotorDb
+    return TangoMotorDb(motor_db_filepath=args.db)
+
+
+def cmd_list(args):
+    motor_db = _motor_db(args)
+    if args.host or args.slot is not None or args.device:
+        if args.terms:
+            entries = set(map(tuple, motor_db._retrieve_database_entries(*args.terms, inclusive=args.inclusive)))
+        for motorgroup, motorname, loc in motor_db.search_motors(
+                tango_host=args.host, zmx_slot=args.slot, device=args.device, verbose=False):
+            if not args.terms or (motorgroup, motorname) in entries:
+                print('{:<12}{:<16}{:>5}  {}  {}'.format(motorgroup, motorname, loc['zmx_slot'],
+                                                         loc['zmx_device_name'], loc['oms_device_name']))
+        return 0
+    for motorgroup, motorname in motor_db._retrieve_database_entries(*args.terms, inclusive=args.inclusive):
+        print('{:<12}{}'.format(motorgroup, motorname))
+    return 0
+
+
+def cmd_show(args):
+    motor_db = _motor_db(args)
+    if args.at is not None:
+        motor = motor_db.query_history(args.motorgroup, args.motorname, args.at, verbose=not args.json)
+    else:
+        with motor_db._open_database('r') as db:
+            motor = db.read_motor(args.motorgroup, args.motorname) \
+                if db.exists(args.motorgroup, args.motorname) else None
+        if motor is None:
+            print('Error: {} {} not in database.'.format(args.motorgroup, args.motorname), file=sys.stderr)
+        elif not args.json:
+            motor_db.query_database(args.motorgroup, args.motorname, cache=False)
+    if motor is None:
+        return 1
+    if args.json:
+        print(json.dumps({m_subg: {attr: value.item() if hasattr(value, 'item') else value
+                                   for attr, value in attrs.items()} for m_subg, attrs in motor.items()}))
+    return 0
+
+
+def cmd_diff(args):
+    motor_db = _motor_db(args)
+    result = motor_db.diff(args.source_a, args.source_b, args.group, args.name, max_workers=args.workers,
+                           timeout=args.timeout, verbose=not args.quiet)
+    if args.out:
+        result.export(args.out)
+    return 1 if len(result) or result.only_a or result.only_b or result.failed else 0
+
+
+def cmd_snapshot(args):
+    report = _motor_db(args).snapshot_servers(args.hosts, args.slots, args.workers)
+    return 1 if report['failed'] else 0
+
+
+def _tango_hosts(args):
+    """
+    --host all selects all known hosts, no --host the default tango host of
+    the database.
+    """
+    if args.hosts and 'all' in args.hosts:
+        return 'all'
+    return args.hosts
+
+
+def cmd_restore(args):
+    report = _motor_db(args).restore_servers(*args.terms, tango_hosts=_tango_hosts(args), dry_run=args.dry_run,
+                                             max_workers=args.workers, timeout=args.timeout)
+    return 1 if report['mismatch'] or report['failed'] else 0
+
+
+def cmd_check(args):
+    report = _motor_db(args).check_consistency(*args.terms, tango_hosts=_tango_hosts(args),
+                                               max_workers=args.workers, timeout=args.timeout,
+                                               verbose=not args.quiet)
+    return 1 if report['delta'] or report['failed'] else 0
+
+
+def cmd_watch(args):
+    from tango_motor_db_watch import DriftWatch
+    DriftWatch(_motor_db(args), args.hosts or 'all', args.interval, use_events=not args.no_events).run()
+    return 0
+
+
+def cmd_export(args):
+    _motor_db(args).export_database(args.file, *args.terms, inclusive=args.inclusive, file_format=args.format,
+                                    timestamps=not args.no_timestamps)
+    return 0
+
+
+def cmd_import(args):
+    _motor_db(args).import_database(args.file, file_format=args.format)
+    return 0
+
+
+def _add_server_arguments(parser):
+    parser.add_argument('--host', action='append', dest='hosts',
+                        help="tango host incl. port, can be repeated, 'all' for all known hosts. "
+                             "default: hzgpp05vme0:10000")
+    parser.add_argument('--workers', type=int, default=4, help='motors contacted concurrently per tango host')
+    parser.add_argument('--timeout', type=float, default=3., help='tango timeout in s of each device')
+
+
+def get_parser():
+    """
+    Returns the argument parser of all commands.
+    """
+    parser = argparse.ArgumentParser(description='P05 OMS/ZMX motor database.')
+    parser.add_argument('--db', help='path to the database file. default: $P05_MOTOR_DB')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_list = subparsers.add_parser('list', help='list motors')
+    parser_list.add_argument('terms', nargs='*', help='motorgroups or motornames')
+    parser_list.add_argument('--inclusive', action='store_true', help='list motors matching any term')
+    parser_list.add_argument('--host', help='tango host, with or without port')
+    parser_list.add_argument('--slot', type=int, help='zmx slot')
+    parser_list.add_argument('--device', help="beginning of a device name or of a part of it, e.g. 'eh2'")
+    parser_list.set_defaults(function=cmd_list)
+
+    parser_show = subparsers.add_parser('show', help='show the parameters of a motor')
+    parser_show.add_argument('motorgroup')
+    parser_show.add_argument('motorname')
+    parser_show.add_argument('--at', help="point in time of the database history, e.g. '2021-07-29 16:00'")
+    parser_show.add_argument('--json', action='store_true', help='print parameters as JSON')
+    parser_show.set_defaults(function=cmd_show)
+
+    parser_diff = subparsers.add_parser(
+        'diff', help='compare two of: database, server, a database file or a point in time')
+    parser_diff.add_argument('source_a', nargs='?', default='database', help='default: database')
+    parser_diff.add_argument('source_b', nargs='?', default='server', help='default: server')
+    parser_diff.add_argument('--group', help='only compare motors in this group')
+    parser_diff.add_argument('--name', help='only compare motors with this name')
+    parser_diff.add_argument('--out', help='write differences to a jsonl, csv or parquet file')
+    parser_diff.add_argument('--workers', type=int, default=16, help='motors read concurrently')
+    parser_diff.add_argument('--timeout', type=float, default=3., help='tango timeout in s of each device')
+    parser_diff.add_argument('-q', '--quiet', action='store_true', help='only set the exit code')
+    parser_diff.set_defaults(function=cmd_diff)
+
+    parser_snapshot = subparsers.add_parser(
+        'snapshot', help='store the parameters of all motors on the servers in the database')
+    parser_snapshot.add_argument('--host', action='append', dest='hosts',
+                                 help='tango host incl. port, can be repeated. default: all known hosts')
+    parser_snapshot.add_argument('--workers', type=int, default=16, help='number of motors read concurrently')
+    parser_snapshot.add_argument('--slots', type=_parse_slots,
+                                 help="zmx slots, e.g. '1-16,18'. default: all slots of the crate")
+    parser_snapshot.set_defaults(function=cmd_snapshot)
+
+    parser_restore = subparsers.add_parser(
+        'restore', help='write the database parameters to the servers and the ZMX EPROMs')
+    parser_restore.add_argument('terms', nargs='*', help='motorgroups or motornames. Required without --host')
+    _add_server_arguments(parser_restore)
+    parser_restore.add_argument('--dry-run', action='store_true', help='only show what would be written')
+    parser_restore.set_defaults(function=cmd_restore)
+
+    parser_check = subparsers.add_parser('check', help='compare the database with the servers')
+    parser_check.add_argument('terms', nargs='*', help='motorgroups or motornames')
+    _add_server_arguments(parser_check)
+    parser_check.add_argument('-q', '--quiet', action='store_true', help='only set the exit code')
+    parser_check.set_defaults(function=cmd_check)
+
+    parser_watch = subparsers.add_parser(
+        'watch', help='watch the servers for parameters which differ from the database')
+    parser_watch.add_argument('--host', action='append', dest='hosts',
+                              help='tango host incl. port, can be repeated. default: all known hosts')
+    parser_watch.add_argument('--interval', type=float, default=10.,
+                              help='time in s between reads of devices without change events')
+    parser_watch.add_argument('--no-events', action='store_true', help='poll all devices')
+    parser_watch.set_defaults(function=cmd_watch)
+
+    parser_export = subparsers.add_parser('export', help='write motors to a jsonl, csv or parquet file')
+    parser_export.add_argument('file', help="output file, '-' for JSON Lines on stdout")
+    parser_export.add_argument('terms', nargs='*', help='motorgroups or motornames. default: all motors')
+    parser_export.add_argument('--inclusive', action='store_true', help='export motors matching any term')
+    parser_export.add_argument('--format', choices=['jsonl', 'csv', 'parquet'],
+                               help='default: from the file extension')
+    parser_export.add_argument('--no-timestamps', action='store_true', help='leave out the time of the last edit')
+    parser_export.set_defaults(function=cmd_export)
+
+    parser_import = subparsers.add_parser('import', help='write the motors of a jsonl, csv or parquet file')
+    parser_import.add_argument('file')
+    parser_import.add_argument('--format', choices=['jsonl', 'csv', 'parquet'],
+                               help='default: from the file extension')
+    parser_import.set_defaults(function=cmd_import)
+    return parser
+
+
+def main(argv=None):
+    """
+    Command line interface.
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    if args.command == 'restore' and not args.terms and not args.hosts:
+        # a bare restore would rewrite every motor of the default host
+        parser.error('restore needs motorgroups, motornames or --host')
+    try:
+        return args.function(args)
+    except KeyboardInterrupt:
+        return 1
+    except Exception as e:
+        print(str(e) if str(e).startswith('Error') else 'Error: {}'.format(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+"""
+import csv
+import json
+import sys
+
+from tango_motor_db import _TableLayout
+
+
+FORMATS = {'.jsonl': 'jsonl', '.json': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+
+
+def guess_format(filepath, file_format=None):
+    """
+    Returns the file format, 'jsonl', 'csv' or 'parquet', from the file
+    extension unless it is given.
+    """
+    if file_format is not None:
+        if file_format not in FORMATS.values():
+            raise Exception('Error: Unknown file format: {}'.format(file_format))
+        return file_format
+    for extension, file_format in FORMATS.items():
+        if filepath.lower().endswith(extension):
+            return file_format
+    raise Exception('Error: Unknown file format of {}. Use one of: {}'.format(
+        filepath, ', '.join(FORMATS)))
+
+
+def _plain(value):
+    """
+    numpy scalars are not json serializable.
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _parse(column, value):
+    """
+    Converts a csv field to the type of the database column.
+    """
+    if value == '' and column not in _TableLayout.string_columns:
+        return None
+    column_type = _TableLayout.column_types.get(column)
+    if column_type == 'i8':
+        return int(value)
+    if column_type == 'f8':
+        return float(value)
+    return value
+
+
+def _open(filepath, mode):
+    """
+    '-' is stdin or stdout.
+    """
+    if filepath == '-':
+        return open((sys.stdin if mode == 'r' else sys.stdout).fileno(), mode, newline='', closefd=False)
+    return open(filepath, mode, newline='')
+
+
+def write_records(records, filepath, columns, file_format=None, chunk_size=1024):
+    """
+    Writes flat records ({column: value} dictionaries) one by one, records
+    are never held in memory at once. Returns the number of records.
+
+    param: records <iterable>
+        records to write
+    param: filepath <str>
+        output file, '-' is stdout (jsonl and csv only)
+    param: columns <list>
+        column names, in this order
+    param: file_format <str> (optional)
+        'jsonl', 'csv' or 'parquet'
+        default: from the file extension
+    param: chunk_size <int> (optional)
+        number of records per parquet row group
+        default: 1024
+    """
+    file_format = 'jsonl' if filepath == '-' and file_format is None else guess_format(filepath, file_format)
+    if file_format == 'parquet':
+        return _write_parquet(records, filepath, columns, chunk_size)
+    count = 0
+    with _open(filepath, 'w') as output_file:
+        if file_format == 'csv':
+            writer = csv.DictWriter(output_file, columns, extrasaction='ignore')
+            writer.writeheader()
+        for record in records:
+            if file_format == 'csv':
+                writer.writerow({column: _plain(record.get(column)) for column in columns})
+            else:
+                output_file.write(json.dumps({column: _plain(record.get(column)) for column in columns}) + '\n')
+            count += 1
+    return count
+
+
+def read_records(filepath, file_format=None, chunk_size=1024):
+    """
+    Yields the flat records of a file one by one. Values of csv files are
+    converted to the column types of the database.
+
+    param: filepath <str>
+        input file, '-' is stdin (jsonl and csv only)
+    param: file_format <str> (optional)
+        'jsonl', 'csv' or 'parquet'
+        default: from the file extension
+    param: chunk_size <int> (optional)
+        number of records read at once from parquet files
+        default: 1024
+    """
+    file_format = 'jsonl' if filepath == '-' and file_format is None else guess_format(filepath, file_format)
+    if file_format == 'parquet':
+        yield from _read_parquet(filepath, chunk_size)
+        return
+    with _open(filepath, 'r') as input_file:
+        if file_format == 'csv':
+            for n, record in enumerate(csv.DictReader(input_file)):
+                try:
+                    yield {column: _parse(column, value) for column, value in record.items()}
+                except ValueError as e:
+                    raise Exception('Error: Record {} of {}: {}'.format(n + 1, filepath, e))
+            return
+        for n, line in enumerate(input_file):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise Exception('Error: Line {} of {}: {}'.format(n + 1, filepath, e))
+
+
+def _import_pyarrow():
+    """
+    pyarrow is only needed for parquet files.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('Error: Parquet files need pyarrow. Use jsonl or csv instead.')
+    return pyarrow, pyarrow.parquet
+
+
+def _write_parquet(records, filepath, columns, chunk_size):
+    pyarrow, parquet = _import_pyarrow()
+    types = {'i8': pyarrow.int64(), 'f8': pyarrow.float64()}
+    schema = pyarrow.schema([(column, types.get(_TableLayout.column_types.get(column), pyarrow.string()))
+                             for column in columns])
+    # columns without a database type, e.g. the values of a diff, are strings
+    untyped = [column for column in columns if column not in _TableLayout.column_types]
+    count = 0
+    chunk = []
+    with parquet.ParquetWriter(filepath, schema) as writer:
+        for record in records:
+            record = {column: _plain(record.get(column)) for column in columns}
+            for column in untyped:
+                if record[column] is not None and not isinstance(record[column], str):
+                    record[column] = str(record[column])
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                writer.write_table(pyarrow.Table.from_pylist(chunk, schema))
+                count += len(chunk)
+                chunk = []
+        if chunk or count == 0:
+            writer.write_table(pyarrow.Table.from_pylist(chunk, schema))
+            count += len(chunk)
+    return count
+
+
+def _read_parquet(filepath, chunk_size):
+    pyarrow, parquet = _import_pyarrow()
+    for batch in parquet.ParquetFile(filepath).iter_batches(batch_size=chunk_size):
+        yield from batch.to_pylist()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+
+Scenario runs of the motor database against simulated devices, e.g.
+
+    tango_motor_db_scenarios.py
+    tango_motor_db_scenarios.py restore watch_events
+
+Each scenario works on a temporary database of synthetic motors and a
+SimulatedBackend filled from it, no tango server is contacted and PyTango
+is not needed. Exit code 1 if a scenario failed.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+from tango_motor_db import TangoMotorDb
+from tango_motor_db_bench import synthetic_motors, create_database
+from tango_motor_db_sim import SimulatedBackend
+from tango_proxy_pool import TangoProxyPool, proxy_pool
+
+
+def _check(condition, message):
+    if not condition:
+        raise Exception('Error: {}'.format(message))
+
+
+def _wait_for(condition, timeout=5.):
+    """
+    Waits until condition() is true. Returns False after timeout s.
+    """
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _setup(directory, n_motors=60, events=False):
+    """
+    Returns a TangoMotorDb of a new database with synthetic motors and a
+    backend with their devices.
+    """
+    filepath = os.path.join(directory, 'motors.h5')
+    create_database(filepath, synthetic_motors(n_motors))
+    motor_db = TangoMotorDb(motor_db_filepath=filepath)
+    backend = SimulatedBackend(events=events)
+    backend.add_from_database(motor_db)
+    return motor_db, backend
+
+
+def _motor_devices(motor_db, backend, n):
+    """
+    Returns (motorgroup, motorname, zmx device, oms device) of the n-th
+    motor of the database.
+    """
+    motorgroup, motorname = motor_db._retrieve_database_entries()[n]
+    with motor_db._open_database('r') as db:
+        loc = db.read_motor(motorgroup, motorname, ['loc'])['loc']
+    return (motorgroup, motorname, backend.devices[backend._key(loc['zmx_device_name'])],
+            backend.devices[backend._key(loc['oms_device_name'])])
+
+
+def scenario_pool_health(directory):
+    """
+    A device goes down: reads return the last value as stale, check_health()
+    reports it, and it is read again after reconnecting.
+    """
+    motor_db, backend = _setup(directory, 3)
+    motorgroup, motorname, zmx, oms = _motor_devices(motor_db, backend, 0)
+    pool = TangoProxyPool(retry_delay=0.05, max_retry_delay=0.05, connect_timeout=1.)
+    with backend.installed(pool):
+        value, stale = pool.read(oms.name(), 'SlewRate')
+        _check(value == oms.attributes['SlewRate'] and not stale, 'first read not fresh')
+        oms.down = True
+        _check(not pool.check_health()[oms.name().lower()], 'down device reported alive')
+        value, stale = pool.read(oms.name(), 'SlewRate')
+        _check(value == oms.attributes['SlewRate'] and stale, 'down device not served from last value')
+        reads = oms.counters['read']
+        pool.read(oms.name(), 'SlewRate')
+        _check(oms.counters['read'] == reads, 'failed device contacted before retry')
+        oms.down = False
+        _check(_wait_for(lambda: not pool.read(oms.name(), 'SlewRate')[1]), 'device did not reconnect')
+        _check(all(pool.check_health().values()), 'devices not healthy after reconnect')
+
+
+def scenario_consistency(directory):
+    """
+    Changed server values and unreachable devices are reported by
+    check_consistency() and check_consistency_async().
+    """
+    motor_db, backend = _setup(directory)
+    motorgroup, motorname, zmx, oms = _motor_devices(motor_db, backend, 5)
+    oms.attributes['SlewRate'] += 1
+    down_group, down_name, down_zmx, down_oms = _motor_devices(motor_db, backend, 7)
+    down_zmx.down = True
+    with backend.installed():
+        reports = [motor_db.check_consistency(tango_hosts='all', timeout=1., verbose=False),
+                   asyncio.run(motor_db.check_consistency_async(tango_hosts='all', timeout=1., verbose=False))]
+    for report in reports:
+        _check([[diff[0], diff[1], diff[2]] for diff in report['delta']] == [[motorgroup, motorname, 'SlewRate']],
+               'unexpected differences: {}'.format(report['delta']))
+        _check([[entry[0], entry[1]] for entry in report['failed']] == [[down_group, down_name]],
+               'unexpected failures: {}'.format(report['failed']))
+
+
+def scenario_restore(directory):
+    """
+    After a crate lost its parameters, restore_servers() writes the
+    database values and the ZMX EPROMs, so they survive a power cycle. A
+    dry run writes nothing.
+    """
+    motor_db, backend = _setup(directory)
+    changed = [_motor_devices(motor_db, backend, n) for n in [1, 2, 3]]
+    for motorgroup, motorname, zmx, oms in changed:
+        zmx.attributes['RunCurrent'] = zmx.eprom['RunCurrent'] = 0.
+        oms.attributes['Conversion'] = 1.
+    with backend.installed():
+        report = motor_db.restore_servers(tango_hosts='all', dry_run=True, timeout=1., verbose=False)
+        _check(backend.counters()['write'] == 0, 'dry run wrote to the devices')
+        _check(len(report['restored']) == len(changed), 'dry run found {} motors'.format(len(report['restored'])))
+        report = motor_db.restore_servers(tango_hosts='all', timeout=1., verbose=False)
+        _check(len(report['restored']) == len(changed) and not report['mismatch'] and not report['failed'],
+               'restore failed: {}'.format(report))
+        _check(backend.counters()['eprom'] == len(changed), 'EPROMs not written')
+        for device in backend.devices.values():
+            device.power_cycle()
+        report = motor_db.check_consistency(tango_hosts='all', timeout=1., verbose=False)
+        _check(not report['delta'], 'values lost by power cycle: {}'.format(report['delta']))
+
+
+def scenario_watch_events(directory):
+    """
+    DriftWatch raises an alert when a server value changes and when it is
+    set back, for devices with change events and for polled devices.
+    """
+    from tango_motor_db_watch import DriftWatch
+    motor_db, backend = _setup(directory, events=True)
+    motorgroup, motorname, zmx, oms = _motor_devices(motor_db, backend, 4)
+    polled = _motor_devices(motor_db, backend, 9)
+    polled[3].events = False
+    alerts = []
+    with backend.installed():
+        watch = DriftWatch(motor_db, 'all', poll_interval=0.05, alert=alerts.append)
+        watch.start(verbose=False)
+        try:
+            _check(oms.name() in watch._subscriptions, 'no change events subscribed')
+            _check(polled[3].name() in watch._polled, 'device without events not polled')
+            for device, key in [(oms, (motorgroup, motorname)), (polled[3], polled[:2])]:
+                value = device.attributes['SlewRate']
+                device.write_attribute('SlewRate', value + 1)
+                _check(_wait_for(lambda: [key[0], key[1], 'SlewRate', value, value + 1] in watch.drifts()),
+                       'drift of {} not detected'.format(device.name()))
+                device.write_attribute('SlewRate', value)
+                _check(_wait_for(lambda: not watch.drifts()), 'drift of {} not resolved'.format(device.name()))
+        finally:
+            watch.stop()
+    states = [alert['state'] for alert in alerts]
+    _check(states == ['drift', 'resolved', 'drift', 'resolved'], 'unexpected alerts: {}'.format(states))
+
+
+SCENARIOS = {'pool_health': scenario_pool_health,
+             'consistency': scenario_consistency,
+             'restore': scenario_restore,
+             'watch_events': scenario_watch_events}
+
+
+def run(names=None, verbose=True):
+    """
+    Runs scenarios, each in a new temporary directory. Returns
+    {name: None or error message}.
+
+    param: names <list> (optional)
+        scenario names
+        default: all scenarios
+    param: verbose <boolean>
+        Print information to console.
+        default: True
+    """
+    results = {}
+    for name in (names or list(SCENARIOS)):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.time()
+            try:
+                SCENARIOS[name](directory)
+            except Exception as e:
+                results[name] = str(e)
+                if verbose:
+                    traceback.print_exc()
+            else:
+                results[name] = None
+            finally:
+                proxy_pool.set_device_factory()
+        if verbose:
+            print('[{}] {:<20} {:.2f} s {}'.format('OK' if results[name] is None else 'FAILED', name,
+                                                   time.time() - start, results[name] or ''))
+    return results
+
+
+def main(argv=None):
+    """
+    Command line interface.
+    """
+    parser = argparse.ArgumentParser(description='Scenario runs of the P05 motor database on simulated devices.')
+    parser.add_argument('scenarios', nargs='*', help='{}. default: all scenarios'.format(', '.join(SCENARIOS)))
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: {}'.format(name))
+    results = run(args.scenarios)
+    return 1 if any(results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
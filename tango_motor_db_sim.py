@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+
+Simulated ZMX/OMS devices. PyTango is not needed: without it, a stand-in
+module with the exceptions and event types used by the motor database is
+registered as 'tango' while a SimulatedBackend is installed.
+"""
+import asyncio
+import itertools
+import random
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+from tango_proxy_pool import proxy_pool
+
+
+# default parameters of a simulated motor
+ZMX_DEFAULTS = {'AxisName': 'sim',
+                'PreferentialDirection': 0,
+                'RunCurrent': 0.9,
+                'StopCurrent': 0.1,
+                'StepWidth': 8}
+OMS_DEFAULTS = {'Acceleration': 3000,
+                'BaseRate': 20,
+                'Conversion': 1000.,
+                'SettleTime': 0.02,
+                'SlewRate': 20000,
+                'StepBacklash': 0,
+                'UnitLimitMax': 10.,
+                'UnitLimitMin': -10.}
+
+
+class SimulatedDevError():
+    """
+    Stand-in for a tango.DevError, the description of a DevFailed.
+    """
+
+    def __init__(self, reason, desc, origin):
+        self.reason = reason
+        self.desc = desc
+        self.origin = origin
+
+
+class SimulatedDevFailed(Exception):
+    """
+    Stand-in for tango.DevFailed. args are SimulatedDevError.
+    """
+
+
+class _SimulatedExcept():
+    """
+    Stand-in for tango.Except.
+    """
+
+    @staticmethod
+    def throw_exception(reason, desc, origin):
+        raise SimulatedDevFailed(SimulatedDevError(reason, desc, origin))
+
+
+def _tango_stand_in():
+    """
+    Returns a module with the parts of PyTango used by the motor database.
+    """
+    module = types.ModuleType('tango', 'Stand-in for PyTango, see tango_motor_db_sim.')
+    module.DevError = SimulatedDevError
+    module.DevFailed = SimulatedDevFailed
+    module.Except = _SimulatedExcept
+    module.EventType = types.SimpleNamespace(CHANGE_EVENT='change_event')
+    return module
+
+
+try:
+    import tango
+    TANGO_STAND_IN = False
+except ImportError:
+    tango = _tango_stand_in()
+    TANGO_STAND_IN = True
+
+
+class SimulatedReply():
+    """
+    Stand-in for a tango.DeviceAttribute returned by read_attribute(s).
+    """
+
+    def __init__(self, name, value, has_failed=False):
+        self.name = name
+        self.value = value
+        self.has_failed = has_failed
+        self.time = SimulatedTimeVal(time.time())
+
+
+class SimulatedTimeVal():
+    """
+    Stand-in for the tango.TimeVal source timestamp of a DeviceAttribute.
+    """
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+    def totime(self):
+        return self.timestamp
+
+
+class SimulatedEvent():
+    """
+    Stand-in for a tango.EventData passed to event callbacks.
+    """
+
+    def __init__(self, device, attr_name, attr_value=None, errors=()):
+        self.device = device
+        self.attr_name = attr_name
+        self.attr_value = attr_value
+        self.err = bool(errors)
+        self.errors = errors
+
+
+class SimulatedDevice():
+    """
+    In-process stand-in for a ZMX or OMS tango device proxy. Implements the
+    subset of tango.DeviceProxy used by TangoMotorDb and the proxy pool.
+
+    Each request takes latency (+ random jitter) seconds. Requests fail with
+    tango.DevFailed if the device is down, with probability failure_rate or
+    if the latency exceeds the device timeout. Attributes in
+    failing_attributes are returned as failed replies.
+
+    ZMX devices keep an EPROM copy of their attributes which is written by
+    WriteEPROM() and restored by power_cycle().
+
+    If events is set, change events can be subscribed. Like on a real
+    device, the current value is sent on subscription and every write sends
+    an event. Otherwise subscribing fails as for attributes without polling.
+    """
+
+    def __init__(self, device_name, attributes, latency=0., jitter=0., failure_rate=0., eprom=False,
+                 events=False):
+        """
+        param: device_name <str>
+            full device name including tango host
+        param: attributes <dict>
+            initial attribute values
+        param: latency <float> (optional)
+            time in s each request takes
+            default: 0
+        param: jitter <float> (optional)
+            maximum random time in s added to the latency
+            default: 0
+        param: failure_rate <float> (optional)
+            probability of a request to fail
+            default: 0
+        param: eprom <boolean> (optional)
+            whether the device has an EPROM (ZMX)
+            default: False
+        param: events <boolean> (optional)
+            whether change events can be subscribed
+            default: False
+        """
+        self._device_name = device_name
+        self.attributes = dict(attributes)
+        self.eprom = dict(attributes) if eprom else None
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failing_attributes = set()
+        self.down = False
+        self.timeout_millis = 3000
+        self.counters = {'read': 0, 'write': 0, 'eprom': 0}
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._request_ids = itertools.count(1)
+        self.events = events
+        self._subscriptions = {}
+
+    def _fail(self, reason, description):
+        tango.Except.throw_exception(reason, description, 'SimulatedDevice({})'.format(self._device_name))
+
+    def _request_time(self):
+        """
+        Returns the duration of a request or raises DevFailed for injected
+        failures.
+        """
+        if self.down:
+            self._fail('API_CantConnectToDevice', 'Simulated device {} is down'.format(self._device_name))
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._fail('SIM_Failure', 'Simulated failure of {}'.format(self._device_name))
+        return self.latency + (random.uniform(0., self.jitter) if self.jitter else 0.)
+
+    def _wait(self):
+        """
+        Blocks for the duration of a request. Requests which take longer than
+        the device timeout fail after the timeout.
+        """
+        duration = self._request_time()
+        if duration * 1000 > self.timeout_millis:
+            time.sleep(self.timeout_millis / 1000.)
+            self._fail('API_DeviceTimedOut', 'Simulated timeout of {}'.format(self._device_name))
+        time.sleep(duration)
+        return duration
+
+    async def _wait_async(self):
+        """
+        Asyncio variant of _wait().
+        """
+        duration = self._request_time()
+        if duration * 1000 > self.timeout_millis:
+            await asyncio.sleep(self.timeout_millis / 1000.)
+            self._fail('API_DeviceTimedOut', 'Simulated timeout of {}'.format(self._device_name))
+        await asyncio.sleep(duration)
+        return duration
+
+    def _reply(self, attr):
+        if attr not in self.attributes:
+            self._fail('API_AttrNotFound', '{} has no attribute {}'.format(self._device_name, attr))
+        return SimulatedReply(attr, self.attributes[attr], attr in self.failing_attributes)
+
+    def _read(self, attrs):
+        with self._lock:
+            self.counters['read'] += 1
+            return [self._reply(attr) for attr in attrs]
+
+    def _write(self, items):
+        with self._lock:
+            for attr, value in items:
+                if attr not in self.attributes:
+                    self._fail('API_AttrNotFound', '{} has no attribute {}'.format(self._device_name, attr))
+            self.counters['write'] += 1
+            changed = [attr for attr, value in items if self.attributes[attr] != value]
+            for attr, value in items:
+                self.attributes[attr] = value
+        for attr in changed:
+            self.push_event(attr)
+
+    def push_event(self, attr, error=None):
+        """
+        Sends a change event of an attribute to its subscribers. With error,
+        an error event is sent instead, e.g. to simulate a lost connection.
+        """
+        with self._lock:
+            callbacks = [callback for event_attr, callback in self._subscriptions.values()
+                         if event_attr.lower() == attr.lower()]
+            value = self.attributes.get(attr)
+        for callback in callbacks:
+            if error is None:
+                callback(SimulatedEvent(self, attr, SimulatedReply(attr, value)))
+            else:
+                callback(SimulatedEvent(self, attr, errors=(error,)))
+
+    def _write_eprom(self):
+        if self.eprom is None:
+            self._fail('API_CommandNotFound', '{} has no command WriteEPROM'.format(self._device_name))
+        with self._lock:
+            self.counters['eprom'] += 1
+            self.eprom = dict(self.attributes)
+
+    def name(self):
+        return self._device_name
+
+    def ping(self):
+        return int(self._wait() * 1e6)
+
+    def set_timeout_millis(self, timeout):
+        self.timeout_millis = timeout
+
+    def get_timeout_millis(self):
+        return self.timeout_millis
+
+    def read_attribute(self, attr):
+        self._wait()
+        return self._read([attr])[0]
+
+    def read_attributes(self, attrs):
+        self._wait()
+        return self._read(attrs)
+
+    def read_attributes_asynch(self, attrs):
+        """
+        Starts a read request. The reply is ready after the request time.
+        """
+        ready = time.time() + self._request_time()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._requests[request_id] = (list(attrs), ready)
+        return request_id
+
+    def read_attributes_reply(self, request_id, timeout=0):
+        """
+        Waits for the reply of a read request. timeout in ms, 0 waits until
+        the reply is ready or the device timeout is reached.
+        """
+        with self._lock:
+            attrs, ready = self._requests.pop(request_id)
+        wait = ready - time.time()
+        if timeout and wait * 1000 > timeout:
+            time.sleep(timeout / 1000.)
+            self._fail('API_AsynReplyNotArrived', 'Simulated reply of {} not arrived'.format(self._device_name))
+        if wait * 1000 > self.timeout_millis:
+            time.sleep(self.timeout_millis / 1000.)
+            self._fail('API_DeviceTimedOut', 'Simulated timeout of {}'.format(self._device_name))
+        time.sleep(max(wait, 0.))
+        return self._read(attrs)
+
+    def write_attribute(self, attr, value):
+        self._wait()
+        self._write([(attr, value)])
+
+    def write_attributes(self, items):
+        self._wait()
+        self._write(list(items))
+
+    def WriteEPROM(self):
+        self._wait()
+        self._write_eprom()
+
+    def subscribe_event(self, attr, event_type, callback, *args):
+        """
+        Subscribes to change events of an attribute. Returns the event id.
+        """
+        self._wait()
+        if not self.events or event_type != tango.EventType.CHANGE_EVENT:
+            self._fail('API_AttributePollingNotStarted',
+                       'The polling for attribute {} of {} is not started'.format(attr, self._device_name))
+        if attr not in self.attributes:
+            self._fail('API_AttrNotFound', '{} has no attribute {}'.format(self._device_name, attr))
+        with self._lock:
+            event_id = next(self._request_ids)
+            self._subscriptions[event_id] = (attr, callback)
+        self.push_event(attr)
+        return event_id
+
+    def unsubscribe_event(self, event_id):
+        with self._lock:
+            self._subscriptions.pop(event_id, None)
+
+    def power_cycle(self):
+        """
+        Restores the attributes from the EPROM, like after a crate restart.
+        """
+        if self.eprom is None:
+            return
+        with self._lock:
+            changed = [attr for attr, value in self.eprom.items() if self.attributes[attr] != value]
+            self.attributes = dict(self.eprom)
+        for attr in changed:
+            self.push_event(attr)
+
+    def __repr__(self):
+        return 'SimulatedDevice({})'.format(self._device_name)
+
+
+class SimulatedAsyncDevice():
+    """
+    Asyncio variant of a SimulatedDevice (tango.asyncio green mode): request
+    methods are coroutines. Shares the state of the wrapped device.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def name(self):
+        return self.device.name()
+
+    async def ping(self):
+        return int(await self.device._wait_async() * 1e6)
+
+    async def read_attribute(self, attr):
+        await self.device._wait_async()
+        return self.device._read([attr])[0]
+
+    async def read_attributes(self, attrs):
+        await self.device._wait_async()
+        return self.device._read(attrs)
+
+    async def write_attribute(self, attr, value):
+        await self.device._wait_async()
+        self.device._write([(attr, value)])
+
+    async def write_attributes(self, items):
+        await self.device._wait_async()
+        self.device._write(list(items))
+
+    async def WriteEPROM(self):
+        await self.device._wait_async()
+        self.device._write_eprom()
+
+    def __repr__(self):
+        return 'SimulatedAsyncDevice({})'.format(self.device.name())
+
+
+class SimulatedBackend():
+    """
+    Set of simulated ZMX/OMS devices. Once installed, the process wide proxy
+    pool creates simulated devices instead of tango device proxies, so all
+    TangoMotorDb operations run against the simulation:
+
+        backend = SimulatedBackend(latency=0.005)
+        backend.add_crate(TM, 'hzgpp05vme0:10000', range(1, 33))
+        with backend.installed():
+            TM.check_consistency(tango_hosts='all')
+
+    Devices which were not added are reported as not defined, like unknown
+    devices of a real tango database.
+    """
+
+    def __init__(self, latency=0., jitter=0., failure_rate=0., creation_latency=0., events=False):
+        """
+        param: latency <float> (optional)
+            default request time in s of new devices
+        param: jitter <float> (optional)
+            default random time in s added to the latency of new devices
+        param: failure_rate <float> (optional)
+            default failure probability of requests to new devices
+        param: creation_latency <float> (optional)
+            time in s it takes to create a device proxy
+            default: 0
+        param: events <boolean> (optional)
+            whether new devices send change events
+            default: False
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.creation_latency = creation_latency
+        self.events = events
+        self.devices = {}
+
+    @staticmethod
+    def _key(device_name):
+        return device_name.lower()
+
+    def add_device(self, device_name, attributes, eprom=False):
+        """
+        Adds a device and returns it.
+
+        param: device_name <str>
+            full device name including tango host
+        param: attributes <dict>
+            initial attribute values
+        param: eprom <boolean> (optional)
+            whether the device has an EPROM (ZMX)
+            default: False
+        """
+        device = SimulatedDevice(device_name, attributes, self.latency, self.jitter, self.failure_rate, eprom,
+                                 self.events)
+        self.devices[self._key(device_name)] = device
+        return device
+
+    def add_motor(self, zmx_device_name, oms_device_name, zmx=None, oms=None):
+        """
+        Adds the ZMX and OMS device of a motor. Attributes which are not
+        given get default values.
+
+        param: zmx_device_name <str>
+            full ZMX device name including tango host
+        param: oms_device_name <str>
+            full OMS device name including tango host
+        param: zmx <dict> (optional)
+            ZMX attribute values
+        param: oms <dict> (optional)
+            OMS attribute values
+        """
+        self.add_device(zmx_device_name, dict(ZMX_DEFAULTS, **(zmx or {})), eprom=True)
+        self.add_device(oms_device_name, dict(OMS_DEFAULTS, **(oms or {})))
+
+    def add_crate(self, motor_db, tango_host, zmx_slots):
+        """
+        Adds motors with default values for ZMX slots of a tango host. Device
+        names are those used by a TangoMotorDb.
+
+        param: motor_db <TangoMotorDb>
+        param: tango_host <str>
+            e.g. 'hzgpp05vme0:10000'
+        param: zmx_slots <list>
+            slot numbers
+        """
+        for zmx_slot in zmx_slots:
+            zmx_device_name, oms_device_name = motor_db._device_names(zmx_slot, tango_host)
+            self.add_motor(zmx_device_name, oms_device_name, zmx={'AxisName': 'slot{:02d}'.format(zmx_slot)})
+
+    def add_from_database(self, motor_db):
+        """
+        Adds the devices of all motors in the database of a TangoMotorDb,
+        with the values stored in the database.
+
+        param: motor_db <TangoMotorDb>
+        """
+        with motor_db._open_database('r') as db:
+            motors = db.read_motors()
+        for motor in motors.values():
+            self.add_motor(motor['loc']['zmx_device_name'], motor['loc']['oms_device_name'],
+                           motor['zmx'], motor['oms'])
+
+    def device(self, device_name):
+        """
+        Device factory (like tango.DeviceProxy). Returns the simulated device.
+        """
+        time.sleep(self.creation_latency)
+        device = self.devices.get(self._key(device_name))
+        if device is None:
+            tango.Except.throw_exception('DB_DeviceNotDefined', 'Device {} not defined'.format(device_name),
+                                         'SimulatedBackend.device()')
+        if device.down:
+            device._fail('API_CantConnectToDevice', 'Simulated device {} is down'.format(device_name))
+        return device
+
+    async def async_device(self, device_name):
+        """
+        Asyncio device factory (like tango.asyncio.DeviceProxy).
+        """
+        await asyncio.sleep(self.creation_latency)
+        return SimulatedAsyncDevice(self.device(device_name))
+
+    def install(self, pool=None):
+        """
+        Makes the proxy pool create simulated devices. Existing proxies are
+        dropped.
+
+        param: pool <TangoProxyPool> (optional)
+            default: process wide proxy pool
+        """
+        (pool or proxy_pool).set_device_factory(self.device, self.async_device)
+        if TANGO_STAND_IN:
+            # the simulated errors are caught as tango.DevFailed
+            sys.modules.setdefault('tango', tango)
+
+    def uninstall(self, pool=None):
+        """
+        Restores tango device proxies in the proxy pool.
+
+        param: pool <TangoProxyPool> (optional)
+            default: process wide proxy pool
+        """
+        (pool or proxy_pool).set_device_factory()
+        if TANGO_STAND_IN and sys.modules.get('tango') is tango:
+            del sys.modules['tango']
+
+    @contextmanager
+    def installed(self, pool=None):
+        """
+        Context manager for install() / uninstall().
+        """
+        self.install(pool)
+        try:
+            yield self
+        finally:
+            self.uninstall(pool)
+
+    def set_latency(self, latency, jitter=0.):
+        """
+        Sets the request time of all devices.
+        """
+        for device in self.devices.values():
+            device.latency = latency
+            device.jitter = jitter
+
+    def set_failure_rate(self, failure_rate):
+        """
+        Sets the failure probability of all devices.
+        """
+        for device in self.devices.values():
+            device.failure_rate = failure_rate
+
+    def counters(self):
+        """
+        Returns the summed request counters of all devices.
+        """
+        counters = {'read': 0, 'write': 0, 'eprom': 0}
+        for device in self.devices.values():
+            for counter, value in device.counters.items():
+                counters[counter] += value
+        return counters
+
+    def info(self):
+        """
+        Pretty prints all devices.
+        """
+        print('=' * 79)
+        print('{:<50}{:>9}{:>9}{:>9}  {}'.format('Device', 'read', 'write', 'eprom', 'state'))
+        print('-' * 79)
+        for key, device in sorted(self.devices.items()):
+            print('{:<50}{:>9}{:>9}{:>9}  {}'.format(device.name()[-50:], device.counters['read'],
+                                                     device.counters['write'], device.counters['eprom'],
+                                                     'down' if device.down else 'up'))
+        print('=' * 79)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+"""
+import collections
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy
+
+from tango_motor_db import TangoMotorDb, _TableLayout, _error_message
+from tango_proxy_pool import proxy_pool
+
+
+class DriftWatch():
+    """
+    Watches the ZMX/OMS parameters of all motors in the database for changes
+    on the tango servers.
+
+    The database is loaded once into memory. Each device is watched with
+    change events; devices which do not send change events (no polling
+    configured on the server) or whose events fail are read in batches, one
+    read_attributes request per device, every poll_interval seconds. Server
+    values are compared with the database copy using the tolerances of the
+    TangoMotorDb, an alert is raised when a value starts or stops to differ.
+    The database copy is reloaded if the database file changes.
+
+        watch = DriftWatch(TangoMotorDb())
+        watch.run()     # until Ctrl-C
+
+    Alerts are dictionaries with the keys time, state ('drift', 'resolved',
+    'unreachable'), motorgroup, motorname, attribute, database and server.
+    """
+
+    def __init__(self, motor_db=None, tango_hosts='all', poll_interval=10., max_workers=16,
+                 use_events=True, alert=None, max_alerts=10000):
+        """
+        param: motor_db <TangoMotorDb> (optional)
+            database and tolerances
+            default: TangoMotorDb()
+        param: tango_hosts <list> (optional)
+            tango hosts to watch. Use 'all' for all known hosts.
+            default: 'all'
+        param: poll_interval <float> (optional)
+            time in s between reads of devices without change events
+            default: 10
+        param: max_workers <int> (optional)
+            number of devices read or subscribed concurrently
+            default: 16
+        param: use_events <boolean> (optional)
+            Subscribe to change events. Otherwise all devices are polled.
+            default: True
+        param: alert <callable> (optional)
+            called with each alert
+            default: print the alert
+        param: max_alerts <int> (optional)
+            number of alerts kept in alerts
+            default: 10000
+        """
+        self.motor_db = motor_db or TangoMotorDb()
+        if tango_hosts == 'all':
+            tango_hosts = list(self.motor_db._server_prefixes)
+        self.tango_hosts = tango_hosts
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.use_events = use_events
+        self.alert = alert or _print_alert
+        self.alerts = collections.deque(maxlen=max_alerts)
+        self._lock = threading.RLock()
+        self._reference = {}
+        self._devices = {}
+        self._polled = set()
+        self._subscriptions = {}
+        self._live = {}
+        self._drifts = {}
+        self._unreachable = set()
+        self._db_mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def _load_reference(self):
+        """
+        Loads the motors of the watched hosts from the database. Returns
+        {(motorgroup, motorname): motor} and the device map
+        {device name: [(motorgroup, motorname, servertype)]}. Several motor
+        entries can share a device.
+        """
+        self._db_mtime = os.stat(self.motor_db._motor_db_filepath).st_mtime_ns
+        with self.motor_db._open_database('r') as db:
+            motors = db.read_motors()
+        reference = {}
+        devices = {}
+        for key, motor in motors.items():
+            if motor['loc']['zmx_device_name'].split('/')[0] not in self.tango_hosts:
+                continue
+            reference[key] = motor
+            for servertype in ['zmx', 'oms']:
+                devices.setdefault(motor['loc'][servertype + '_device_name'], []).append(key + (servertype,))
+        return reference, devices
+
+    def start(self, verbose=True):
+        """
+        Loads the database, subscribes to change events and starts polling in
+        the background.
+
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='drift_watch')
+        with self._lock:
+            self._reference, self._devices = self._load_reference()
+        self._watch_devices(list(self._devices))
+        self._thread = threading.Thread(target=self._poll_loop, name='drift_watch', daemon=True)
+        self._thread.start()
+        if verbose:
+            print('=' * 79)
+            print('Watching {} motors on {}'.format(len(self._reference), ', '.join(self.tango_hosts)))
+            print('{} devices with change events, {} devices polled every {} s'.format(
+                len(self._subscriptions), len(self._polled), self.poll_interval))
+            print('=' * 79)
+
+    def stop(self):
+        """
+        Unsubscribes all events and stops polling.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            subscriptions = [subscription for device_subscriptions in self._subscriptions.values()
+                             for subscription in device_subscriptions]
+        _unsubscribe(subscriptions)
+        self._subscriptions = {}
+        self._polled = set()
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    def run(self, duration=None, verbose=True):
+        """
+        Watches until interrupted (Ctrl-C) or for a given time.
+
+        param: duration <float> (optional)
+            time in s
+            default: forever
+        param: verbose <boolean>
+            Print information to console.
+            default: True
+        """
+        self.start(verbose)
+        try:
+            self._stop.wait(duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def reload(self):
+        """
+        Reloads the database copy, watches new devices, drops devices of
+        deleted motors and reevaluates all known server values.
+        """
+        reference, devices = self._load_reference()
+        with self._lock:
+            new_devices = [device_name for device_name in devices if device_name not in self._devices]
+            subscriptions = []
+            for device_name in self._devices:
+                if device_name not in devices:
+                    subscriptions += self._subscriptions.pop(device_name, [])
+                    self._polled.discard(device_name)
+                    self._unreachable.discard(device_name)
+                    self._live.pop(device_name, None)
+            self._reference, self._devices = reference, devices
+            for key in list(self._drifts):
+                if key[:2] not in reference:
+                    del self._drifts[key]
+            live = [(device_name, dict(values)) for device_name, values in self._live.items()
+                    if device_name in devices]
+        _unsubscribe(subscriptions)
+        for device_name, values in live:
+            self._update(device_name, values)
+        self._watch_devices(new_devices)
+
+    def _watch_devices(self, device_names):
+        """
+        Subscribes to change events of the devices concurrently. Devices
+        without change events are polled.
+        """
+        if not self.use_events:
+            with self._lock:
+                self._polled.update(device_names)
+            return
+        futures = [(device_name, self._executor.submit(self._subscribe, device_name))
+                   for device_name in device_names]
+        for device_name, future in futures:
+            try:
+                subscriptions = future.result()
+            except Exception:
+                with self._lock:
+                    self._polled.add(device_name)
+                continue
+            with self._lock:
+                self._subscriptions[device_name] = subscriptions
+
+    def _subscribe(self, device_name):
+        """
+        Subscribes to change events of all attributes of a device. Returns
+        [(device, event id)]. Already made subscriptions are undone if one
+        fails.
+        """
+        import tango
+        servertype = self._devices[device_name][0][2]
+        device = proxy_pool.get(device_name)
+        subscriptions = []
+        try:
+            for attr in self.motor_db._motor_cache[servertype]:
+                callback = _EventCallback(self, device_name, attr)
+                subscriptions.append((device, device.subscribe_event(attr, tango.EventType.CHANGE_EVENT, callback)))
+        except Exception:
+            for device, event_id in subscriptions:
+                device.unsubscribe_event(event_id)
+            raise
+        return subscriptions
+
+    def _on_event(self, device_name, attr, event):
+        """
+        Change event callback, runs in the tango event thread.
+        """
+        if event.err:
+            # e.g. lost connection, read the device until events come back
+            with self._lock:
+                if device_name in self._devices:
+                    self._polled.add(device_name)
+            return
+        with self._lock:
+            if device_name in self._subscriptions:
+                self._polled.discard(device_name)
+            self._unreachable.discard(device_name)
+        self._update(device_name, {attr: event.attr_value.value})
+
+    def _poll_loop(self):
+        """
+        Background thread, reads the polled devices every poll_interval.
+        """
+        while not self._stop.is_set():
+            start = time.time()
+            try:
+                if os.stat(self.motor_db._motor_db_filepath).st_mtime_ns != self._db_mtime:
+                    self.reload()
+                self.poll()
+            except Exception as e:
+                print('Error: Drift watch poll failed: {}'.format(_error_message(e)))
+            self._stop.wait(max(self.poll_interval - (time.time() - start), 0.))
+
+    def poll(self):
+        """
+        Reads all polled devices concurrently with one read_attributes request
+        per device and compares the values in one pass.
+        """
+        with self._lock:
+            device_names = sorted(self._polled)
+        futures = [(device_name, self._executor.submit(self._read_device, device_name))
+                   for device_name in device_names]
+        for device_name, future in futures:
+            try:
+                values = future.result()
+            except Exception as e:
+                self._set_unreachable(device_name, _error_message(e))
+                continue
+            with self._lock:
+                self._live[device_name] = dict(values)
+                self._unreachable.discard(device_name)
+        self._compare_all()
+
+    def _read_device(self, device_name):
+        import tango
+        servertype = self._devices[device_name][0][2]
+        attrs = sorted(self.motor_db._motor_cache[servertype])
+        try:
+            replies = proxy_pool.get(device_name).read_attributes(attrs)
+        except tango.DevFailed:
+            proxy_pool.evict(device_name)
+            raise
+        return TangoMotorDb._reply_values(device_name, attrs, replies)
+
+    def _compare_all(self):
+        """
+        Compares all known server values with the database copy at once.
+        """
+        alerts = []
+        with self._lock:
+            reference = {}
+            server = {}
+            for key, motor in self._reference.items():
+                values = {servertype: self._live.get(motor['loc'][servertype + '_device_name'])
+                          for servertype in ['zmx', 'oms']}
+                if all(values[servertype] is not None and len(values[servertype]) == len(motor[servertype])
+                       for servertype in values):
+                    reference[key] = motor
+                    server[key] = values
+            result = self.motor_db._compare_motors(reference, server, subgroups=['zmx', 'oms'])
+            drifts = {(row[0], row[1], row[3]): (row[4], row[5]) for row in result.rows()}
+            for key in reference:
+                for servertype in ['zmx', 'oms']:
+                    for attr in reference[key][servertype]:
+                        drift = drifts.get(key + (attr,))
+                        self._set_drift(key, attr, drift, alerts)
+        self._raise(alerts)
+
+    def _update(self, device_name, values):
+        """
+        Stores new server values of a device and compares them with the
+        database copy.
+        """
+        alerts = []
+        with self._lock:
+            if device_name not in self._devices:
+                return
+            self._live.setdefault(device_name, {}).update(values)
+            tolerances = self.motor_db.diff_tolerances
+            for motorgroup, motorname, servertype in self._devices[device_name]:
+                motor = self._reference[(motorgroup, motorname)]
+                for attr, value in values.items():
+                    db_value = motor[servertype][attr]
+                    if attr in _TableLayout.string_columns:
+                        differs = db_value != value
+                    else:
+                        atol, rtol = tolerances.get(attr, (0., 0.))
+                        differs = not numpy.isclose(float(db_value), float(value), rtol=rtol, atol=atol,
+                                                    equal_nan=True)
+                    self._set_drift((motorgroup, motorname), attr, (db_value, value) if differs else None,
+                                    alerts)
+        self._raise(alerts)
+
+    def _set_drift(self, key, attr, drift, alerts):
+        """
+        Updates the drift state of an attribute and collects an alert in
+        alerts if it changed. drift is (database value, server value) or None.
+        Called with the lock held, the alerts are raised after releasing it.
+        """
+        previous = self._drifts.get(key + (attr,))
+        if drift == previous:
+            return
+        if drift is None:
+            del self._drifts[key + (attr,)]
+            alerts.append(('resolved', key, attr, previous[0], previous[1]))
+        else:
+            self._drifts[key + (attr,)] = drift
+            alerts.append(('drift', key, attr, drift[0], drift[1]))
+
+    def _set_unreachable(self, device_name, error):
+        with self._lock:
+            # the device may have been dropped by reload while it was read
+            if device_name in self._unreachable or device_name not in self._devices:
+                return
+            self._unreachable.add(device_name)
+            keys = [entry[:2] for entry in self._devices[device_name]]
+        self._raise([('unreachable', key, device_name, None, error) for key in keys])
+
+    def _raise(self, alerts):
+        """
+        Stores the alerts and calls the alert handler with each of them. Must
+        not be called with the lock held, the handler may block or call back
+        into the watch.
+        """
+        for state, key, attr, db_value, server_value in alerts:
+            alert = {'time': time.time(), 'state': state, 'motorgroup': key[0], 'motorname': key[1],
+                     'attribute': attr, 'database': db_value, 'server': server_value}
+            self.alerts.append(alert)
+            try:
+                self.alert(alert)
+            except Exception as e:
+                print('Error: Alert handler failed: {}'.format(e))
+
+    def drifts(self):
+        """
+        Returns [motorgroup, motorname, attribute, database value, server
+        value] of all current differences.
+        """
+        with self._lock:
+            return [list(key) + list(drift) for key, drift in sorted(self._drifts.items())]
+
+    def info(self):
+        """
+        Pretty prints the watch state and all current differences.
+        """
+        with self._lock:
+            print('=' * 79)
+            print('Watching {} motors: {} devices with change events, {} polled, {} unreachable'.format(
+                len(self._reference), len(self._subscriptions), len(self._polled), len(self._unreachable)))
+            if self._drifts:
+                print('-' * 79 + '\n')
+                print('{:<30}|{:<20}|{:<20}'.format('Axis name', 'Database value', 'Tango value'))
+                print('-' * 30 + '+' + '-' * 20 + '+' + '-' * 20)
+                for motorgroup, motorname, attr, db_value, value in self.drifts():
+                    ax_name = '({}/{}/{})'.format(motorgroup, motorname, attr)
+                    print('{:<30}|{:<20}|{:<20}'.format(ax_name, str(db_value), str(value)))
+            print('=' * 79)
+
+
+class _EventCallback():
+    """
+    Change event callback of one attribute of a device.
+    """
+
+    def __init__(self, watch, device_name, attr):
+        self._watch = watch
+        self._device_name = device_name
+        self._attr = attr
+
+    def push_event(self, event):
+        self._watch._on_event(self._device_name, self._attr, event)
+
+    def __call__(self, event):
+        self.push_event(event)
+
+
+def _unsubscribe(subscriptions):
+    for device, event_id in subscriptions:
+        try:
+            device.unsubscribe_event(event_id)
+        except Exception:
+            pass
+
+
+def _print_alert(alert):
+    if alert['state'] == 'unreachable':
+        print('[UNREACHABLE] {} {}/{} {}: {}'.format(
+            str(datetime.fromtimestamp(alert['time']))[:19], alert['motorgroup'], alert['motorname'],
+            alert['attribute'], alert['server']))
+        return
+    print('[{}] {} {}/{}/{} database: {} server: {}'.format(
+        alert['state'].upper(), str(datetime.fromtimestamp(alert['time']))[:19], alert['motorgroup'],
+        alert['motorname'], alert['attribute'], alert['database'], alert['server']))
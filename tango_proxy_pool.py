@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+"""
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TangoProxyPool():
+    """
+    Registry of tango device proxies which are shared by all users in the
+    process. Each device is opened only once, keyed by its full device name
+    (e.g. 'hzgpp05vme0:10000/dcm_bragg').
+
+    Proxies can be created in the background (prefetch) or lazily on first
+    use. Creating a DeviceProxy involves a database lookup and a connection
+    setup, which can take seconds if a host is slow or down. Hence all proxy
+    creation runs in a thread pool so that several devices are opened
+    concurrently.
+
+    Proxies of dead devices can be dropped with evict() or check_health().
+
+    Coroutines get asyncio proxies (tango.asyncio green mode) from
+    get_async(). They are bound to an event loop and kept once per device and
+    loop.
+
+    Proxies are created by tango.DeviceProxy unless other device factories
+    are set, e.g. the simulated devices of tango_motor_db_sim. PyTango is
+    only imported when the first proxy is created, users of the pool which
+    never contact a device do not pay for loading it.
+
+    Reads through read() keep track of the device health. A device which
+    fails is not contacted again until a background reconnection attempt
+    succeeded. Meanwhile the last known values are served and marked as
+    stale. Reconnection attempts are spaced with exponential backoff.
+    """
+
+    def __init__(self, max_workers=16, retry_delay=1., max_retry_delay=60.,
+                 connect_timeout=3., device_factory=None, async_device_factory=None):
+        """
+        Initialize pool.
+
+        param: max_workers <int>
+            maximum number of proxies which are created concurrently
+        param: retry_delay <float>
+            delay in s before the first reconnection attempt to a failed
+            device. Doubles with every failed attempt.
+        param: max_retry_delay <float>
+            upper limit of the reconnection delay in s
+        param: connect_timeout <float>
+            time in s read() waits for a proxy which is still being created
+        param: device_factory <callable> (optional)
+            creates a device proxy from a device name
+            default: tango.DeviceProxy
+        param: async_device_factory <callable> (optional)
+            returns an awaitable of an asyncio device proxy
+            default: tango.asyncio.DeviceProxy
+        """
+        self._max_workers = max_workers
+        self._executor = None
+        self._health_executor = None
+        self._futures = {}
+        self._health = {}
+        self._async_futures = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connect_timeout = connect_timeout
+        self.device_factory = device_factory
+        self.async_device_factory = async_device_factory
+
+    @staticmethod
+    def _key(device_name):
+        """
+        Tango device names are case insensitive.
+        """
+        return device_name.lower()
+
+    def _get_executor(self):
+        """
+        Thread pool is only started when needed. Call with lock held.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix='tango_proxy')
+        return self._executor
+
+    def _get_health_executor(self):
+        """
+        Health checks and reconnection attempts wait for proxy creations, so
+        they run in threads of their own. Otherwise they could occupy all
+        threads which create the proxies they wait for. Call with lock held.
+        """
+        if self._health_executor is None:
+            self._health_executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                       thread_name_prefix='tango_proxy_health')
+        return self._health_executor
+
+    def _submit(self, device_name):
+        """
+        Returns the future which creates the device proxy. The creation is
+        only started once per device.
+        """
+        key = self._key(device_name)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                device_factory = self.device_factory
+                if device_factory is None:
+                    import tango
+                    device_factory = tango.DeviceProxy
+                future = self._get_executor().submit(device_factory, device_name)
+                self._futures[key] = future
+        return future
+
+    def prefetch(self, *device_names):
+        """
+        Starts creating device proxies in the background. Returns immediately.
+
+        param: device_names <str>
+            full device names including tango host
+        """
+        for device_name in device_names:
+            self._submit(device_name)
+
+    def get(self, device_name, timeout=None):
+        """
+        Returns the device proxy. Waits if the proxy is still being created.
+        Failed creations are not cached, the next call will try again.
+
+        param: device_name <str>
+            full device name including tango host
+        param: timeout <float> (optional)
+            time in s to wait for the proxy. default: wait forever
+        """
+        future = self._submit(device_name)
+        try:
+            return future.result(timeout)
+        except Exception:
+            if future.done():
+                with self._lock:
+                    if self._futures.get(self._key(device_name)) is future:
+                        del self._futures[self._key(device_name)]
+            raise
+
+    async def get_async(self, device_name):
+        """
+        Returns an asyncio device proxy of the running event loop, whose
+        methods return awaitables. Concurrent callers share one proxy creation.
+        Failed creations are not cached.
+
+        param: device_name <str>
+            full device name including tango host
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        key = self._key(device_name)
+        with self._lock:
+            futures = self._async_futures.setdefault(loop, {})
+            future = futures.get(key)
+            if future is None:
+                async_device_factory = self.async_device_factory
+                if async_device_factory is None:
+                    import tango.asyncio
+                    async_device_factory = tango.asyncio.DeviceProxy
+                future = asyncio.ensure_future(async_device_factory(device_name))
+                futures[key] = future
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            with self._lock:
+                if future.done() and futures.get(key) is future:
+                    del futures[key]
+            raise
+
+    def evict(self, device_name):
+        """
+        Drops the proxy of a device. It is created again on next use. The
+        health state of the device is kept.
+
+        param: device_name <str>
+            full device name including tango host
+        """
+        with self._lock:
+            self._futures.pop(self._key(device_name), None)
+            for futures in self._async_futures.values():
+                futures.pop(self._key(device_name), None)
+
+    def set_device_factory(self, device_factory=None, async_device_factory=None):
+        """
+        Replaces the device factories and drops all proxies and health states.
+        None restores tango.DeviceProxy and tango.asyncio.DeviceProxy.
+
+        param: device_factory <callable> (optional)
+            creates a device proxy from a device name
+        param: async_device_factory <callable> (optional)
+            returns an awaitable of an asyncio device proxy
+        """
+        with self._lock:
+            self.device_factory = device_factory
+            self.async_device_factory = async_device_factory
+            self._futures.clear()
+            self._async_futures.clear()
+            self._health.clear()
+
+    def check_health(self):
+        """
+        Pings all devices of the pool concurrently. Proxies of devices which
+        do not answer are evicted and the devices are marked as failed.
+
+        return: <dict>
+            device name -> True if the device answered
+        """
+        with self._lock:
+            futures = dict(self._futures)
+            executor = self._get_health_executor()
+
+        def ping(future):
+            future.result(self.connect_timeout).ping()
+
+        checks = {key: executor.submit(ping, future) for key, future in futures.items()}
+        alive = {}
+        for key, check in checks.items():
+            try:
+                check.result()
+            except Exception:
+                alive[key] = False
+                self.evict(key)
+                self._mark_failed(self._get_health(key))
+            else:
+                alive[key] = True
+                self._mark_ok(self._get_health(key))
+        return alive
+
+    def lazy(self, device_name):
+        """
+        Returns a placeholder which behaves like the device proxy but creates
+        it only on first attribute access.
+
+        param: device_name <str>
+            full device name including tango host
+        """
+        return LazyDeviceProxy(self, device_name)
+
+    def _get_health(self, device_name):
+        key = self._key(device_name)
+        with self._lock:
+            if key not in self._health:
+                self._health[key] = DeviceHealth()
+            return self._health[key]
+
+    def _mark_ok(self, health):
+        with self._lock:
+            health.state = 'ok'
+            health.failures = 0
+
+    def _mark_failed(self, health):
+        with self._lock:
+            health.failures += 1
+            delay = min(self.retry_delay * 2 ** (health.failures - 1), self.max_retry_delay)
+            health.state = 'failed'
+            health.retry_time = time.time() + delay
+
+    def _schedule_retry(self, device_name, health):
+        """
+        Starts a background reconnection attempt if the backoff delay of a
+        failed device has passed.
+        """
+        with self._lock:
+            if health.state != 'failed' or time.time() < health.retry_time:
+                return
+            health.state = 'retrying'
+            self._get_health_executor().submit(self._reconnect, device_name, health)
+
+    def _reconnect(self, device_name, health):
+        """
+        Reconnection attempt, runs in the health check threads.
+        """
+        try:
+            self.get(device_name, timeout=self.connect_timeout).ping()
+        except Exception:
+            self._mark_failed(health)
+        else:
+            self._mark_ok(health)
+
+    def is_available(self, device_name):
+        """
+        Returns False if the device failed and has not reconnected yet.
+
+        param: device_name <str>
+            full device name including tango host
+        """
+        health = self._get_health(device_name)
+        if health.state != 'ok':
+            self._schedule_retry(device_name, health)
+            return False
+        return True
+
+    def read(self, device_name, attribute, default=None):
+        """
+        Reads an attribute value. If the device is marked as failed, the last
+        known value is returned immediately without contacting the device.
+
+        param: device_name <str>
+            full device name including tango host
+        param: attribute <str>
+            attribute name, e.g. 'Position' or 'State'
+        param: default <all> (optional)
+            returned if no value has ever been read
+            default: None
+        return: (value, stale) <tuple>
+            stale is True if the value is not fresh from the device
+        """
+        value, timestamp, stale = self.read_with_time(device_name, attribute, default)
+        return value, stale
+
+    def read_with_time(self, device_name, attribute, default=None):
+        """
+        Like read(), but also returns the source timestamp of the value, i.e.
+        the time at which the device server read it. Values of devices which
+        do not report a time are stamped with the time of the reply.
+
+        param: device_name <str>
+            full device name including tango host
+        param: attribute <str>
+            attribute name, e.g. 'Position' or 'State'
+        param: default <all> (optional)
+            returned if no value has ever been read
+            default: None
+        return: (value, timestamp, stale) <tuple>
+            timestamp is a unix time, nan if no value has ever been read
+        """
+        health = self._get_health(device_name)
+        if self.is_available(device_name):
+            try:
+                proxy = self.get(device_name, timeout=self.connect_timeout)
+                reply = proxy.read_attribute(attribute)
+            except Exception:
+                self._mark_failed(health)
+            else:
+                source_time = getattr(reply, 'time', None)
+                timestamp = source_time.totime() if hasattr(source_time, 'totime') else time.time()
+                with self._lock:
+                    health.last_values[attribute] = (reply.value, timestamp)
+                return reply.value, timestamp, False
+        with self._lock:
+            value, timestamp = health.last_values.get(attribute, (default, float('nan')))
+        return value, timestamp, True
+
+    def health_info(self):
+        """
+        Pretty prints the health state of all devices read through the pool.
+        """
+        with self._lock:
+            states = sorted((device_name, health.state, health.failures)
+                            for device_name, health in self._health.items())
+        print('=' * 79)
+        print('{:<60}{:<10}{}'.format('Device', 'State', 'Failures'))
+        print('-' * 79)
+        for device_name, state, failures in states:
+            print('{:<60}{:<10}{}'.format(device_name, state, failures))
+        print('=' * 79)
+
+
+class DeviceHealth():
+    """
+    Health state of a single device:
+        'ok'        last request succeeded
+        'failed'    last request failed, wait until retry_time
+        'retrying'  reconnection attempt running in the background
+    """
+
+    def __init__(self):
+        self.state = 'ok'
+        self.failures = 0
+        self.retry_time = 0.
+        # attribute -> (value, source timestamp)
+        self.last_values = {}
+
+
+class LazyDeviceProxy():
+    """
+    Stand-in for a tango.DeviceProxy. Attribute access is forwarded to the
+    proxy from a TangoProxyPool, which is created on first use.
+    """
+
+    def __init__(self, pool, device_name):
+        self._pool = pool
+        self._device_name = device_name
+
+    @property
+    def device_name(self):
+        return self._device_name
+
+    def __getattr__(self, name):
+        return getattr(self._pool.get(self._device_name), name)
+
+    def __repr__(self):
+        return 'LazyDeviceProxy({})'.format(self._device_name)
+
+
+# process wide proxy pool
+proxy_pool = TangoProxyPool()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:00 2026
+
+@author: fwilde
+
+Time conversions shared by the motor database and the QBPM log. Only the
+standard library is imported.
+"""
+from datetime import datetime
+
+
+def to_timestamp(value):
+    """
+    Converts a datetime, a 'YYYY-mm-dd[ HH:MM[:SS]]' string or a unix
+    timestamp to a unix timestamp. None is now.
+    """
+    if value is None:
+        return datetime.now().timestamp()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        for time_format in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+            try:
+                return datetime.strptime(value, time_format).timestamp()
+            except ValueError:
+                pass
+        raise Exception('Error: Unknown time format: {}'.format(value))
+    return float(value)